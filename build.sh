@@ -6,5 +6,8 @@ pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
 python manage.py migrate
+# exists() de MediaStorage sale del índice: lo que se subió por fuera (o antes) tiene que figurar
+python manage.py indexar_media
+python manage.py createcachetable
 python create_admin.py
 
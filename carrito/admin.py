@@ -1,3 +1,18 @@
 from django.contrib import admin
+from .models import CarritoCompra, LineaCarrito
 
-# Register your models here.
+
+class LineaCarritoInline(admin.TabularInline):
+    model = LineaCarrito
+    extra = 0
+    fields = ('producto', 'cantidad', 'precio_unitario', 'subtotal')
+    readonly_fields = fields
+    can_delete = False
+
+
+@admin.register(CarritoCompra)
+class CarritoCompraAdmin(admin.ModelAdmin):
+    list_display = ('id', 'usuario', 'unidades', 'total', 'actualizado_el')
+    search_fields = ('usuario__username', 'usuario__email')
+    readonly_fields = ('total', 'unidades')
+    inlines = [LineaCarritoInline]
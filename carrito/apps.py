@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CarritoConfig(AppConfig):
     name = 'carrito'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registra los receivers)
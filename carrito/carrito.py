@@ -1,62 +1,275 @@
+"""
+Carrito de compras de la tienda online.
+
+Hay dos almacenes con la misma interfaz y se elige con settings.CARRITO_ALMACEN:
+
+- 'sesion' (por defecto): el carrito vive en la sesión como {id: cantidad}.
+- 'db': CarritoCompra/LineaCarrito en la base. La sesión solo guarda el id del
+  carrito del visitante, y el carrito sobrevive al login (se fusiona con el del
+  usuario, ver carrito/signals.py).
+
+En ambos los importes son Decimal (guardados como texto en la sesión) y el total
+y las unidades se actualizan en cada alta/baja, así el context processor no
+recorre las líneas en cada página. Cada línea congela el precio del producto al
+momento de agregarlo.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from gestion_productos.fichas import ficha_de, fichas_de
+from .models import CarritoCompra, LineaCarrito
+
+
+def _id(producto):
+    """Los métodos aceptan el producto o directamente su id."""
+    return int(getattr(producto, 'pk', producto))
+
+
+def _linea(ficha, cantidad, precio):
+    """Línea "expandida" (el formato que leen los templates y guardar_pedido)."""
+    return {
+        "producto_id": ficha["producto_id"],
+        "sku": ficha["sku"],
+        "nombre": ficha["nombre"],
+        "precio": str(precio),
+        "cantidad": cantidad,
+        "imagen": ficha["imagen"],
+        "acumulado": str(precio * cantidad),
+    }
+
+
 class Carrito:
+    """
+    Almacén 'sesion'. La sesión guarda solo {id: cantidad} en "carrito" y el precio
+    congelado de cada línea en "carrito_precios"; nombre, sku e imagen salen de las
+    fichas cacheadas (gestion_productos/fichas.py).
+    """
+
     def __init__(self, request):
         self.request = request
         self.session = request.session
-        carrito = self.session.get("carrito")
-        if not carrito:
-            carrito = self.session["carrito"] = {}
+        # No se escribe la sesión hasta el primer cambio (leer el resumen no la crea)
+        carrito = self.session.get("carrito") or {}
+        precios = self.session.get("carrito_precios") or {}
+        if any(isinstance(v, dict) for v in carrito.values()):
+            # Sesiones con el formato anterior (una ficha completa por línea)
+            precios = {k: str(v["precio"]) for k, v in carrito.items()}
+            carrito = {k: v["cantidad"] for k, v in carrito.items()}
         self.carrito = carrito
+        self.precios = precios
+        resumen = self.session.get("carrito_resumen")
+        if resumen is None:
+            # Sesiones anteriores al resumen: se calcula una única vez
+            resumen = {
+                "total": str(sum((Decimal(precios[k]) * c for k, c in carrito.items()), Decimal(0))),
+                "unidades": sum(carrito.values()),
+            }
+        self.resumen = resumen
+
+    @property
+    def total(self):
+        return Decimal(self.resumen["total"])
+
+    @property
+    def unidades(self):
+        return self.resumen["unidades"]
+
+    def items(self):
+        fichas = fichas_de(self.carrito)
+        return {
+            k: _linea(fichas[int(k)], cantidad, Decimal(self.precios[k]))
+            for k, cantidad in self.carrito.items() if int(k) in fichas
+        }
+
+    def _sumar_al_resumen(self, importe, unidades):
+        self.resumen["total"] = str(self.total + importe)
+        self.resumen["unidades"] += unidades
 
     def agregar(self, producto):
-        id = str(producto.id)
-        if id not in self.carrito.keys():
-            # Obtenemos el precio ejecutando el método con ()
-            precio_valor = producto.precio_actual()
-
-            self.carrito[id] = {
-                "producto_id": producto.id,
-                "sku": producto.sku,
-                "nombre": producto.nombre,
-                "precio": str(precio_valor),  # Agregados ()
-                "cantidad": 1,
-                "imagen": producto.imagen_principal.url if producto.imagen_principal else "",
-                "acumulado": str(precio_valor),  # Agregados ()
-            }
-        else:
-            for key, value in self.carrito.items():
-                if key == str(producto.id):
-                    value["cantidad"] += 1
-                    # Agregados () en producto.precio_actual()
-                    nuevo_acumulado = float(
-                        value["acumulado"]) + float(producto.precio_actual())
-                    value["acumulado"] = str(nuevo_acumulado)
-                    break
+        id = str(_id(producto))
+        if id not in self.carrito:
+            ficha = ficha_de(id)
+            if ficha is None:
+                return
+            self.carrito[id] = 0
+            self.precios[id] = ficha["precio"]
+        self.carrito[id] += 1
+        self._sumar_al_resumen(Decimal(self.precios[id]), 1)
         self.guardar_carrito()
 
     def guardar_carrito(self):
         self.session["carrito"] = self.carrito
+        self.session["carrito_precios"] = self.precios
+        self.session["carrito_resumen"] = self.resumen
         self.session.modified = True
 
     def eliminar(self, producto):
-        producto_id = str(producto.id)
+        producto_id = str(_id(producto))
         if producto_id in self.carrito:
-            del self.carrito[producto_id]
+            cantidad = self.carrito.pop(producto_id)
+            precio = Decimal(self.precios.pop(producto_id))
+            self._sumar_al_resumen(-precio * cantidad, -cantidad)
             self.guardar_carrito()
 
     def restar_producto(self, producto):
-        producto_id = str(producto.id)
-        for key, value in self.carrito.items():
-            if key == producto_id:
-                value["cantidad"] -= 1
-                value["acumulado"] = float(
-                    value["acumulado"]) - float(value["precio"])
-                if value["cantidad"] < 1:
-                    self.eliminar(producto)
-                break
+        producto_id = str(_id(producto))
+        cantidad = self.carrito.get(producto_id)
+        if cantidad is None:
+            return
+        if cantidad <= 1:
+            self.eliminar(producto_id)
+            return
+        self.carrito[producto_id] -= 1
+        self._sumar_al_resumen(-Decimal(self.precios[producto_id]), -1)
         self.guardar_carrito()
 
     def limpiar_carrito(self):
         self.session["carrito"] = {}
+        self.session["carrito_precios"] = {}
+        self.session["carrito_resumen"] = {"total": "0", "unidades": 0}
         self.session.modified = True
 
-    # ... asegúrate de tener también eliminar, restar y limpiar ...
+
+class CarritoDB:
+    """Almacén 'db'."""
+
+    CLAVE_SESION = "carrito_id"
+
+    def __init__(self, request):
+        self.request = request
+        self.session = request.session
+        self._carrito = None
+
+    def _filtro(self):
+        user = self.request.user
+        if user.is_authenticated:
+            return {"usuario": user}
+        carrito_id = self.session.get(self.CLAVE_SESION)
+        return {"pk": carrito_id, "usuario__isnull": True} if carrito_id else None
+
+    def _obtener(self, crear=False):
+        if self._carrito is None:
+            filtro = self._filtro()
+            if filtro is not None:
+                self._carrito = CarritoCompra.objects.filter(**filtro).first()
+            if self._carrito is None and crear:
+                user = self.request.user
+                self._carrito = CarritoCompra.objects.create(usuario=user if user.is_authenticated else None)
+                if not user.is_authenticated:
+                    self.session[self.CLAVE_SESION] = self._carrito.pk
+        return self._carrito
+
+    def _resumen(self):
+        carrito = self._obtener()
+        if carrito is None:
+            return Decimal(0), 0
+        return carrito.total, carrito.unidades
+
+    @property
+    def total(self):
+        return self._resumen()[0]
+
+    @property
+    def unidades(self):
+        return self._resumen()[1]
+
+    def _mover(self, carrito, importe, unidades):
+        """Actualiza el resumen del carrito en la base y en memoria."""
+        CarritoCompra.objects.filter(pk=carrito.pk).update(
+            total=F("total") + importe, unidades=F("unidades") + unidades
+        )
+        carrito.total += importe
+        carrito.unidades += unidades
+
+    def items(self):
+        carrito = self._obtener()
+        if carrito is None:
+            return {}
+        lineas = list(carrito.lineas.order_by("id").values_list("producto_id", "cantidad", "precio_unitario"))
+        fichas = fichas_de(pk for pk, _, _ in lineas)
+        return {
+            str(pk): _linea(fichas[pk], cantidad, precio)
+            for pk, cantidad, precio in lineas if pk in fichas
+        }
+
+    def agregar(self, producto):
+        ficha = ficha_de(_id(producto))
+        if ficha is None:
+            return
+        with transaction.atomic():
+            carrito = self._obtener(crear=True)
+            precio_valor = Decimal(ficha["precio"])
+            linea, creada = LineaCarrito.objects.get_or_create(
+                carrito=carrito, producto_id=ficha["producto_id"],
+                defaults={"cantidad": 1, "precio_unitario": precio_valor, "subtotal": precio_valor},
+            )
+            if not creada:
+                precio_valor = linea.precio_unitario
+                LineaCarrito.objects.filter(pk=linea.pk).update(
+                    cantidad=F("cantidad") + 1, subtotal=F("subtotal") + precio_valor
+                )
+            self._mover(carrito, precio_valor, 1)
+
+    def eliminar(self, producto):
+        carrito = self._obtener()
+        if carrito is None:
+            return
+        with transaction.atomic():
+            linea = LineaCarrito.objects.filter(carrito=carrito, producto_id=_id(producto)).first()
+            if linea:
+                linea.delete()
+                self._mover(carrito, -linea.subtotal, -linea.cantidad)
+
+    def restar_producto(self, producto):
+        carrito = self._obtener()
+        if carrito is None:
+            return
+        with transaction.atomic():
+            linea = LineaCarrito.objects.filter(carrito=carrito, producto_id=_id(producto)).first()
+            if linea is None:
+                return
+            if linea.cantidad <= 1:
+                linea.delete()
+            else:
+                LineaCarrito.objects.filter(pk=linea.pk).update(
+                    cantidad=F("cantidad") - 1, subtotal=F("subtotal") - linea.precio_unitario
+                )
+            self._mover(carrito, -linea.precio_unitario, -1)
+
+    def limpiar_carrito(self):
+        carrito = self._obtener()
+        if carrito is None:
+            return
+        with transaction.atomic():
+            carrito.lineas.all().delete()
+            CarritoCompra.objects.filter(pk=carrito.pk).update(total=0, unidades=0)
+            carrito.total, carrito.unidades = Decimal(0), 0
+
+
+def fusionar_carritos(origen, destino):
+    """Pasa las líneas del carrito anónimo `origen` al del usuario y borra `origen`."""
+    with transaction.atomic():
+        existentes = {linea.producto_id: linea for linea in destino.lineas.all()}
+        for linea in origen.lineas.all():
+            if linea.producto_id in existentes:
+                LineaCarrito.objects.filter(pk=existentes[linea.producto_id].pk).update(
+                    cantidad=F("cantidad") + linea.cantidad, subtotal=F("subtotal") + linea.subtotal
+                )
+            else:
+                linea.carrito = destino
+                linea.save(update_fields=["carrito"])
+        origen.delete()
+        resumen = destino.lineas.aggregate(total=Sum("subtotal"), unidades=Sum("cantidad"))
+        CarritoCompra.objects.filter(pk=destino.pk).update(
+            total=resumen["total"] or 0, unidades=resumen["unidades"] or 0
+        )
+
+
+def obtener_carrito(request):
+    """Carrito del request según settings.CARRITO_ALMACEN ('sesion' o 'db')."""
+    if getattr(settings, "CARRITO_ALMACEN", "sesion") == "db":
+        return CarritoDB(request)
+    return Carrito(request)
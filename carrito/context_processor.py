@@ -1,24 +1,20 @@
-from gestion_sucursales.models import Sucursal
+from django.utils.functional import SimpleLazyObject
+
+from gestion_productos.navegacion import valor_perezoso
+from .carrito import obtener_carrito
 
 def importe_total_carrito(request):
-    total = 0
-    unidades = 0
-    
-    # 1. Lógica del Carrito
-    if "carrito" in request.session:
-        for key, value in request.session["carrito"].items():
-            total += float(value["acumulado"])
-            unidades += value["cantidad"]
-    
-    # 2. Lógica de Sucursales (Global)
-    sucursales = Sucursal.objects.all()
-    cantidad_sucursales = sucursales.count()
+    # 1. Lógica del Carrito: total y unidades ya vienen calculados (ver carrito/carrito.py)
+    carrito = obtener_carrito(request)
     
+    # 2. Lógica de Sucursales (Global, cacheada y perezosa: ver gestion_productos/navegacion.py)
     return {
-        "importe_total_carrito": total,
-        "unidades_totales_carrito": unidades,
+        "importe_total_carrito": carrito.total,
+        "unidades_totales_carrito": carrito.unidades,
+        # Las líneas solo se leen en el detalle del carrito y el checkout
+        "carrito_items": SimpleLazyObject(carrito.items),
         # Agregamos esto para que esté disponible en todo el sitio:
-        "sucursales": sucursales,
-        "cantidad_sucursales": cantidad_sucursales,
-        "sucursal_unica": sucursales.first() if cantidad_sucursales == 1 else None,
-    }
\ No newline at end of file
+        "sucursales": valor_perezoso(request, 'sucursales'),
+        "cantidad_sucursales": valor_perezoso(request, 'cantidad_sucursales'),
+        "sucursal_unica": valor_perezoso(request, 'sucursal_unica'),
+    }
@@ -1,66 +1,43 @@
-from decimal import Decimal
-
-class Carrito:
-    def __init__(self, request):
-        self.request = request
-        self.session = request.session
-        carrito = self.session.get("carrito")
-        if not carrito:
-            carrito = self.session["carrito"] = {}
-        self.carrito = carrito
-
-    def agregar(self, producto):
-        id = str(producto.id)
-        
-        # Obtenemos el precio actual desde la relación 'precios' de tu modelo HistorialPrecio
-        precio_obj = producto.precios.filter(es_actual=True).first()
-        
-        # Si no hay precio marcado como actual, podrías usar un valor por defecto o 0
-        valor_venta = float(precio_obj.precio_venta) if precio_obj else 0.0
-
-        if id not in self.carrito:
-            self.carrito[id] = {
-                "producto_id": producto.id,
-                "nombre": producto.nombre,
-                "sku": producto.sku,
-                "precio": valor_venta, 
-                "cantidad": 1,
-                "acumulado": valor_venta,
-                "imagen": producto.imagen_principal.url if producto.imagen_principal else ""
-            }
-        else:
-            self.carrito[id]["cantidad"] += 1
-            self.carrito[id]["acumulado"] += valor_venta
-        
-        self.guardar_carrito()
-
-    def guardar_carrito(self):
-        self.session["carrito"] = self.carrito
-        self.session.modified = True
-
-    def eliminar(self, producto):
-        id = str(producto.id)
-        if id in self.carrito:
-            del self.carrito[id]
-            self.guardar_carrito()
-
-    def restar(self, producto):
-        id = str(producto.id)
-        if id in self.carrito:
-            # Buscamos el precio para restar correctamente el acumulado
-            precio_obj = producto.precios.filter(es_actual=True).first()
-            valor_venta = float(precio_obj.precio_venta) if precio_obj else 0.0
-            
-            self.carrito[id]["cantidad"] -= 1
-            self.carrito[id]["acumulado"] -= valor_venta
-            
-            if self.carrito[id]["cantidad"] <= 0:
-                self.eliminar(producto)
-            else:
-                self.guardar_carrito()
-
-    def limpiar(self):
-        self.session["carrito"] = {}
-        self.session.modified = True
-
-# Create your models here.
+from django.conf import settings
+from django.db import models
+
+
+class CarritoCompra(models.Model):
+    """
+    Carrito guardado en la base (almacén 'db', ver carrito/carrito.py).
+    Los visitantes se identifican por el id guardado en la sesión; al iniciar
+    sesión el carrito pasa al usuario. `total` y `unidades` se mantienen al día
+    en cada alta/baja para que el resumen del header sea una sola lectura.
+    """
+    usuario = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='carrito_compra'
+    )
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    creado_el = models.DateTimeField(auto_now_add=True)
+    actualizado_el = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Carrito"
+        verbose_name_plural = "Carritos"
+
+    def __str__(self):
+        duenio = self.usuario.username if self.usuario_id else "anónimo"
+        return f"Carrito #{self.pk} ({duenio}): {self.unidades} u. ${self.total}"
+
+
+class LineaCarrito(models.Model):
+    carrito = models.ForeignKey(CarritoCompra, on_delete=models.CASCADE, related_name='lineas')
+    producto = models.ForeignKey('gestion_productos.Producto', on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField(default=1)
+    # Precio congelado al agregar el producto: sumar o restar unidades no cambia el precio
+    precio_unitario = models.DecimalField(max_digits=12, decimal_places=2)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        unique_together = ('carrito', 'producto')
+        verbose_name = "Línea de carrito"
+        verbose_name_plural = "Líneas de carrito"
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto.nombre}"
@@ -0,0 +1,22 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .carrito import CarritoDB, fusionar_carritos
+from .models import CarritoCompra
+
+
+@receiver(user_logged_in)
+def pasar_carrito_al_usuario(sender, request, user, **kwargs):
+    """Almacén 'db': el carrito armado como visitante pasa a ser (o se suma al) del usuario."""
+    if request is None or not hasattr(request, 'session'):
+        return
+    carrito_id = request.session.pop(CarritoDB.CLAVE_SESION, None)
+    anonimo = CarritoCompra.objects.filter(pk=carrito_id, usuario__isnull=True).first() if carrito_id else None
+    if anonimo is None:
+        return
+    propio = CarritoCompra.objects.filter(usuario=user).first()
+    if propio is None:
+        anonimo.usuario = user
+        anonimo.save(update_fields=['usuario', 'actualizado_el'])
+    else:
+        fusionar_carritos(anonimo, propio)
@@ -1,3 +1,73 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from gestion_productos.models import Categoria, Marca, Producto
+from .models import CarritoCompra
+
+
+class CarritoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Almacén")
+        marca = Marca.objects.create(nombre="Natura")
+        cls.productos = [
+            Producto.objects.create(nombre=f"Producto {i}", categoria=categoria, marca=marca, precio_venta_actual=precio,
+                                    descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+            for i, precio in enumerate([Decimal('0.10'), Decimal('0.20')])
+        ]
+
+    def agregar(self, producto, veces=1):
+        for _ in range(veces):
+            self.client.get(reverse('agregar', args=[producto.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def resumen(self):
+        respuesta = self.client.get(reverse('carrito_detalle'))
+        return respuesta.context['importe_total_carrito'], respuesta.context['unidades_totales_carrito']
+
+    def test_totales_exactos_en_sesion(self):
+        a, b = self.productos
+        self.agregar(a, 3)
+        self.agregar(b)
+        # Con float daría 0.5000000000000001
+        self.assertEqual(self.resumen(), (Decimal('0.50'), 4))
+        self.client.get(reverse('restar', args=[a.id]))
+        self.client.get(reverse('eliminar', args=[b.id]))
+        self.assertEqual(self.resumen(), (Decimal('0.20'), 2))
+
+    def test_precio_congelado_al_agregar(self):
+        a = self.productos[0]
+        self.agregar(a)
+        Producto.objects.filter(pk=a.pk).update(precio_venta_actual=Decimal('5'))
+        self.agregar(a)
+        self.assertEqual(self.resumen(), (Decimal('0.20'), 2))
+
+    def test_sesion_guarda_solo_cantidades(self):
+        a, b = self.productos
+        self.agregar(a, 2)
+        self.agregar(b)
+        self.assertEqual(self.client.session['carrito'], {str(a.id): 2, str(b.id): 1})
+        items = self.client.get(reverse('carrito_detalle')).context['carrito_items']
+        self.assertEqual(items[str(a.id)]['nombre'], a.nombre)
+        self.assertEqual(items[str(a.id)]['acumulado'], '0.20')
+
+    @override_settings(CARRITO_ALMACEN='db')
+    def test_almacen_db_sobrevive_al_login(self):
+        a, b = self.productos
+        usuario = get_user_model().objects.create_user('cliente', password='clave123')
+        # Un carrito previo del usuario se suma al del visitante
+        previo = CarritoCompra.objects.create(usuario=usuario)
+        previo.lineas.create(producto=b, cantidad=1, precio_unitario=b.precio_venta_actual, subtotal=b.precio_venta_actual)
+
+        self.agregar(a, 2)
+        self.agregar(b)
+        self.assertEqual(self.resumen(), (Decimal('0.40'), 3))
+
+        self.client.login(username='cliente', password='clave123')
+        self.assertEqual(self.resumen(), (Decimal('0.60'), 4))
+        self.assertEqual(CarritoCompra.objects.count(), 1)
+
+        self.client.get(reverse('limpiar'))
+        self.assertEqual(self.resumen(), (Decimal('0'), 0))
@@ -1,44 +1,41 @@
-from django.shortcuts import redirect, get_object_or_404, render
-from django.http import JsonResponse
-from .carrito import Carrito
-from gestion_productos.models import Producto
+from django.shortcuts import redirect, render
+from django.http import JsonResponse, Http404
+from .carrito import obtener_carrito
+from gestion_productos.fichas import ficha_de
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
 from gestion_sucursales.models import Sucursal
 
 def agregar_producto(request, producto_id):
-    carrito = Carrito(request)
-    producto = get_object_or_404(Producto, id=producto_id)
-    carrito.agregar(producto=producto)
+    # La ficha cacheada alcanza para validar el producto y tomar su precio
+    if ficha_de(producto_id) is None:
+        raise Http404("Producto no encontrado")
+    carrito = obtener_carrito(request)
+    carrito.agregar(producto=producto_id)
 
     # Si la petición es AJAX (XMLHttpRequest)
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        # Calculamos el total de items en el carrito
-        # Asegúrate de que tu clase Carrito tenga una forma de darte el total
-        total_items = sum(item['cantidad'] for item in request.session.get('carrito', {}).values())
-        
+        # El carrito ya lleva la cuenta de unidades: no hace falta recorrerlo
         return JsonResponse({
             'status': 'success', 
-            'unidades_totales': total_items
+            'unidades_totales': carrito.unidades
         })
 
     # Si es una petición normal (sin AJAX), redirigimos como antes
     return redirect(request.META.get('HTTP_REFERER', 'home'))
 
 def eliminar_producto(request, producto_id):
-    carrito = Carrito(request)
-    producto = get_object_or_404(Producto, id=producto_id)
-    carrito.eliminar(producto=producto) # Asegúrate de tener este método en carrito.py
+    carrito = obtener_carrito(request)
+    carrito.eliminar(producto=producto_id) # Asegúrate de tener este método en carrito.py
     return redirect("carrito_detalle")
 
 def restar_producto(request, producto_id):
-    carrito = Carrito(request)
-    producto = get_object_or_404(Producto, id=producto_id)
-    carrito.restar_producto(producto=producto) # Asegúrate de tener este método en carrito.py
+    carrito = obtener_carrito(request)
+    carrito.restar_producto(producto=producto_id) # Asegúrate de tener este método en carrito.py
     return redirect("carrito_detalle")
 
 def limpiar_carrito(request):
-    carrito = Carrito(request)
+    carrito = obtener_carrito(request)
     carrito.limpiar_carrito() # Asegúrate de tener este método en carrito.py
     return redirect("home")
 
@@ -46,8 +43,7 @@ def carrito_detalle(request):
     return render(request, 'carrito_detalle.html')
 
 def checkout(request):
-    carrito = request.session.get("carrito", {})
-    if not carrito:
+    if not obtener_carrito(request).unidades:
         return redirect("home")  # No hay nada que comprar, volvemos al inicio
     
     # Aquí podrías procesar un formulario de envío más adelante
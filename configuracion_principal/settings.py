@@ -104,6 +104,52 @@ DATABASES = {
 }
 
 
+# Caché compartida entre workers de gunicorn (versiones de catálogo, índices en memoria, etc.)
+# Por defecto usa la base de datos (requiere `python manage.py createcachetable`);
+# con CACHE_BACKEND=django.core.cache.backends.redis.RedisCache y CACHE_LOCATION=redis://... usa Redis.
+# En producción conviene Redis: con la caché en base cada lectura (también los aciertos)
+# es una consulta y cada escritura hace un COUNT de la tabla.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='cache_table'),
+        # Lo que se guarda sin duración explícita; los fragmentos del catálogo pasan la suya
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+    }
+}
+if 'redis' not in CACHES['default']['BACKEND'].lower():
+    # Las fichas, tarjetas, páginas, facetas y rutas de categoría suman miles de claves:
+    # con el máximo por defecto (300) la caché en base se vaciaría un tercio en cada escritura.
+    # (Redis no acepta esta opción: expulsa según su propia maxmemory-policy.)
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=50000, cast=int)}
+
+# Sesiones: con una caché en memoria (Redis) se leen de la caché y la base solo recibe
+# la escritura (cached_db). Con la caché en base (por defecto) no se ganaría nada y
+# se sigue usando backends.db. Se puede forzar con SESSION_ENGINE.
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.cached_db' if 'redis' in CACHES['default']['BACKEND'].lower()
+    else 'django.contrib.sessions.backends.db',
+)
+
+# Caché de página completa (con ETag/304) para las páginas públicas del catálogo
+# que ven los visitantes anónimos. Ver gestion_productos/cache_paginas.py.
+CACHE_PAGINAS = config('CACHE_PAGINAS', default=True, cast=bool)
+
+# Dónde se guarda el carrito de la tienda: 'sesion' (por defecto) o 'db'
+# (CarritoCompra/LineaCarrito, sobrevive al login). Ver carrito/carrito.py.
+CARRITO_ALMACEN = config('CARRITO_ALMACEN', default='sesion')
+
+# Variantes WebP de las imágenes de producto (gestion_productos/imagenes.py):
+# procesos para Pillow e hilos para leer/subir al storage
+IMAGENES_PROCESOS = config('IMAGENES_PROCESOS', default=2, cast=int)
+IMAGENES_HILOS = config('IMAGENES_HILOS', default=8, cast=int)
+
+# Con más categorías que esto, los formularios de productos usan el buscador AJAX
+# en lugar de un <select> con todas (gestion_productos/forms.py: CategoriaChoiceField)
+CATEGORIAS_MAX_SELECT = config('CATEGORIAS_MAX_SELECT', default=500, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
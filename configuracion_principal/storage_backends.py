@@ -1,20 +1,104 @@
+import hashlib
 import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from storages.backends.s3boto3 import S3Boto3Storage
 
 logger = logging.getLogger(__name__)
 
+TROZO = 64 * 1024
+# Lo que vive ahí se borra pronto: nunca es el destino de una deduplicación
+CARPETAS_TEMPORALES = ('temp_batch/', 'importaciones/')
 
-class MediaStorage(S3Boto3Storage):
-    location = 'media'
-    file_overwrite = True  # Skip exists() check entirely — avoids HeadObject 403
+
+class IndiceMediaMixin:
+    """
+    Índice local de los archivos subidos (gestion_productos.ArchivoMedia: nombre,
+    tamaño, MD5, ETag y cuántos guardados lo usan) delante de un storage remoto.
+
+    - exists() y size() se responden desde el índice, sin HeadObject.
+    - save() calcula el MD5 mientras lee el archivo: si el mismo contenido ya está
+      subido devuelve ese nombre y no hace el PUT (dos productos con la misma
+      foto, la misma variante regenerada, reintentos de una carga masiva).
+    - delete() descuenta un uso y solo borra el objeto cuando nadie más lo usa.
+
+    Un archivo subido antes del índice (o por fuera) no figura y exists() daría
+    False: con file_overwrite=False se pisaría. Por eso build.sh corre indexar_media
+    en cada deploy, después de migrate y antes de que el código nuevo atienda.
+
+    save() puede correr en los hilos de imagenes._mapa: cada hilo cierra su conexión
+    al terminar, y lo que escribe acá queda fuera de la transacción del request.
+
+    Para que los usos cuadren, todo alta y baja de media tiene que pasar por el storage.
+    """
+
+    @staticmethod
+    def _modelo():
+        from gestion_productos.models import ArchivoMedia
+        return ArchivoMedia
+
+    @staticmethod
+    def _huella(content):
+        """(md5, tamaño) leyendo por trozos; deja el archivo al principio para subirlo."""
+        md5, tamano = hashlib.md5(usedforsecurity=False), 0
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for trozo in content.chunks(TROZO) if hasattr(content, 'chunks') else iter(lambda: content.read(TROZO), b''):
+            md5.update(trozo)
+            tamano += len(trozo)
+        content.seek(0)
+        return md5.hexdigest(), tamano
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            from django.core.files import File
+            content = File(content, name)
+
+        huella, tamano = self._huella(content)
+        ArchivoMedia = self._modelo()
+        existente = ArchivoMedia.objects.filter(hash=huella, tamano=tamano).values_list('pk', 'nombre').first()
+        if existente and ArchivoMedia.objects.filter(pk=existente[0]).update(usos=F('usos') + 1):
+            logger.debug(f"[Media] {name}: mismo contenido que {existente[1]}, no se vuelve a subir")
+            return existente[1]
+
+        nombre = super().save(name, content, max_length=max_length)
+        # En una subida de una sola parte el ETag de S3 es el MD5 del contenido
+        ArchivoMedia.objects.update_or_create(nombre=nombre, defaults={
+            'tamano': tamano, 'etag': huella, 'usos': 1,
+            'hash': '' if nombre.startswith(CARPETAS_TEMPORALES) else huella,
+        })
+        return nombre
 
     def exists(self, name):
-        """
-        Override exists() to avoid HeadObject calls that Supabase S3 rejects with 403.
-        Django uses this to check if a file already exists before saving.
-        Returning False means it will always proceed to upload.
-        """
-        return False
+        return self._modelo().objects.filter(nombre=name).exists()
+
+    def size(self, name):
+        tamano = self._modelo().objects.filter(nombre=name).values_list('tamano', flat=True).first()
+        return tamano if tamano is not None else super().size(name)
+
+    def delete(self, name):
+        ArchivoMedia = self._modelo()
+        with transaction.atomic():
+            # Otro guardado usa el mismo archivo: solo se descuenta
+            if ArchivoMedia.objects.filter(nombre=name, usos__gt=1).update(usos=F('usos') - 1):
+                return
+            ArchivoMedia.objects.filter(nombre=name).delete()
+        super().delete(name)
+
+
+class MediaStorage(IndiceMediaMixin, S3Boto3Storage):
+    location = 'media'
+    # exists() sale del índice (sin HeadObject, que Supabase S3 rechaza con 403), así que
+    # un nombre ocupado con otro contenido recibe un sufijo en vez de pisar el archivo
+    file_overwrite = False
+
+    def __init__(self, **settings_overrides):
+        super().__init__(**settings_overrides)
+        self._prefijo_url = f"{settings.MEDIA_URL}{self.location}/"
 
     def _save(self, name, content):
         """Override to add logging for debugging upload issues."""
@@ -34,5 +118,4 @@ class MediaStorage(S3Boto3Storage):
         File in bucket: productos/media/productos/fotos/file.jpg
         Public URL: https://<ref>.supabase.co/storage/v1/object/public/productos/media/productos/fotos/file.jpg
         """
-        from django.conf import settings
-        return f"{settings.MEDIA_URL}{self.location}/{name}"
+        return self._prefijo_url + name
@@ -0,0 +1,295 @@
+"""
+Presupuestos de consultas y latencia para las vistas principales.
+
+`sembrar_catalogo()` arma un catálogo realista (árbol de categorías profundo,
+miles de productos con historial de precios, varias sucursales con stock y
+pedidos) y `medir_vistas()` recorre los ESCENARIOS con el test Client midiendo
+la cantidad de consultas y los percentiles de tiempo de cada vista.
+
+Lo usan el comando `presupuesto_vistas` (reporte JSON comparable entre commits)
+y los tests de gestion_interna (con un catálogo chico).
+
+`medir_escrituras()` hace lo mismo con los "+1" de los carritos en sesión: clics
+por segundo, consultas y escrituras a django_session por clic y tamaño de la sesión
+(comando `escrituras_carrito`).
+
+`medir_deteccion_marcas()` compara, en memoria, la búsqueda de marca de la carga
+masiva recorriendo todas las marcas contra el autómata de gestion_productos/marcas.py
+(comando `deteccion_marcas`).
+"""
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from gestion_pedidos.models import Pedido, ItemPedido
+from gestion_productos.marcas import DetectorMarcas
+from gestion_productos.models import Categoria, Marca, Producto, HistorialPrecio
+from gestion_productos.search import normalizar_texto
+from gestion_sucursales.models import Sucursal, Stock
+from gestion_usuarios.models import Usuario
+
+PALABRAS = [
+    'aceite', 'girasol', 'arroz', 'fideos', 'azúcar', 'café', 'yerba', 'leche', 'yogur', 'queso',
+    'jabón', 'shampoo', 'lavandina', 'gaseosa', 'cerveza', 'vino', 'agua', 'harina', 'atún', 'mayonesa',
+]
+
+# Presupuesto de consultas por vista con la navegación ya cacheada.
+# Tienen que ser constantes: no pueden crecer con el tamaño del catálogo.
+ESCENARIOS = [
+    {'nombre': 'home', 'url': lambda c: '/', 'usuario': None, 'consultas': 1},
+    {'nombre': 'home_busqueda', 'url': lambda c: '/?q=aceite', 'usuario': None, 'consultas': 1},
+    {'nombre': 'categoria', 'url': lambda c: f"/categoria/{c['categoria_slug']}/", 'usuario': None, 'consultas': 3},
+    {'nombre': 'categoria_filtrada', 'url': lambda c: f"/categoria/{c['categoria_slug']}/?orden=menor_precio&subcategoria={c['subcategoria_slug']}", 'usuario': None, 'consultas': 4},
+    {'nombre': 'ofertas', 'url': lambda c: '/ofertas/', 'usuario': None, 'consultas': 2},
+    {'nombre': 'ahorrames', 'url': lambda c: '/ahorrames/', 'usuario': None, 'consultas': 2},
+    {'nombre': 'detalle_producto', 'url': lambda c: f"/producto/{c['producto_slug']}/", 'usuario': None, 'consultas': 4},
+    {'nombre': 'buscar_header_ajax', 'url': lambda c: '/ventas/buscar/?q=acei', 'usuario': None, 'consultas': 0},
+    {'nombre': 'buscar_categorias_ajax', 'url': lambda c: '/gestion-productos/buscar-ajax/?tipo=categoria&q=cat', 'usuario': 'admin', 'consultas': 2},
+    {'nombre': 'buscar_gestion_ajax', 'url': lambda c: '/gestion-productos/buscar-gestion-ajax/?q=aceite', 'usuario': 'admin', 'consultas': 4},
+    {'nombre': 'grilla_gestion', 'url': lambda c: '/gestion-productos/buscar-gestion-ajax/?orden=-stock', 'usuario': 'admin', 'consultas': 4},
+    {'nombre': 'buscar_transferencia_ajax', 'url': lambda c: '/gestion/buscar-productos-transf/?q=aceite', 'usuario': 'admin', 'consultas': 5},
+    {'nombre': 'panel_caja', 'url': lambda c: '/ventas/caja/', 'usuario': 'cajera', 'consultas': 6},
+    {'nombre': 'dashboard_principal', 'url': lambda c: '/gestion/', 'usuario': 'admin', 'consultas': 12},
+]
+
+
+# Endpoints de "+1": cada clic reescribe la sesión
+ESCENARIOS_ESCRITURA = [
+    {'nombre': 'agregar_producto', 'url': lambda pk: f'/carrito/agregar/{pk}/', 'usuario': None},
+    {'nombre': 'agregar_ajax', 'url': lambda pk: f'/ventas/agregar-ajax/{pk}/', 'usuario': 'admin'},
+    {'nombre': 'agregar_item_transferencia', 'url': lambda pk: f'/gestion/agregar-item-transf/{pk}/', 'usuario': 'admin'},
+]
+
+
+def sembrar_catalogo(productos=3000, sucursales=4, ramas=6, profundidad=3, precios_por_producto=3, semilla=42, prefijo='bench'):
+    """
+    Crea el catálogo sintético. Devuelve el contexto que necesitan los escenarios.
+    `prefijo` permite sembrar más de una vez en la misma base sin chocar con campos únicos.
+    """
+    random.seed(semilla)
+
+    lista_sucursales = [
+        Sucursal.objects.create(nombre=f"Sucursal {prefijo} {i}", direccion=f"Calle {i}", ciudad="Córdoba")
+        for i in range(sucursales)
+    ]
+    marcas = [Marca.objects.create(nombre=f"Marca {prefijo} {i}") for i in range(max(10, productos // 50))]
+
+    # Árbol de categorías: `ramas` raíces, cada nivel con `ramas` hijos hasta `profundidad`
+    nivel = [Categoria.objects.create(nombre=f"Cat {prefijo} {i}", slug=f"{prefijo}-cat-{i}") for i in range(ramas)]
+    raices = list(nivel)
+    for _ in range(1, profundidad):
+        siguiente = []
+        for padre in nivel:
+            for i in range(3):
+                siguiente.append(Categoria.objects.create(nombre=f"{padre.nombre}.{i}", slug=f"{padre.slug}-{i}", padre=padre))
+        nivel = siguiente
+    hojas = nivel
+
+    nuevos = []
+    for i in range(productos):
+        nombre = f"{' '.join(random.sample(PALABRAS, 2)).title()} {i}"
+        precio = Decimal(random.randint(100, 20000))
+        regular = precio if random.random() > 0.3 else precio * Decimal('1.25')
+        p = Producto(
+            nombre=nombre, slug=f"{prefijo}-producto-{i}", sku=f"{prefijo}{i + 1:08d}", codigo_barras=f"779{i:010d}",
+            categoria=random.choice(hojas), marca=random.choice(marcas), descripcion_breve=nombre,
+            imagen_principal='productos/fotos/demo.jpg',
+            es_oferta=random.random() < 0.2, ahorrames=random.random() < 0.1,
+            es_sin_tacc=random.random() < 0.15, es_vegano=random.random() < 0.05, es_vegetariano=random.random() < 0.1,
+            precio_venta_actual=precio, precio_regular_actual=regular,
+            descuento_actual=Producto.calcular_descuento(precio, regular),
+        )
+        p.texto_busqueda = normalizar_texto(f"{nombre} {p.sku} {p.codigo_barras}")
+        nuevos.append(p)
+    creados = Producto.objects.bulk_create(nuevos, batch_size=1000)
+
+    historial, stocks = [], []
+    for p in creados:
+        for k in range(precios_por_producto):
+            actual = k == precios_por_producto - 1
+            historial.append(HistorialPrecio(
+                producto=p, es_actual=actual,
+                precio_venta=p.precio_venta_actual if actual else p.precio_venta_actual * Decimal('0.9'),
+                precio_regular=p.precio_regular_actual,
+            ))
+        for s in lista_sucursales:
+            stocks.append(Stock(producto=p, sucursal=s, cantidad=random.randint(0, 200)))
+    HistorialPrecio.objects.bulk_create(historial, batch_size=2000)
+    Stock.objects.bulk_create(stocks, batch_size=2000)
+
+    sucursal = lista_sucursales[0]
+    admin = Usuario.objects.create_user(username=f'{prefijo}_admin', email=f'{prefijo}_admin@example.com', password='x', rol='SA', sucursal=sucursal)
+    cajera = Usuario.objects.create_user(username=f'{prefijo}_cajera', email=f'{prefijo}_cajera@example.com', password='x', rol='CA', sucursal=sucursal)
+    for i in range(20):
+        pedido = Pedido.objects.create(cliente=f"Cliente {i}", telefono="000", sucursal=sucursal, modalidad='RETIRO',
+                                       total=Decimal('1000'), canal='MOS' if i % 2 else 'WEB')
+        producto = random.choice(creados)
+        ItemPedido.objects.create(pedido=pedido, producto=producto, producto_nombre=producto.nombre, sku=producto.sku, cantidad=1,
+                                  precio_unitario=Decimal('1000'), subtotal=Decimal('1000'))
+
+    raiz = raices[0]
+    return {
+        'categoria_slug': raiz.slug,
+        'subcategoria_slug': f"{raiz.slug}-0",
+        'producto_slug': creados[len(creados) // 2].slug,
+        'producto_ids': [p.pk for p in creados[:50]],
+        'usuarios': {'admin': admin, 'cajera': cajera},
+    }
+
+
+def medir_vistas(contexto, repeticiones=10, escenarios=None, cache_paginas=False):
+    """
+    Corre cada escenario: 1 request de calentamiento y `repeticiones` medidos.
+    Por defecto sin la caché de página completa, para medir lo que cuesta la vista.
+    """
+    with override_settings(CACHE_PAGINAS=cache_paginas):
+        return _medir_vistas(contexto, repeticiones, escenarios)
+
+
+def _medir_vistas(contexto, repeticiones, escenarios):
+    reporte = {}
+    for escenario in escenarios or ESCENARIOS:
+        cliente = Client()
+        if escenario['usuario']:
+            cliente.force_login(contexto['usuarios'][escenario['usuario']])
+        url = escenario['url'](contexto)
+
+        cliente.get(url)  # calienta caches (navegación, índice de sugerencias)
+        tiempos = []
+        consultas = None
+        consultas_cache = 0
+        estado = None
+        for _ in range(repeticiones):
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                respuesta = cliente.get(url)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            # Las lecturas de la caché en base (DatabaseCache) se informan aparte
+            de_cache = sum(1 for q in capturadas.captured_queries if 'cache_table' in q['sql'])
+            consultas = max(consultas or 0, len(capturadas) - de_cache)
+            consultas_cache = max(consultas_cache, de_cache)
+            estado = respuesta.status_code
+
+        tiempos.sort()
+        reporte[escenario['nombre']] = {
+            'url': url,
+            'status': estado,
+            'consultas': consultas,
+            'presupuesto_consultas': escenario['consultas'],
+            'consultas_cache': consultas_cache,
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'p95_ms': round(tiempos[max(0, int(len(tiempos) * 0.95) - 1)], 2),
+            'max_ms': round(tiempos[-1], 2),
+        }
+    return reporte
+
+
+def excedidos(reporte):
+    """Escenarios que superan su presupuesto de consultas o no respondieron 200."""
+    return {
+        nombre: datos for nombre, datos in reporte.items()
+        if datos['consultas'] > datos['presupuesto_consultas'] or datos['status'] != 200
+    }
+
+
+def medir_escrituras(contexto, clics=200, lineas=20, escenarios=None):
+    """
+    Hace `clics` "+1" repartidos entre `lineas` productos distintos en cada endpoint
+    (una sesión nueva por escenario) y mide el costo de cada clic.
+    """
+    reporte = {}
+    ids = contexto['producto_ids'][:lineas]
+    for escenario in escenarios or ESCENARIOS_ESCRITURA:
+        cliente = Client()
+        if escenario['usuario']:
+            cliente.force_login(contexto['usuarios'][escenario['usuario']])
+        cliente.get(escenario['url'](ids[0]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')  # calienta caches
+
+        consultas = escrituras_sesion = 0
+        estado = None
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            for i in range(clics):
+                respuesta = cliente.get(escenario['url'](ids[i % len(ids)]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                estado = respuesta.status_code
+            duracion = time.perf_counter() - inicio
+        for q in capturadas.captured_queries:
+            sql = q['sql']
+            if 'cache_table' in sql:
+                continue
+            consultas += 1
+            if 'django_session' in sql and sql.startswith(('UPDATE', 'INSERT')):
+                escrituras_sesion += 1
+
+        sesion = cliente.session
+        reporte[escenario['nombre']] = {
+            'status': estado,
+            'clics_por_segundo': round(clics / duracion, 1),
+            'consultas_por_clic': round(consultas / clics, 2),
+            'escrituras_sesion_por_clic': round(escrituras_sesion / clics, 2),
+            'bytes_sesion': len(sesion.encode(sesion.load())),
+        }
+    return reporte
+
+
+def _buscar_marca_lineal(marcas, nombre):
+    """La búsqueda anterior de parse_filename: la primera marca contenida en el nombre."""
+    for pk, marca in marcas:
+        if marca.lower() in nombre.lower():
+            return pk
+    return None
+
+
+def medir_deteccion_marcas(marcas=2000, archivos=300, semilla=42):
+    """
+    Busca la marca de `archivos` nombres de archivo sintéticos entre `marcas` marcas,
+    con el recorrido lineal y con el autómata (contando lo que cuesta armarlo).
+    Sin base de datos: mide solo la búsqueda; el recorrido lineal además hacía una
+    consulta de marcas por archivo.
+    """
+    aleatorio = random.Random(semilla)
+    lista = [
+        (i, f"{aleatorio.choice(PALABRAS).title()} {aleatorio.choice(PALABRAS).title()} {i}")
+        for i in range(marcas)
+    ]
+    # Como los deja parse_filename: sin extensión y con los guiones como espacios
+    nombres = [
+        f"{' '.join(aleatorio.sample(PALABRAS, 2))} {aleatorio.choice(lista)[1]} {aleatorio.choice([250, 500, 900])} ml"
+        for _ in range(archivos)
+    ]
+
+    inicio = time.perf_counter()
+    lineal = [_buscar_marca_lineal(lista, n) for n in nombres]
+    duracion_lineal = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    detector = DetectorMarcas(lista)
+    armado = time.perf_counter() - inicio
+    automata = [detector.buscar(n) for n in nombres]
+    duracion_automata = time.perf_counter() - inicio
+
+    return {
+        'marcas': marcas,
+        'archivos': archivos,
+        'lineal': {
+            'total_ms': round(duracion_lineal * 1000, 2),
+            'por_archivo_ms': round(duracion_lineal * 1000 / archivos, 4),
+            'consultas': archivos,
+            'encontradas': sum(1 for r in lineal if r is not None),
+        },
+        'aho_corasick': {
+            'total_ms': round(duracion_automata * 1000, 2),
+            'armado_ms': round(armado * 1000, 2),
+            'por_archivo_ms': round((duracion_automata - armado) * 1000 / archivos, 4),
+            'consultas': 1,
+            'encontradas': sum(1 for r in automata if r is not None),
+        },
+        # Distinta marca: el recorrido lineal se queda con la primera que contiene el
+        # nombre ("Cafe Agua 1" dentro de "Cafe Agua 12"); el autómata, con la más larga
+        'diferencias': sum(1 for a, b in zip(lineal, automata) if a != b),
+    }
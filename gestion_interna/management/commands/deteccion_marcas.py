@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from gestion_interna.benchmark import medir_deteccion_marcas
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la detección de marca de la carga masiva: recorrer todas las marcas por archivo "
+        "contra el autómata Aho-Corasick armado una vez (gestion_productos/marcas.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--marcas', type=int, default=2000)
+        parser.add_argument('--archivos', type=int, default=300)
+        parser.add_argument('--salida', help="Archivo JSON donde guardar el reporte.")
+
+    def handle(self, *args, **options):
+        reporte = medir_deteccion_marcas(marcas=options['marcas'], archivos=options['archivos'])
+
+        self.stdout.write(f"{reporte['archivos']} archivos, {reporte['marcas']} marcas")
+        self.stdout.write(f"{'método':14} {'total ms':>9} {'ms/archivo':>10} {'consultas':>9} {'encontradas':>11}")
+        for nombre in ('lineal', 'aho_corasick'):
+            datos = reporte[nombre]
+            self.stdout.write(
+                f"{nombre:14} {datos['total_ms']:>9.2f} {datos['por_archivo_ms']:>10.4f} "
+                f"{datos['consultas']:>9} {datos['encontradas']:>11}"
+            )
+        self.stdout.write(f"Armado del autómata: {reporte['aho_corasick']['armado_ms']:.2f} ms")
+        self.stdout.write(f"Archivos con distinta marca (primera vs. más larga): {reporte['diferencias']}")
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                json.dump(reporte, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Reporte guardado en {options['salida']}")
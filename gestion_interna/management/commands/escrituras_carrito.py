@@ -0,0 +1,61 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from gestion_interna.benchmark import medir_escrituras, sembrar_catalogo
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide los \"+1\" de los carritos en sesión (web, mostrador y transferencias): clics por "
+        "segundo, consultas y escrituras de sesión por clic y tamaño de la sesión. Los datos se descartan al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=1000)
+        parser.add_argument('--clics', type=int, default=200)
+        parser.add_argument('--lineas', type=int, default=20, help="Productos distintos en el carrito.")
+        parser.add_argument('--salida', help="Archivo JSON donde guardar el reporte.")
+        parser.add_argument('--comparar', help="Reporte JSON anterior para mostrar diferencias.")
+
+    def handle(self, *args, **options):
+        reporte = None
+        try:
+            with transaction.atomic():
+                contexto = sembrar_catalogo(productos=options['productos'], sucursales=2)
+                cache.clear()
+                reporte = medir_escrituras(contexto, clics=options['clics'], lineas=options['lineas'])
+                raise _Rollback()
+        except _Rollback:
+            cache.clear()
+
+        anterior = {}
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as f:
+                anterior = json.load(f).get('endpoints', {})
+
+        self.stdout.write(f"Motor de sesiones: {settings.SESSION_ENGINE}")
+        self.stdout.write(f"{'endpoint':28} {'clics/s':>9} {'consultas':>9} {'escr. ses.':>10} {'bytes':>7}")
+        for nombre, datos in reporte.items():
+            linea = (
+                f"{nombre:28} {datos['clics_por_segundo']:>9.1f} {datos['consultas_por_clic']:>9.2f} "
+                f"{datos['escrituras_sesion_por_clic']:>10.2f} {datos['bytes_sesion']:>7}"
+            )
+            if nombre in anterior:
+                linea += (
+                    f"   (antes: {anterior[nombre]['clics_por_segundo']:.1f} clics/s, "
+                    f"{anterior[nombre]['consultas_por_clic']:.2f} consultas, {anterior[nombre]['bytes_sesion']} bytes)"
+                )
+            self.stdout.write(linea)
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                json.dump({'motor_sesiones': settings.SESSION_ENGINE, 'endpoints': reporte}, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Reporte guardado en {options['salida']}")
@@ -0,0 +1,65 @@
+import json
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from gestion_interna.benchmark import excedidos, medir_vistas, sembrar_catalogo
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra un catálogo sintético, mide consultas y latencia de las vistas principales "
+        "y las compara con su presupuesto. Los datos se descartan al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=5000)
+        parser.add_argument('--sucursales', type=int, default=4)
+        parser.add_argument('--repeticiones', type=int, default=10)
+        parser.add_argument('--salida', help="Archivo JSON donde guardar el reporte.")
+        parser.add_argument('--comparar', help="Reporte JSON anterior para mostrar diferencias.")
+
+    def handle(self, *args, **options):
+        reporte = None
+        try:
+            with transaction.atomic():
+                contexto = sembrar_catalogo(productos=options['productos'], sucursales=options['sucursales'])
+                # Las versiones cacheadas podrían apuntar a datos anteriores a la siembra
+                cache.clear()
+                reporte = medir_vistas(contexto, repeticiones=options['repeticiones'])
+                raise _Rollback()
+        except _Rollback:
+            cache.clear()
+
+        anterior = {}
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as f:
+                anterior = json.load(f).get('vistas', {})
+
+        self.stdout.write(f"{'vista':28} {'consultas':>9} {'presup.':>7} {'p50 ms':>9} {'p95 ms':>9}")
+        for nombre, datos in reporte.items():
+            linea = (
+                f"{nombre:28} {datos['consultas']:>9} {datos['presupuesto_consultas']:>7} "
+                f"{datos['p50_ms']:>9.2f} {datos['p95_ms']:>9.2f}"
+            )
+            if nombre in anterior:
+                linea += (
+                    f"   (antes: {anterior[nombre]['consultas']} consultas, "
+                    f"p50 {anterior[nombre]['p50_ms']:.2f} ms)"
+                )
+            self.stdout.write(linea)
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                json.dump({'productos': options['productos'], 'vistas': reporte}, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Reporte guardado en {options['salida']}")
+
+        fuera = excedidos(reporte)
+        if fuera:
+            raise CommandError("Vistas fuera de presupuesto: " + ", ".join(sorted(fuera)))
+        self.stdout.write(self.style.SUCCESS("Todas las vistas dentro del presupuesto."))
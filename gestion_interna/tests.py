@@ -1,3 +1,45 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from .benchmark import ESCENARIOS, excedidos, medir_deteccion_marcas, medir_escrituras, medir_vistas, sembrar_catalogo
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PresupuestoVistasTests(TestCase):
+    """Las vistas principales no pueden superar su presupuesto de consultas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.contexto = sembrar_catalogo(productos=120, sucursales=3, ramas=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_vistas_dentro_del_presupuesto(self):
+        reporte = medir_vistas(self.contexto, repeticiones=2)
+        self.assertEqual(set(reporte), {e['nombre'] for e in ESCENARIOS})
+        self.assertEqual(excedidos(reporte), {})
+
+    def test_consultas_no_crecen_con_el_catalogo(self):
+        antes = medir_vistas(self.contexto, repeticiones=1)
+        sembrar_catalogo(productos=240, sucursales=3, ramas=3, semilla=7, prefijo='extra')
+        cache.clear()
+        despues = medir_vistas(self.contexto, repeticiones=1)
+        for nombre in antes:
+            self.assertEqual(antes[nombre]['consultas'], despues[nombre]['consultas'], nombre)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_agregar_al_carrito_no_escribe_la_base(self):
+        # Sesión en caché y fichas cacheadas: el "+1" solo lee el usuario logueado
+        reporte = medir_escrituras(self.contexto, clics=40, lineas=10)
+        for nombre, datos in reporte.items():
+            self.assertEqual(datos['status'], 200, nombre)
+            self.assertEqual(datos['escrituras_sesion_por_clic'], 0, nombre)
+            self.assertLessEqual(datos['consultas_por_clic'], 1, nombre)
+
+
+class DeteccionMarcasTests(TestCase):
+    def test_el_automata_encuentra_una_marca_en_cada_archivo(self):
+        reporte = medir_deteccion_marcas(marcas=300, archivos=60)
+        self.assertEqual(reporte['aho_corasick']['encontradas'], reporte['lineal']['encontradas'])
+        self.assertEqual(reporte['aho_corasick']['encontradas'], reporte['archivos'])
@@ -1,41 +1,65 @@
+from gestion_productos.fichas import fichas_de
+
+
 class CarritoTransferencia:
+    """
+    Carrito de transferencias entre sucursales. La sesión guarda solo
+    {id: cantidad}; nombre y sku salen de las fichas cacheadas
+    (gestion_productos/fichas.py).
+    """
+
     def __init__(self, request):
         self.session = request.session
-        carrito = self.session.get('transferencia_cart')
-        if not carrito:
-            carrito = self.session['transferencia_cart'] = {}
-        self.carrito = carrito
+        carrito = self.session.get('transferencia_cart') or {}
+        if any(isinstance(v, dict) for v in carrito.values()):
+            # Sesiones con el formato anterior (una ficha completa por línea)
+            carrito = {k: v['cantidad'] for k, v in carrito.items()}
+        self.cantidades = carrito
 
-    def agregar(self, producto, cantidad=1):
-        producto_id = str(producto.id)
-        if producto_id not in self.carrito:
-            self.carrito[producto_id] = {
-                'producto_id': producto.id,
-                'nombre': producto.nombre,
-                'sku': producto.sku,
-                'cantidad': cantidad,
+    @property
+    def carrito(self):
+        """Líneas completas {id: {producto_id, nombre, sku, cantidad}}."""
+        if not hasattr(self, '_carrito'):
+            fichas = fichas_de(self.cantidades)
+            self._carrito = {
+                producto_id: {
+                    'producto_id': fichas[int(producto_id)]['producto_id'],
+                    'nombre': fichas[int(producto_id)]['nombre'],
+                    'sku': fichas[int(producto_id)]['sku'],
+                    'cantidad': cantidad,
+                }
+                for producto_id, cantidad in self.cantidades.items() if int(producto_id) in fichas
             }
-        else:
-            self.carrito[producto_id]['cantidad'] += cantidad
+        return self._carrito
+
+    @property
+    def total_items(self):
+        return sum(self.cantidades.values())
+
+    def agregar(self, producto, cantidad=1):
+        producto_id = str(getattr(producto, 'pk', producto))
+        self.cantidades[producto_id] = self.cantidades.get(producto_id, 0) + cantidad
         self.guardar()
 
     def restar(self, producto_id):
         producto_id = str(producto_id)
-        if producto_id in self.carrito:
-            self.carrito[producto_id]['cantidad'] -= 1
-            if self.carrito[producto_id]['cantidad'] <= 0:
+        if producto_id in self.cantidades:
+            self.cantidades[producto_id] -= 1
+            if self.cantidades[producto_id] <= 0:
                 self.eliminar(producto_id)
             self.guardar()
 
     def eliminar(self, producto_id):
         producto_id = str(producto_id)
-        if producto_id in self.carrito:
-            del self.carrito[producto_id]
+        if producto_id in self.cantidades:
+            del self.cantidades[producto_id]
             self.guardar()
 
     def limpiar(self):
-        self.session['transferencia_cart'] = {}
+        self.cantidades = {}
         self.guardar()
 
     def guardar(self):
-        self.session.modified = True
\ No newline at end of file
+        self.__dict__.pop('_carrito', None)
+        self.session['transferencia_cart'] = self.cantidades
+        self.session.modified = True
@@ -3,7 +3,7 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.db import transaction
 from django.db.models import Q
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from itertools import chain
 from decimal import Decimal
 
@@ -12,9 +12,11 @@ from .models import Transferencia, ItemTransferencia
 from .transferencia_session import CarritoTransferencia
 from gestion_pedidos.models import Pedido
 from gestion_productos.models import Producto, HistorialPrecio
+from gestion_productos.search import ProductSearch
+from gestion_productos.fichas import ficha_de
 from gestion_productos.forms import ProductoCargaForm, GaleriaFormSet, StockFormSet
 from gestion_sucursales.models import Stock, Sucursal
-from gestion_sucursales.services import procesar_movimiento_stock
+from gestion_sucursales.services import procesar_movimientos_bulk
 
 
 def es_empleado(user):
@@ -77,22 +79,14 @@ def dashboard_principal(request):
         stock_formset = StockFormSet()
 
     # --- LÓGICA DE PEDIDOS (INTACTO) ---
-    pedidos_pendientes = Pedido.objects.filter(**filtros, estado='PENDIENTE').order_by('-fecha')
-    pedidos_procesados = Pedido.objects.filter(**filtros).filter(Q(estado='PROCESADO') | Q(estado='ENTREGADO')).order_by('-fecha')[:50]
+    # Los items se precargan: el template los recorre por cada pedido
+    pedidos_pendientes = Pedido.objects.filter(**filtros, estado='PENDIENTE').prefetch_related('items').order_by('-fecha')
+    pedidos_procesados = Pedido.objects.filter(**filtros).filter(Q(estado='PROCESADO') | Q(estado='ENTREGADO')).prefetch_related('items').order_by('-fecha')[:50]
     todos = list(chain(pedidos_pendientes, pedidos_procesados))
 
-    # --- NUEVA LÓGICA DE PRODUCTOS CON STOCK LOCAL ---
-    productos_todos = Producto.objects.all().prefetch_related('precios', 'categoria').order_by('-id')
-    
-    # Mapear stock local para la sucursal del usuario
-    if user.sucursal:
-        stocks = Stock.objects.filter(sucursal=user.sucursal, producto__in=productos_todos[:100])
-        stock_map = {s.producto_id: s.cantidad for s in stocks}
-        for p in productos_todos:
-            p.stock_local = stock_map.get(p.id, 0)
-    else:
-        for p in productos_todos:
-            p.stock_local = None
+    # --- PRODUCTOS ---
+    # La grilla se pide por AJAX al abrir la pestaña, paginada en el servidor
+    # (gestion_productos.views.buscar_productos_gestion_ajax)
 
     # --- LÓGICA DE TRANSFERENCIAS ---
     transferencias_recientes = Transferencia.objects.all().order_by('-fecha_creacion')[:10]
@@ -106,7 +100,6 @@ def dashboard_principal(request):
         'formset': formset,
         'stock_formset': stock_formset,
         'transferencias': transferencias_recientes,
-        'productos_todos': productos_todos,
         'total_productos': Producto.objects.count(),
         'total_transferencias': Transferencia.objects.count(),
     })
@@ -165,7 +158,7 @@ def transferencias_view(request):
         transferencias_recibidas = []
     
     # Calculamos el total de items del carrito actual
-    total_items = sum(item.get('cantidad', 0) for item in carrito.carrito.values())
+    total_items = carrito.total_items
     
     return render(request, 'gestion_interna/transferencias_content.html', {
         'carrito': carrito.carrito,
@@ -183,9 +176,12 @@ def buscar_productos_transferencia(request):
     if len(query) < 3:
         return JsonResponse({'productos': []})
 
-    productos = Producto.objects.filter(
-        Q(nombre__icontains=query) | Q(sku__icontains=query)
-    ).prefetch_related('precios').distinct()[:10]
+    productos = list(ProductSearch().buscar(query)[:10])
+
+    # Stock de la sucursal para todos los resultados en un solo query
+    stock_map = dict(
+        Stock.objects.filter(sucursal=sucursal_origen, producto__in=productos).values_list('producto_id', 'cantidad')
+    )
 
     data = []
     for p in productos:
@@ -196,13 +192,8 @@ def buscar_productos_transferencia(request):
         else:
             precio_formateado = str(precio) if precio else "$0.00"
 
-        # 2. Manejo de Stock Real por Sucursal
-        # Buscamos el registro de stock específico para este producto en esta sucursal
-        try:
-            stock_obj = Stock.objects.get(producto=p, sucursal=sucursal_origen)
-            stock_real = stock_obj.cantidad
-        except Stock.DoesNotExist:
-            stock_real = 0 
+        # 2. Manejo de Stock Real por Sucursal (0 si no hay registro)
+        stock_real = stock_map.get(p.id, 0)
 
         data.append({
             'id': p.id,
@@ -246,26 +237,29 @@ def confirmar_transferencia(request):
                 estado='EN_TRANSITO'
             )
 
-            # 2. Procesar Items y Stock
+            # 2. Procesar Items y Stock (consultas constantes, sin importar la cantidad de líneas)
+            productos = Producto.objects.in_bulk([item['producto_id'] for item in items.values()])
+            lineas = []
             for key, item in items.items():
-                producto = get_object_or_404(Producto, id=item['producto_id'])
-                
-                # Crear Item
-                ItemTransferencia.objects.create(
-                    transferencia=transferencia,
-                    producto=producto,
-                    cantidad=item['cantidad']
-                )
-
-                # DESCONTAR DE ORIGEN (SALIDA)
-                procesar_movimiento_stock(
-                    producto=producto,
-                    sucursal=request.user.sucursal,
-                    cantidad=item['cantidad'],
-                    tipo='SAL',
-                    usuario=request.user,
-                    observaciones=f"Transferencia #{transferencia.id} a {sucursal_destino.nombre}"
-                )
+                producto = productos.get(int(item['producto_id']))
+                if producto is None:
+                    raise Http404("Producto no encontrado")
+                lineas.append((producto, item['cantidad']))
+
+            # Crear Items
+            ItemTransferencia.objects.bulk_create([
+                ItemTransferencia(transferencia=transferencia, producto=producto, cantidad=cantidad)
+                for producto, cantidad in lineas
+            ])
+
+            # DESCONTAR DE ORIGEN (SALIDA)
+            procesar_movimientos_bulk(
+                sucursal=request.user.sucursal,
+                lineas=lineas,
+                tipo='SAL',
+                usuario=request.user,
+                observaciones=f"Transferencia #{transferencia.id} a {sucursal_destino.nombre}"
+            )
 
             carrito_obj.limpiar()
             return JsonResponse({'status': 'ok', 'message': f'Transferencia #{transferencia.id} enviada correctamente.'})
@@ -287,10 +281,13 @@ def error_500(request):
 @login_required
 def agregar_item_transferencia(request, producto_id):
     """Agrega un producto al carrito de transferencias en sesión"""
+    # La ficha cacheada alcanza para validar el producto (sin leerlo de la base)
+    ficha = ficha_de(producto_id)
+    if ficha is None:
+        raise Http404("Producto no encontrado")
     carrito = CarritoTransferencia(request)
-    producto = get_object_or_404(Producto, id=producto_id)
-    carrito.agregar(producto)
-    return JsonResponse({'status': 'ok', 'mensaje': f'{producto.nombre} agregado'})
+    carrito.agregar(producto_id)
+    return JsonResponse({'status': 'ok', 'mensaje': f"{ficha['nombre']} agregado"})
 
 
 @login_required
@@ -324,16 +321,14 @@ def confirmar_recepcion(request, transferencia_id):
 
     try:
         with transaction.atomic():
-            # Sumar stock al destino
-            for item in transferencia.items.all():
-                procesar_movimiento_stock(
-                    producto=item.producto,
-                    sucursal=user_sucursal,
-                    cantidad=item.cantidad,
-                    tipo='ENT',
-                    usuario=request.user,
-                    observaciones=f"Recepción de Transferencia #{transferencia.id}"
-                )
+            # Sumar stock al destino (todas las líneas juntas)
+            procesar_movimientos_bulk(
+                sucursal=user_sucursal,
+                lineas=transferencia.items.values_list('producto_id', 'cantidad'),
+                tipo='ENT',
+                usuario=request.user,
+                observaciones=f"Recepción de Transferencia #{transferencia.id}"
+            )
             
             transferencia.estado = 'COMPLETADO'
             transferencia.save()
@@ -361,7 +356,7 @@ def obtener_detalle_transferencia(request, transferencia_id):
 def obtener_remito_ajax(request):
     """Retorna solo el HTML del remito (carrito) para actualizaciones AJAX"""
     carrito = CarritoTransferencia(request)
-    total_items = sum(item.get('cantidad', 0) for item in carrito.carrito.values())
+    total_items = carrito.total_items
     return render(request, 'gestion_interna/remito_transferencia_fragment.html', {
         'carrito': carrito.carrito,
         'total_items': total_items
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 08:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_producto(apps, schema_editor):
+    """Vincula los items existentes con su producto: primero por SKU y si no, por nombre (el más nuevo)."""
+    ItemPedido = apps.get_model('gestion_pedidos', 'ItemPedido')
+    Producto = apps.get_model('gestion_productos', 'Producto')
+    ItemPedido.objects.filter(producto__isnull=True).exclude(sku__isnull=True).exclude(sku='').update(
+        producto=Subquery(Producto.objects.filter(sku=OuterRef('sku')).values('id')[:1])
+    )
+    ItemPedido.objects.filter(producto__isnull=True).update(
+        producto=Subquery(Producto.objects.filter(nombre=OuterRef('producto_nombre')).order_by('-id').values('id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_pedidos', '0006_alter_pedido_forma_pago'),
+        ('gestion_productos', '0027_archivo_media'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itempedido',
+            name='producto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items_pedido', to='gestion_productos.producto'),
+        ),
+        migrations.RunPython(backfill_producto, migrations.RunPython.noop),
+    ]
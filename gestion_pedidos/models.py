@@ -65,6 +65,15 @@ class Pedido(models.Model):
 
 class ItemPedido(models.Model):
     pedido = models.ForeignKey(Pedido, related_name='items', on_delete=models.CASCADE)
+    # El producto vendido, para descontar stock en la caja sin buscarlo por SKU o nombre.
+    # Nombre, SKU y precio quedan copiados en el item: el pedido no cambia si el producto sí.
+    producto = models.ForeignKey(
+        'gestion_productos.Producto',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='items_pedido'
+    )
     producto_nombre = models.CharField(max_length=255)
     sku = models.CharField(max_length=50, blank=True, null=True)
     cantidad = models.IntegerField()
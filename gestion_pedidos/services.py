@@ -0,0 +1,96 @@
+"""
+Alta de pedidos, compartida por el checkout web (guardar_pedido) y la preventa de
+mostrador (confirmar_preventa), y resolución de sus productos al cobrar en la caja.
+
+Las líneas llegan en el formato del carrito y del ticket de mostrador:
+{'producto_id', 'nombre', 'sku', 'precio', 'cantidad', 'acumulado'}. Las consultas
+no dependen de la cantidad de líneas: los productos se leen con un solo in_bulk y
+los items se insertan con un solo bulk_create.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from gestion_productos.models import Producto
+from gestion_sucursales.models import Stock
+from .models import Pedido, ItemPedido
+
+
+def productos_de(lineas):
+    """{id: Producto} de todas las líneas en una consulta. ValidationError si alguno ya no existe."""
+    ids = {int(linea['producto_id']) for linea in lineas}
+    productos = Producto.objects.only('id', 'nombre', 'sku').in_bulk(ids)
+    faltantes = [linea['nombre'] for linea in lineas if int(linea['producto_id']) not in productos]
+    if faltantes:
+        raise ValidationError(f"Ya no existen los productos: {', '.join(faltantes)}")
+    return productos
+
+
+def faltantes_de_stock(sucursal, lineas, productos):
+    """
+    Líneas sin stock suficiente en la sucursal (sin registro de stock cuenta como 0),
+    con una sola consulta: [{'producto', 'solicitado', 'disponible'}, ...].
+    """
+    disponibles = dict(
+        Stock.objects.filter(sucursal=sucursal, producto_id__in=productos).values_list('producto_id', 'cantidad')
+    )
+    faltantes = []
+    for linea in lineas:
+        pid = int(linea['producto_id'])
+        if disponibles.get(pid, 0) < linea['cantidad']:
+            faltantes.append({'producto': productos[pid], 'solicitado': linea['cantidad'], 'disponible': disponibles.get(pid, 0)})
+    return faltantes
+
+
+def crear_pedido(lineas, productos=None, **campos):
+    """
+    Crea el Pedido (con `campos`) y todos sus ItemPedido vinculados al producto.
+    `productos` evita volver a leerlos si el llamador ya los tiene (productos_de).
+    Devuelve (pedido, items).
+    """
+    lineas = list(lineas)
+    if productos is None:
+        productos = productos_de(lineas)
+
+    with transaction.atomic():
+        pedido = Pedido.objects.create(**campos)
+        items = ItemPedido.objects.bulk_create([
+            ItemPedido(
+                pedido=pedido,
+                producto=productos[int(linea['producto_id'])],
+                producto_nombre=linea['nombre'],
+                sku=linea.get('sku') or productos[int(linea['producto_id'])].sku or '',
+                cantidad=linea['cantidad'],
+                precio_unitario=linea['precio'],
+                subtotal=linea['acumulado'],
+            )
+            for linea in lineas
+        ])
+    return pedido, items
+
+
+def lineas_de_stock(items):
+    """
+    [(producto_id, cantidad), ...] de los items de un pedido, para procesar_movimientos_bulk.
+    Los items anteriores al vínculo con el producto (sin producto_id) se resuelven
+    como antes: por SKU y, si no, por nombre. ValidationError si alguno no aparece.
+    """
+    items = list(items)
+    sin_producto = [i for i in items if i.producto_id is None]
+    por_sku, por_nombre = {}, {}
+    if sin_producto:
+        skus = [i.sku for i in sin_producto if i.sku]
+        if skus:
+            por_sku = dict(Producto.objects.filter(sku__in=skus).values_list('sku', 'id'))
+        nombres = [i.producto_nombre for i in sin_producto if i.sku not in por_sku]
+        if nombres:
+            # El más nuevo gana si hay nombres repetidos
+            por_nombre = dict(Producto.objects.filter(nombre__in=nombres).order_by('id').values_list('nombre', 'id'))
+
+    lineas = []
+    for item in items:
+        producto_id = item.producto_id or por_sku.get(item.sku) or por_nombre.get(item.producto_nombre)
+        if not producto_id:
+            # Si no encontramos el producto, es un riesgo. Frenamos la venta.
+            raise ValidationError(f"No se encontró producto en DB para {item.producto_nombre}")
+        lineas.append((producto_id, item.cantidad))
+    return lineas
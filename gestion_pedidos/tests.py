@@ -1,3 +1,103 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from gestion_productos.models import Categoria, Marca, Producto, HistorialPrecio
+from gestion_sucursales.models import Stock, Sucursal
+from .models import Pedido, ItemPedido
+from .services import crear_pedido, lineas_de_stock
+
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CrearPedidoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sucursal = Sucursal.objects.create(nombre="Centro", direccion="Calle 1", ciudad="Córdoba")
+        categoria = Categoria.objects.create(nombre="Almacén")
+        marca = Marca.objects.create(nombre="Marca")
+        cls.productos = []
+        for i in range(10):
+            producto = Producto.objects.create(nombre=f"Producto {i}", categoria=categoria, marca=marca,
+                                               descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+            HistorialPrecio.objects.create(producto=producto, precio_venta=100, es_actual=True)
+            Stock.objects.create(producto=producto, sucursal=cls.sucursal, cantidad=5)
+            cls.productos.append(producto)
+        Usuario = get_user_model()
+        cls.vendedor = Usuario.objects.create_user(username='vendedor', email='vendedor@example.com', password='x',
+                                                   rol='VE', sucursal=cls.sucursal)
+        cls.cajera = Usuario.objects.create_user(username='cajera', email='cajera@example.com', password='x',
+                                                 rol='CA', sucursal=cls.sucursal)
+
+    def setUp(self):
+        cache.clear()
+
+    def _lineas(self, productos, cantidad=1):
+        return [
+            {'producto_id': p.id, 'nombre': p.nombre, 'sku': p.sku, 'precio': Decimal('100'),
+             'cantidad': cantidad, 'acumulado': Decimal('100') * cantidad}
+            for p in productos
+        ]
+
+    def _crear(self, productos, **campos):
+        return crear_pedido(self._lineas(productos), cliente="Cliente", telefono="000", sucursal=self.sucursal,
+                            modalidad='RETIRO', total=Decimal('100') * len(productos), **campos)
+
+    def test_consultas_no_dependen_de_la_cantidad_de_lineas(self):
+        with CaptureQueriesContext(connection) as dos:
+            self._crear(self.productos[:2])
+        with CaptureQueriesContext(connection) as diez:
+            pedido, items = self._crear(self.productos)
+        self.assertEqual(len(dos), len(diez))
+        self.assertEqual([i.producto_id for i in pedido.items.order_by('id')], [p.id for p in self.productos])
+
+    def test_caja_usa_el_producto_del_item_y_resuelve_los_viejos(self):
+        pedido, _ = self._crear(self.productos[:2], canal='MOS')
+        # Un item de antes del vínculo con el producto: se resuelve por SKU
+        ItemPedido.objects.create(pedido=pedido, producto_nombre="otro nombre", sku=self.productos[2].sku,
+                                  cantidad=2, precio_unitario=100, subtotal=200)
+        with self.assertNumQueries(2):
+            lineas = lineas_de_stock(ItemPedido.objects.filter(pedido=pedido).order_by('id'))
+        self.assertEqual(lineas, [(self.productos[0].id, 1), (self.productos[1].id, 1), (self.productos[2].id, 2)])
+
+        self.client.force_login(self.cajera)
+        respuesta = self.client.post(reverse('ventas_mostrador:finalizar_pedido_caja', args=[pedido.nro_pedido]),
+                                     {'forma_pago': 'EFECTIVO', 'nro_operacion_fiscal': '1'})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(Stock.objects.get(producto=self.productos[2], sucursal=self.sucursal).cantidad, 3)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.estado, 'ENTREGADO')
+
+    def test_checkout_web_crea_los_items_vinculados(self):
+        for producto in self.productos[:3]:
+            self.client.get(reverse('agregar', args=[producto.id]))
+        respuesta = self.client.post(reverse('guardar_pedido'), json.dumps({
+            'nombre': "Cliente Web", 'telefono': "123", 'sucursal': self.sucursal.nombre,
+            'modalidad': 'RETIRO', 'total': '300',
+        }), content_type='application/json')
+        self.assertEqual(respuesta.json()['status'], 'ok')
+        pedido = Pedido.objects.get(nro_pedido=respuesta.json()['nro_pedido'])
+        self.assertEqual(sorted(pedido.items.values_list('producto_id', flat=True)), [p.id for p in self.productos[:3]])
+        self.assertEqual(Stock.objects.get(producto=self.productos[0], sucursal=self.sucursal).cantidad, 4)
+
+    def test_preventa_informa_todos_los_faltantes_sin_crear_el_pedido(self):
+        self.client.force_login(self.vendedor)
+        for _ in range(6):
+            self.client.get(reverse('ventas_mostrador:agregar_ajax', args=[self.productos[0].id]))
+        self.client.get(reverse('ventas_mostrador:agregar_ajax', args=[self.productos[1].id]))
+        respuesta = self.client.post(reverse('ventas_mostrador:confirmar_preventa'))
+        self.assertEqual([e['producto'].id for e in respuesta.context['errores_stock']], [self.productos[0].id])
+        self.assertFalse(Pedido.objects.exists())
+
+        self.client.get(reverse('ventas_mostrador:restar_producto_mostrador', args=[self.productos[0].id]))
+        self.client.post(reverse('ventas_mostrador:confirmar_preventa'))
+        pedido = Pedido.objects.get()
+        self.assertEqual(pedido.canal, 'MOS')
+        self.assertEqual(pedido.items.count(), 2)
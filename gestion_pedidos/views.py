@@ -5,12 +5,12 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
-from .models import Pedido, ItemPedido
+from .services import crear_pedido
 from gestion_sucursales.models import Sucursal, Stock, MovimientoStock
 import json
 import pytz
-from gestion_productos.models import Producto
-from gestion_sucursales.services import procesar_movimiento_stock
+from gestion_sucursales.services import procesar_movimientos_bulk, StockInsuficiente
+from carrito.carrito import obtener_carrito
 
 @csrf_exempt 
 def guardar_pedido(request):
@@ -19,7 +19,8 @@ def guardar_pedido(request):
 
     try:
         data = json.loads(request.body)
-        carrito = request.session.get('carrito', {})
+        carrito_compra = obtener_carrito(request)
+        carrito = carrito_compra.items()
         
         if not carrito:
             return JsonResponse({'status': 'error', 'message': 'Carrito vacío o ya procesado'}, status=400)
@@ -32,8 +33,9 @@ def guardar_pedido(request):
             except (Sucursal.DoesNotExist, ValueError):
                 sucursal_obj = get_object_or_404(Sucursal, pk=data['sucursal'])
             
-            # Creamos el pedido
-            nuevo_pedido = Pedido.objects.create(
+            # Creamos el pedido y todos sus items (productos en una consulta, items en un INSERT)
+            nuevo_pedido, items = crear_pedido(
+                carrito.values(),
                 cliente=data['nombre'],
                 telefono=data['telefono'],
                 direccion=data.get('direccion', 'RETIRO EN LOCAL'),
@@ -46,33 +48,23 @@ def guardar_pedido(request):
                 fecha=timezone.localtime(timezone.now()) 
             )
 
-            detalle_items_email = ""
-            for key, value in carrito.items():
-                # Crear Item del pedido
-                ItemPedido.objects.create(
-                    pedido=nuevo_pedido,
-                    producto_nombre=value['nombre'],
-                    sku=value.get('sku', ''),
-                    cantidad=value['cantidad'],
-                    precio_unitario=value['precio'],
-                    subtotal=value['acumulado']
-                )
-                detalle_items_email += f"- {value['cantidad']}x {value['nombre']} [SKU: {value.get('sku', 'N/A')}] (${value['acumulado']})\n"
+            detalle_items_email = "".join(
+                f"- {item.cantidad}x {item.producto_nombre} [SKU: {item.sku or 'N/A'}] (${item.subtotal})\n"
+                for item in items
+            )
+            lineas_stock = [(item.producto_id, item.cantidad) for item in items]
 
-                # REGISTRO DE MOVIMIENTO CENTRALIZADO
-                prod = Producto.objects.get(pk=key)
-                procesar_movimiento_stock(
-                    producto=prod,
-                    sucursal=sucursal_obj,
-                    cantidad=int(value['cantidad']), 
-                    tipo='WEB', 
-                    usuario=request.user if request.user.is_authenticated else None,
-                    observaciones=f"Venta automática Web - Pedido #{nuevo_pedido.nro_pedido}"
-                )
+            # REGISTRO DE MOVIMIENTOS CENTRALIZADO (todas las líneas juntas)
+            procesar_movimientos_bulk(
+                sucursal=sucursal_obj,
+                lineas=lineas_stock,
+                tipo='WEB',
+                usuario=request.user if request.user.is_authenticated else None,
+                observaciones=f"Venta automática Web - Pedido #{nuevo_pedido.nro_pedido}"
+            )
 
             # --- BLOQUE 2: LIMPIEZA DE SESIÓN ---
-            request.session['carrito'] = {}
-            request.session.modified = True
+            carrito_compra.limpiar_carrito()
             request.session.save() 
 
         # --- BLOQUE 3: EMAIL ---
@@ -84,6 +76,15 @@ def guardar_pedido(request):
             'nro_pedido': nuevo_pedido.nro_pedido
         })
 
+    except StockInsuficiente as e:
+        # Informamos todos los productos sin stock, no solo el primero
+        nombres = ', '.join(f'"{r["producto"].nombre}"' for r in e.resultados if not r['ok'])
+        return JsonResponse({
+            'status': 'error',
+            'title': "Sin Stock en Sucursal Seleccionada",
+            'message': f'Sin stock disponible en la sucursal {sucursal_obj.nombre} para: {nombres}.'
+        }, status=400)
+
     except Exception as e:
         raw_error = str(e).strip("[]'")
         
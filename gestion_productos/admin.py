@@ -6,7 +6,7 @@ from django.urls import path
 from django.utils.html import format_html
 from django.db.models import Sum
 from .models import Producto, Categoria, Marca, HistorialPrecio, ImagenProducto
-from .views_batch import CargaMasivaView
+from .views_batch import CargaMasivaView, ImportarCatalogoView
 from gestion_sucursales.admin import StockInline
 
 # =================================================================
@@ -96,6 +96,7 @@ class ProductoAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path('carga-masiva/', self.admin_site.admin_view(CargaMasivaView.as_view()), name='gestion_productos_producto_batch_upload'),
+            path('importar-catalogo/', self.admin_site.admin_view(ImportarCatalogoView.as_view()), name='gestion_productos_producto_importar_catalogo'),
         ]
         return custom_urls + urls
 
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class GestionProductosConfig(AppConfig):
     name = 'gestion_productos'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registra los receivers)
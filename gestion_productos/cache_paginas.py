@@ -0,0 +1,101 @@
+"""
+Caché de página completa para las vistas públicas del catálogo (home, categoría,
+ofertas, ahorrames y detalle de producto).
+
+Los GET anónimos con el carrito vacío y sin mensajes pendientes se sirven desde
+la caché compartida. La clave lleva la versión del catálogo (las versiones
+'productos', 'categorias' y 'sucursales', que incrementan las señales), así que
+cualquier cambio de producto, precio, visibilidad o del menú genera páginas nuevas.
+
+Un acierto no ejecuta la vista. Con Redis no consulta la base; con la caché en
+base (la de por defecto) son dos lecturas de cache_table: versiones y página.
+
+Cada página cacheada guarda un ETag fuerte (hash del contenido) y su
+Last-Modified: el navegador revalida con If-None-Match / If-Modified-Since y
+recibe un 304 sin cuerpo. Los usuarios logueados (staff o clientes) y quien
+tiene algo en el carrito pasan de largo y reciben la página marcada como privada.
+
+La respuesta es `public` pero lleva `Vary: Cookie` (la misma URL cambia para un
+usuario logueado), así que un CDN solo la comparte entre pedidos con las mismas
+cookies, y muchos directamente no cachean respuestas con Vary: Cookie. Para
+servirlas desde el borde hay que configurar el CDN para que ignore las cookies
+de los anónimos en estas rutas; sin eso, lo que se gana es la caché del servidor
+y los 304 del navegador.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from carrito.carrito import obtener_carrito
+
+from .versiones import obtener_versiones
+
+DURACION = 60 * 60  # las versiones invalidan antes; esto solo limpia claves viejas
+VERSIONES = ('productos', 'categorias', 'sucursales')
+
+
+def version_catalogo():
+    """Las versiones del catálogo en una sola lectura de la caché ('3.2.1')."""
+    return '.'.join(str(v) for v in obtener_versiones(*VERSIONES))
+
+
+def es_cacheable(request):
+    if request.method not in ('GET', 'HEAD') or not getattr(settings, 'CACHE_PAGINAS', True):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Un mensaje pendiente o un carrito con productos cambian la página (header y avisos)
+    if len(get_messages(request)):
+        return False
+    return not obtener_carrito(request).unidades
+
+
+def _responder(request, entrada):
+    respuesta = get_conditional_response(request, etag=entrada['etag'], last_modified=entrada['modificada'])
+    if respuesta is None:
+        respuesta = HttpResponse(entrada['contenido'], content_type=entrada['content_type'])
+    respuesta['ETag'] = entrada['etag']
+    respuesta['Last-Modified'] = http_date(entrada['modificada'])
+    patch_cache_control(respuesta, public=True, max_age=0, must_revalidate=True)
+    patch_vary_headers(respuesta, ('Cookie',))
+    return respuesta
+
+
+def pagina_de_catalogo(vista):
+    """Decorador para las vistas públicas del catálogo."""
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if not es_cacheable(request):
+            respuesta = vista(request, *args, **kwargs)
+            patch_cache_control(respuesta, private=True)
+            return respuesta
+
+        ruta = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        clave = f"pagina:{version_catalogo()}:{ruta}"
+        entrada = cache.get(clave)
+        if entrada is None:
+            respuesta = vista(request, *args, **kwargs)
+            # Solo se guardan las páginas completas que no dependen del visitante (sin cookies ni token CSRF)
+            if respuesta.status_code != 200 or respuesta.streaming or respuesta.cookies \
+                    or request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                return respuesta
+            if hasattr(respuesta, 'render') and callable(respuesta.render):
+                respuesta.render()
+            entrada = {
+                'contenido': respuesta.content,
+                'content_type': respuesta['Content-Type'],
+                'etag': f'"{hashlib.md5(respuesta.content).hexdigest()}"',
+                'modificada': int(time.time()),
+            }
+            cache.set(clave, entrada, DURACION)
+        return _responder(request, entrada)
+
+    return envoltura
@@ -0,0 +1,87 @@
+"""
+Cargador de relaciones de producto por request (estilo DataLoader).
+
+Las vistas registran los productos que van a renderizar (la página de un listado,
+el producto del detalle) con `cargar_productos(request, productos)`. Cuando un
+template pide `producto.galeria`, `producto.categoria_ancestros` o
+`producto.categoria`, el cargador resuelve esa relación para todos los productos
+registrados del request con una consulta por relación, en lugar de una por producto.
+Lo mismo con `producto.tarjeta_html`: las tarjetas cacheadas de toda la página
+salen de la caché de una vez (ver tarjetas.py).
+
+Los precios ya no necesitan cargador: precio_actual(), precio_antes() y
+descuento_porcentaje() leen columnas desnormalizadas del propio producto.
+"""
+from collections import defaultdict
+
+from .models import Categoria, ImagenProducto
+from .tarjetas import tarjetas_de
+
+
+def _categoria_cargada(producto):
+    return producto._meta.get_field('categoria').is_cached(producto)
+
+
+class CargadorProductos:
+    def __init__(self):
+        self.productos = {}
+        self._galerias = {}
+        self._tarjetas = {}
+
+    def registrar(self, productos):
+        for producto in productos:
+            self.productos.setdefault(producto.pk, producto)
+            producto._cargador = self
+
+    def galeria(self, producto):
+        if producto.pk not in self._galerias:
+            # 1. Una sola consulta para las galerías de todos los productos todavía sin resolver
+            faltan = [pk for pk in self.productos if pk not in self._galerias] or [producto.pk]
+            imagenes = defaultdict(list)
+            for imagen in ImagenProducto.objects.filter(producto_id__in=faltan).order_by('producto_id', 'orden', 'id'):
+                imagenes[imagen.producto_id].append(imagen)
+            for pk in faltan:
+                self._galerias[pk] = imagenes.get(pk, [])
+        return self._galerias[producto.pk]
+
+    def tarjeta(self, producto):
+        if producto.pk not in self._tarjetas:
+            faltan = [p for pk, p in self.productos.items() if pk not in self._tarjetas] or [producto]
+            self._tarjetas.update(tarjetas_de(faltan))
+        return self._tarjetas[producto.pk]
+
+    def categoria(self, producto):
+        if not _categoria_cargada(producto):
+            # 2. Las categorías que falten, de una vez (las que ya vinieron con select_related se respetan)
+            sin_categoria = [p for p in self.productos.values() if not _categoria_cargada(p)]
+            por_id = Categoria.objects.in_bulk({p.categoria_id for p in sin_categoria} | {producto.categoria_id})
+            for p in sin_categoria + [producto]:
+                p.categoria = por_id.get(p.categoria_id)
+        return producto.categoria
+
+    def ancestros(self, producto):
+        categoria = self.categoria(producto)
+        if categoria is None:
+            return []
+        if '_ancestros_cache' not in categoria.__dict__:
+            # 3. Los ancestros de todas las categorías del request salen de sus rutas: un solo IN
+            categorias = [self.categoria(p) for p in self.productos.values()] + [categoria]
+            pendientes = [c for c in categorias if c is not None and '_ancestros_cache' not in c.__dict__]
+            ids = {i for c in pendientes for i in c.ancestros_ids()}
+            por_id = Categoria.objects.in_bulk(ids) if ids else {}
+            for c in pendientes:
+                c.__dict__['_ancestros_cache'] = [por_id[i] for i in c.ancestros_ids() if i in por_id]
+        return categoria.get_ancestros()
+
+
+def cargador_de(request):
+    """Un único cargador por request."""
+    if not hasattr(request, '_cargador_productos'):
+        request._cargador_productos = CargadorProductos()
+    return request._cargador_productos
+
+
+def cargar_productos(request, productos):
+    """Registra los productos en el cargador del request y los devuelve (admite páginas y listas)."""
+    cargador_de(request).registrar(productos)
+    return productos
@@ -1,11 +1,16 @@
-from .models import Categoria, Favorito
+from django.utils.functional import SimpleLazyObject
+
+from .models import Favorito
+from .navegacion import valor_perezoso
 
 def lista_categorias(request):
     """
-    Envía las categorías principales al menú desplegable de todas las páginas.
+    Envía el menú desplegable de categorías de todas las páginas, ya renderizado
+    (ver navegacion.py). Sale de la caché de navegación y solo se evalúa si el
+    template lo usa.
     """
     return {
-        'categorias_padre': Categoria.objects.filter(padre__isnull=True, activa=True).order_by('orden', 'nombre')
+        'menu_categorias': valor_perezoso(request, 'menu_categorias'),
     }
 
 def favoritos_usuario(request):
@@ -13,6 +18,8 @@ def favoritos_usuario(request):
     Envía los IDs de los productos favoritos del usuario logueado.
     """
     if request.user.is_authenticated:
-        ids = Favorito.objects.filter(usuario=request.user).values_list('producto_id', flat=True)
-        return {'user_favoritos_ids': list(ids)}
-    return {'user_favoritos_ids': []}
\ No newline at end of file
+        usuario = request.user
+        return {'user_favoritos_ids': SimpleLazyObject(
+            lambda: list(Favorito.objects.filter(usuario=usuario).values_list('producto_id', flat=True))
+        )}
+    return {'user_favoritos_ids': []}
@@ -0,0 +1,135 @@
+"""
+Facetas de los listados (categoría, ofertas, ahorrames).
+
+De la bolsa base de productos se trae, en una sola consulta, una "foto" liviana
+por producto (marca, categoría, banderas de dieta y precio) y se guarda en la
+caché compartida con las versiones 'productos' y 'categorias' en la clave. Con
+esa foto se calculan en memoria todos los contadores del lateral:
+
+- marcas y subcategorías con su cantidad de productos,
+- cantidad Sin TACC / Vegano / Vegetariano,
+- límites del slider e histograma de precios,
+- el total de resultados (que usa el paginador en lugar de un COUNT).
+
+Cada faceta cuenta con todos los filtros activos menos el propio, así al marcar
+una marca las demás siguen mostrando cuántos productos sumarían.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from .versiones import obtener_version
+
+DURACION = 60 * 60  # las versiones invalidan antes; esto solo limpia claves viejas
+CUBETAS_PRECIO = 10
+
+# (parámetro GET, campo del modelo, etiqueta)
+DIETAS = [
+    ('sin_tacc', 'es_sin_tacc', 'Sin TACC'),
+    ('vegano', 'es_vegano', 'Vegano'),
+    ('vegetariano', 'es_vegetariano', 'Vegetariano'),
+]
+
+CAMPOS = ['marca__nombre', 'categoria_id', 'categoria__ruta'] + [campo for _, campo, _ in DIETAS] + ['precio_venta_actual']
+MARCA, CATEGORIA, RUTA, PRECIO = 0, 1, 2, len(CAMPOS) - 1
+POSICION_DIETA = {clave: 3 + i for i, (clave, _, _) in enumerate(DIETAS)}
+
+
+def foto_de(base, clave):
+    """Filas (marca, categoría, ruta, sin_tacc, vegano, vegetariano, precio) de la bolsa base, cacheadas por versión."""
+    clave_cache = f"facetas:{clave}:{obtener_version('productos')}:{obtener_version('categorias')}"
+    filas = cache.get(clave_cache)
+    if filas is None:
+        filas = list(base.order_by().values_list(*CAMPOS))
+        cache.set(clave_cache, filas, DURACION)
+    return filas
+
+
+class Facetas:
+    def __init__(self, filas, marcas=(), rutas=(), dietas=()):
+        self.filas = filas
+        self.marcas_sel = set(marcas)
+        self.rutas_sel = tuple(rutas)
+        self.dietas_sel = [POSICION_DIETA[d] for d in dietas if d in POSICION_DIETA]
+        self.rango = None
+
+    def aplicar_rango(self, desde, hasta):
+        self.rango = (Decimal(str(desde)), Decimal(str(hasta)))
+
+    def _pasa(self, fila, excepto=None):
+        if excepto != 'subcategoria' and self.rutas_sel and not (fila[RUTA] or '').startswith(self.rutas_sel):
+            return False
+        if excepto != 'marca' and self.marcas_sel and fila[MARCA] not in self.marcas_sel:
+            return False
+        if excepto != 'dieta' and not all(fila[i] for i in self.dietas_sel):
+            return False
+        if excepto != 'precio' and self.rango is not None:
+            if fila[PRECIO] is None or not (self.rango[0] <= fila[PRECIO] <= self.rango[1]):
+                return False
+        return True
+
+    def _filas(self, excepto=None):
+        return [f for f in self.filas if self._pasa(f, excepto)]
+
+    @property
+    def total(self):
+        return len(self._filas())
+
+    def categorias_ids(self):
+        """Categorías (directas) que tienen productos en la bolsa base."""
+        return {f[CATEGORIA] for f in self.filas}
+
+    def marcas(self):
+        """[(nombre, cantidad)] de las marcas presentes en las subcategorías elegidas."""
+        presentes = {
+            f[MARCA] for f in self.filas
+            if f[MARCA] and (not self.rutas_sel or (f[RUTA] or '').startswith(self.rutas_sel))
+        }
+        cantidades = dict.fromkeys(presentes, 0)
+        for f in self._filas(excepto='marca'):
+            if f[MARCA] in cantidades:
+                cantidades[f[MARCA]] += 1
+        return sorted(cantidades.items())
+
+    def subcategorias(self, categorias):
+        """[(categoria, cantidad)] contando también los productos de sus descendientes."""
+        filas = self._filas(excepto='subcategoria')
+        return [(c, sum(1 for f in filas if (f[RUTA] or '').startswith(c.ruta))) for c in categorias]
+
+    def dietas(self):
+        """[(clave, etiqueta, cantidad)] sobre el resultado con todos los filtros."""
+        filas = self._filas(excepto='dieta')
+        resultado = []
+        for clave, _, etiqueta in DIETAS:
+            i = POSICION_DIETA[clave]
+            marcadas = [p for p in self.dietas_sel if p != i]
+            resultado.append((clave, etiqueta, sum(1 for f in filas if f[i] and all(f[p] for p in marcadas))))
+        return resultado
+
+    def limites_precio(self):
+        """(mínimo, máximo) del precio con los demás filtros aplicados, o (None, None)."""
+        precios = [f[PRECIO] for f in self._filas(excepto='precio') if f[PRECIO] is not None]
+        if not precios:
+            return None, None
+        return min(precios), max(precios)
+
+    def histograma(self, cubetas=CUBETAS_PRECIO):
+        """Cubetas de igual ancho entre los límites: [{'desde', 'hasta', 'cantidad', 'altura'}]."""
+        minimo, maximo = self.limites_precio()
+        if minimo is None:
+            return []
+        ancho = (maximo - minimo) / cubetas or Decimal(1)
+        cantidades = [0] * cubetas
+        for f in self._filas(excepto='precio'):
+            if f[PRECIO] is not None:
+                cantidades[min(int((f[PRECIO] - minimo) / ancho), cubetas - 1)] += 1
+        mayor = max(cantidades) or 1
+        return [
+            {
+                'desde': minimo + ancho * i,
+                'hasta': minimo + ancho * (i + 1),
+                'cantidad': n,
+                'altura': round(100 * n / mayor),
+            }
+            for i, n in enumerate(cantidades)
+        ]
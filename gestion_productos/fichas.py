@@ -0,0 +1,50 @@
+"""
+Fichas livianas de producto (nombre, sku, precio, imagen) en la caché compartida.
+
+Los carritos en sesión (web, mostrador y transferencias) guardan solo
+{id: cantidad}; lo que se muestra se arma con estas fichas. La clave lleva la
+versión 'productos', así un cambio de nombre o de precio se ve en el próximo
+request sin tocar ninguna sesión, y un "+1" no necesita leer el producto de la base.
+"""
+from django.core.cache import cache
+
+from .models import Producto
+from .versiones import obtener_version
+
+DURACION = 60 * 60 * 24  # las versiones invalidan antes; esto solo limpia claves viejas
+
+
+def armar_ficha(producto):
+    return {
+        'producto_id': producto.pk,
+        'nombre': producto.nombre,
+        'sku': producto.sku or '',
+        'precio': str(producto.precio_actual()),
+        'imagen': producto.imagen_miniatura_url,
+    }
+
+
+def fichas_de(ids):
+    """{id: ficha} de los productos pedidos; los que no existen no aparecen."""
+    ids = {int(pk) for pk in ids}
+    if not ids:
+        return {}
+    version = obtener_version('productos')
+    claves = {f"ficha:{version}:{pk}": pk for pk in ids}
+    fichas = {claves[clave]: ficha for clave, ficha in cache.get_many(list(claves)).items()}
+
+    faltan = ids - fichas.keys()
+    if faltan:
+        nuevas = {
+            p.pk: armar_ficha(p)
+            for p in Producto.objects.filter(pk__in=faltan).only(
+                'nombre', 'sku', 'precio_venta_actual', 'imagen_principal', 'imagen_variantes'
+            )
+        }
+        cache.set_many({f"ficha:{version}:{pk}": ficha for pk, ficha in nuevas.items()}, DURACION)
+        fichas.update(nuevas)
+    return fichas
+
+
+def ficha_de(producto_id):
+    return fichas_de([producto_id]).get(int(producto_id))
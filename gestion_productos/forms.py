@@ -1,8 +1,74 @@
 ﻿from django import forms
+from django.conf import settings
 from django.forms import inlineformset_factory
+from django.forms.models import ModelChoiceIterator, ModelChoiceIteratorValue
 from .models import Producto, Categoria, Marca, ImagenProducto, HistorialPrecio
+from .navegacion import rutas_categorias
 from gestion_sucursales.models import Stock
 
+
+# --- SELECTOR DE CATEGORÍAS ---
+
+class IteradorCategorias(ModelChoiceIterator):
+    """Opciones (id, "Abuelo > Padre > Hijo") desde las rutas cacheadas: sin consultas por opción."""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for pk, ruta in rutas_categorias().items():
+            yield (ModelChoiceIteratorValue(pk, None), ruta)
+
+    def __len__(self):
+        return len(rutas_categorias()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(rutas_categorias())
+
+
+class SelectCategoria(forms.Select):
+    """
+    Select de categorías. Con más de CATEGORIAS_MAX_SELECT opciones solo lleva la elegida
+    y se marca con data-buscador: el template pone al lado el buscador AJAX
+    (buscar_categorias_marcas_ajax) que agrega la opción al elegir.
+    """
+
+    def get_context(self, name, value, attrs):
+        if CategoriaChoiceField.demasiadas(len(self.choices)):
+            attrs = {**(attrs or {}), 'data-buscador': 'categoria'}
+        return super().get_context(name, value, attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        todas = self.choices
+        if CategoriaChoiceField.demasiadas(len(todas)):
+            elegidas = {str(v) for v in value}
+            self.choices = [(pk, ruta) for pk, ruta in todas if str(pk) in elegidas or pk == '']
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = todas
+
+
+class CategoriaChoiceField(forms.ModelChoiceField):
+    """
+    Categoría con su ruta completa como etiqueta, para los formularios de productos.
+    Categoria.__str__ consulta los ancestros de cada opción; acá todas las rutas salen
+    de navegacion.rutas_categorias() (una consulta por versión de 'categorias').
+    Valida contra todas las categorías: no admite un queryset filtrado.
+    """
+    iterator = IteradorCategorias
+    widget = SelectCategoria
+
+    def __init__(self, queryset=None, **kwargs):
+        super().__init__(queryset if queryset is not None else Categoria.objects.all(), **kwargs)
+
+    @staticmethod
+    def demasiadas(opciones):
+        return opciones > getattr(settings, 'CATEGORIAS_MAX_SELECT', 500)
+
+    @property
+    def usa_buscador(self):
+        return self.demasiadas(len(rutas_categorias()))
+
 class ProductoCargaForm(forms.ModelForm):
     # Campos extra
     precio_venta = forms.DecimalField(
@@ -33,6 +99,7 @@ class ProductoCargaForm(forms.ModelForm):
             'especificaciones', 'imagen_principal',
             'esta_activo', 'exclusivo_online', 'ahorrames'
         ]
+        field_classes = {'categoria': CategoriaChoiceField}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1,5 +1,6 @@
 from django import forms
-from .models import Producto, Categoria, Marca
+from .forms import CategoriaChoiceField, SelectCategoria
+from .models import Producto, Marca
 
 class MultipleFileInput(forms.ClearableFileInput):
     allow_multiple_selected = True
@@ -18,11 +19,10 @@ class MultipleFileField(forms.FileField):
         return result
 
 class UploadBatchForm(forms.Form):
-    categoria = forms.ModelChoiceField(
-        queryset=Categoria.objects.all(),
+    categoria = CategoriaChoiceField(
         label="Categoría Global",
         help_text="Se aplicará a todos los productos cargados.",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=SelectCategoria(attrs={'class': 'form-control'})
     )
     tipo_envase = forms.ChoiceField(
         choices=Producto.TIPO_ENVASE_CHOICES,
@@ -77,3 +77,18 @@ ProductoBatchFormSet = forms.modelformset_factory(
     form=ProductoBatchForm,
     extra=0
 )
+
+class ImportarCatalogoForm(forms.Form):
+    archivo = forms.FileField(
+        label="Archivo del catálogo",
+        help_text="CSV o XLSX con columnas sku, nombre, marca, categoria, precio_venta (y opcionales: precio_regular, "
+                  "precio_costo, codigo_barras, descripcion_breve, unidad_medida, contenido_neto, peso_kg, esta_activo, "
+                  "imagen, stock:<Sucursal>).",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'})
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.txt', '.xlsx', '.xlsm')):
+            raise forms.ValidationError("Formato no soportado: usá un .csv o un .xlsx.")
+        return archivo
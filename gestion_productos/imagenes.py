@@ -0,0 +1,359 @@
+"""
+Procesamiento de imágenes de producto: variantes de ancho fijo (160/320/640/1280
+px, en WebP y JPEG) para servir con srcset, generadas en paralelo.
+
+Una imagen pasa por tres etapas y cada una usa la herramienta que le conviene:
+
+1. Descarga del storage a un directorio local (hilos: es espera de red).
+2. Redimensionado con Pillow (procesos: es CPU y el GIL frenaría los hilos).
+   Los procesos se arrancan con 'spawn' y no con fork: el worker web tiene
+   hilos y un fork copiaría sus locks tomados.
+3. Subida del original y de las variantes a MediaStorage (hilos otra vez).
+   Si una subida falla se borra lo que ya se había subido antes de propagar el error.
+
+Las variantes quedan en `Producto.imagen_variantes` / `ImagenProducto.variantes`
+como {'origen': nombre de la imagen, 'webp160': nombre, 'jpg160': nombre, ...}.
+No se agranda: de una foto de 500 px salen 160, 320 y una de 500 (su ancho real).
+Al guardar un producto o una imagen de galería con una imagen nueva, las
+variantes se generan cuando la transacción se confirma (generar_al_confirmar):
+todas las imágenes pendientes de la transacción (un producto con su galería)
+pasan juntas por un solo procesar_imagenes(), así usan los pools.
+Mientras tanto 'origen' no coincide y se usa la imagen original. Si no se pudieron
+generar (storage caído, archivo que Pillow no entiende) queda {'origen': ...,
+'fallida': True} para no reintentarlo en cada guardado; el comando
+generar_variantes_imagenes completa las que falten, incluidas esas.
+
+Los templates las usan con {% imagen_responsive %} (templatetags/custom_tags.py).
+
+Este módulo no importa modelos a nivel de módulo: los procesos del pool lo
+importan para correr generar_variantes().
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+ANCHOS = (160, 320, 640, 1280)
+# Formato -> (nombre en Pillow, opciones de guardado)
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+# Variantes con nombre propio para un solo tamaño
+ALIAS = {
+    'miniatura': 'webp160',
+    'tarjeta': 'webp320',
+}
+CARPETA_VARIANTES = 'productos/variantes'
+FALLIDA = 'fallida'
+TROZO = 64 * 1024
+
+
+def guardar_temporal(archivo, carpeta='temp_batch'):
+    """Guarda un archivo subido en el storage sin leerlo entero en memoria (el storage lo copia por trozos)."""
+    return default_storage.save(f"{carpeta}/{uuid.uuid4()}_{archivo.name}", archivo)
+
+
+def guardar_temporales(archivos, carpeta='temp_batch'):
+    """guardar_temporal() de varios archivos a la vez. Devuelve los nombres en el mismo orden."""
+    return _mapa(getattr(settings, 'IMAGENES_HILOS', 8), guardar_temporal, archivos, [carpeta] * len(archivos))
+
+
+def vigentes(imagen, variantes):
+    """Las variantes si corresponden a la imagen actual, si no {}."""
+    if imagen and variantes and variantes.get('origen') == imagen.name:
+        return variantes
+    return {}
+
+
+def _anchos(variantes, formato):
+    """Anchos disponibles de un formato, de menor a mayor."""
+    return sorted(int(k[len(formato):]) for k in variantes if k.startswith(formato) and k[len(formato):].isdigit())
+
+
+def url_variante(imagen, variantes, nombre):
+    """URL de la variante si corresponde a la imagen actual; si no, la de la imagen original."""
+    if not imagen:
+        return ''
+    nombre = ALIAS.get(nombre, nombre)
+    variantes = vigentes(imagen, variantes)
+    if nombre in variantes:
+        return imagen.storage.url(variantes[nombre])
+    # Sin ese ancho exacto (foto más chica): la variante más grande del mismo formato
+    formato = nombre.rstrip('0123456789')
+    anchos = _anchos(variantes, formato)
+    if anchos:
+        return imagen.storage.url(variantes[f"{formato}{anchos[-1]}"])
+    return imagen.url
+
+
+def srcset(imagen, variantes, formato, maximo=None):
+    """'url 160w, url 320w, ...' de las variantes vigentes en ese formato ('' si no hay)."""
+    variantes = vigentes(imagen, variantes)
+    anchos = _anchos(variantes, formato)
+    if maximo:
+        anchos = [ancho for ancho in anchos if ancho <= maximo] or anchos[:1]
+    return ', '.join(f"{imagen.storage.url(variantes[f'{formato}{ancho}'])} {ancho}w" for ancho in anchos)
+
+
+def completas(imagen, variantes):
+    """¿Están todas las variantes de la imagen actual? (las de versiones anteriores no cuentan)"""
+    variantes = vigentes(imagen, variantes)
+    return bool(variantes) and all(f"{formato}{ANCHOS[0]}" in variantes for formato in FORMATOS)
+
+
+# --- Etapa 2: Pillow (corre en los procesos del pool) ---
+
+def generar_variantes(ruta, carpeta):
+    """Genera las variantes de `ruta` en `carpeta`. Devuelve {'webp160': ruta local, ...}."""
+    from PIL import Image, ImageOps
+
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    generadas = {}
+    with Image.open(ruta) as original:
+        imagen = ImageOps.exif_transpose(original)
+        transparente = 'A' in imagen.getbands() or 'transparency' in imagen.info
+        imagen = imagen.convert('RGBA' if transparente else 'RGB')
+        # JPEG no tiene transparencia: fondo blanco, como se ven las fotos en las tarjetas
+        opaca = imagen
+        if transparente:
+            opaca = Image.new('RGB', imagen.size, (255, 255, 255))
+            opaca.paste(imagen, mask=imagen.getchannel('A'))
+
+        # Nunca se agranda: los anchos mayores que el original se reemplazan por el ancho real
+        anchos = sorted({min(ancho, imagen.width) for ancho in ANCHOS})
+        for ancho in anchos:
+            alto = max(1, round(imagen.height * ancho / imagen.width))
+            for formato, (formato_pil, opciones) in FORMATOS.items():
+                fuente = imagen if formato == 'webp' else opaca
+                copia = fuente.resize((ancho, alto), Image.Resampling.LANCZOS) if ancho != imagen.width else fuente
+                destino = os.path.join(carpeta, f"{base}_{ancho}.{formato}")
+                copia.save(destino, formato_pil, **opciones)
+                generadas[f"{formato}{ancho}"] = destino
+    return generadas
+
+
+def _generar_seguro(ruta, carpeta):
+    try:
+        return generar_variantes(ruta, carpeta)
+    except Exception as e:
+        # Un archivo que Pillow no entiende se sube igual, solo que sin variantes
+        logger.warning(f"[Imágenes] No se pudieron generar variantes de {ruta}: {e}")
+        return {}
+
+
+# --- Etapas 1 y 3: storage (hilos) ---
+
+def _descargar(nombre, carpeta):
+    destino = os.path.join(carpeta, f"{uuid.uuid4().hex}{os.path.splitext(nombre)[1].lower()}")
+    try:
+        with default_storage.open(nombre, 'rb') as origen, open(destino, 'wb') as salida:
+            shutil.copyfileobj(origen, salida, TROZO)
+    except (OSError, ValueError) as e:
+        logger.warning(f"[Imágenes] No se pudo leer {nombre} del storage: {e}")
+        return None
+    return destino
+
+
+def _subir(ruta, nombre):
+    with open(ruta, 'rb') as f:
+        return default_storage.save(nombre, File(f))
+
+
+class _Subidas:
+    """Lo que ya se escribió en el storage desde los hilos, para limpiarlo si alguna subida falla."""
+
+    def __init__(self):
+        self.nombres = []
+        self._lock = threading.Lock()
+
+    def subir(self, ruta, nombre):
+        guardado = _subir(ruta, nombre)
+        with self._lock:
+            self.nombres.append(guardado)
+        return guardado
+
+
+def _mapa(hilos, funcion, *listas):
+    """
+    map() repartido en `hilos` hilos, con los resultados en el orden de entrada.
+    Cada hilo procesa una tanda y al terminar cierra su conexión a la base: el
+    índice de media (MediaStorage.save) escribe desde acá, fuera del request.
+    """
+    argumentos = list(zip(*listas))
+    if hilos <= 1 or len(argumentos) <= 1:
+        return [funcion(*a) for a in argumentos]
+
+    def tanda(desde):
+        try:
+            return [funcion(*a) for a in argumentos[desde::hilos]]
+        finally:
+            connections.close_all()
+
+    resultado = [None] * len(argumentos)
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        for desde, valores in enumerate(pool.map(tanda, range(min(hilos, len(argumentos))))):
+            resultado[desde::hilos] = valores
+    return resultado
+
+
+def procesar_imagenes(origenes, destinos=None):
+    """
+    origenes: {clave: nombre en el storage}. destinos: {clave: nombre final} si además hay
+    que copiar el original (la carga masiva sube desde temp_batch/); sin destinos solo se
+    generan variantes de imágenes que ya están en su lugar.
+
+    Devuelve {clave: {'imagen': nombre final, 'variantes': {...}, 'subidos': [...]}}, con
+    'subidos' = lo que se escribió en el storage (para descartarlo si algo falla después).
+    """
+    if not origenes:
+        return {}
+    destinos = destinos or {}
+    claves = list(origenes)
+    hilos = getattr(settings, 'IMAGENES_HILOS', 8)
+    procesos = getattr(settings, 'IMAGENES_PROCESOS', 2)
+
+    carpeta = tempfile.mkdtemp(prefix='imagenes_')
+    try:
+        # 1. Descargas en paralelo (lo que no se puede leer queda afuera del resultado)
+        descargas = _mapa(hilos, _descargar, [origenes[c] for c in claves], [carpeta] * len(claves))
+        claves = [c for c, local in zip(claves, descargas) if local]
+        locales = [local for local in descargas if local]
+
+        # 2. Pillow en un pool de procesos (en línea si es una sola imagen o no hay procesos configurados)
+        if procesos > 1 and len(locales) > 1:
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=min(procesos, len(locales)), mp_context=contexto) as pool:
+                generadas = list(pool.map(_generar_seguro, locales, [carpeta] * len(locales)))
+        else:
+            generadas = [_generar_seguro(ruta, carpeta) for ruta in locales]
+
+        # 3. Subidas en paralelo, archivo por archivo: el original (si hay destino) y cada
+        # variante. Si una falla, no queda nada a medias en el storage.
+        tareas = []  # (clave, variante o None para el original, ruta local, nombre en el storage)
+        for clave, local, variantes in zip(claves, locales, generadas):
+            destino = destinos.get(clave)
+            if destino:
+                tareas.append((clave, None, local, destino))
+            base = os.path.splitext(os.path.basename(destino or origenes[clave]))[0]
+            for nombre, ruta in variantes.items():
+                sufijo = os.path.basename(ruta).rsplit('_', 1)[1]
+                tareas.append((clave, nombre, ruta, f"{CARPETA_VARIANTES}/{base}_{uuid.uuid4().hex[:8]}_{sufijo}"))
+        registro = _Subidas()
+        try:
+            guardados = _mapa(hilos, registro.subir, [t[2] for t in tareas], [t[3] for t in tareas])
+        except Exception:
+            descartar({None: {'subidos': registro.nombres}})
+            raise
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    copiadas, subidas = {}, {clave: {} for clave in claves}
+    for (clave, variante, _, _), guardado in zip(tareas, guardados):
+        if variante is None:
+            copiadas[clave] = guardado
+        else:
+            subidas[clave][variante] = guardado
+
+    resultado = {}
+    for clave in claves:
+        imagen, variantes = copiadas.get(clave) or origenes[clave], subidas[clave]
+        resultado[clave] = {
+            'imagen': imagen,
+            'variantes': dict(variantes, origen=imagen) if variantes else {},
+            'subidos': ([copiadas[clave]] if clave in copiadas else []) + list(variantes.values()),
+        }
+    return resultado
+
+
+def descartar(resultado):
+    """Borra del storage lo subido por procesar_imagenes() (si la transacción posterior falló)."""
+    for datos in resultado.values():
+        for nombre in datos['subidos']:
+            try:
+                default_storage.delete(nombre)
+            except Exception:
+                pass  # Ignoramos errores de limpieza
+
+
+class _Pendientes(list):
+    """
+    Imágenes sin variantes guardadas en la transacción actual: [(objeto, campo, campo_variantes, nombre)].
+    Es el callback de on_commit de la transacción, registrado una sola vez.
+    """
+    ejecutada = False
+
+    def __call__(self):
+        self.ejecutada = True
+        generar_pendientes(self)
+
+
+def _pendientes_de(conexion):
+    """La lista de la transacción en curso, registrada en on_commit la primera vez."""
+    pendientes = getattr(conexion, '_imagenes_pendientes', None)
+    # Ya corrió, o un rollback (también el de un savepoint) descartó su callback: lista nueva
+    if pendientes is None or pendientes.ejecutada or not any(f is pendientes for _, f, _ in conexion.run_on_commit):
+        pendientes = conexion._imagenes_pendientes = _Pendientes()
+        transaction.on_commit(pendientes, using=conexion.alias, robust=True)
+    return pendientes
+
+
+def generar_al_confirmar(objeto, campo, campo_variantes):
+    """
+    Si la imagen de `objeto` no tiene sus variantes, la anota para generarlas cuando la
+    transacción actual se confirme, junto con las demás imágenes de la misma transacción.
+    Fuera de una transacción se generan en el momento.
+    """
+    imagen = getattr(objeto, campo)
+    variantes = vigentes(imagen, getattr(objeto, campo_variantes))
+    if not imagen or completas(imagen, variantes) or variantes.get(FALLIDA):
+        return
+    pendiente = (objeto, campo, campo_variantes, imagen.name)
+    conexion = transaction.get_connection(objeto._state.db or 'default')
+    if not conexion.in_atomic_block:
+        generar_pendientes([pendiente])
+        return
+    _pendientes_de(conexion).append(pendiente)
+
+
+def generar_pendientes(pendientes):
+    """
+    Genera las variantes de [(objeto, campo, campo_variantes, nombre)] con un solo
+    procesar_imagenes() y las guarda con un UPDATE por imagen (sin volver a disparar save()).
+
+    El guardado ya está confirmado cuando esto corre: un error acá solo se registra
+    y las imágenes quedan marcadas como fallidas (para esa misma imagen), así el
+    próximo save() no vuelve a intentarlo.
+    """
+    # Un objeto guardado dos veces en la transacción: cuenta su última imagen
+    por_objeto = {(type(p[0]), p[0].pk, p[1]): p for p in pendientes}
+    try:
+        resultado = procesar_imagenes({clave: nombre for clave, (_, _, _, nombre) in por_objeto.items()})
+    except Exception as e:
+        nombres = ', '.join(nombre for _, _, _, nombre in por_objeto.values())
+        logger.warning(f"[Imágenes] No se pudieron generar las variantes de {nombres}: {e}")
+        resultado = {}
+
+    hay_nuevas = False
+    for clave, (objeto, campo, campo_variantes, nombre) in por_objeto.items():
+        nuevas = resultado.get(clave, {}).get('variantes') or {'origen': nombre, FALLIDA: True}
+        # Solo si la imagen sigue siendo la misma (otro guardado pudo reemplazarla)
+        type(objeto).objects.filter(pk=objeto.pk, **{campo: nombre}).update(**{campo_variantes: nuevas})
+        # También en la instancia, para que un save() posterior de la misma no las pise
+        if getattr(objeto, campo).name == nombre:
+            setattr(objeto, campo_variantes, nuevas)
+        hay_nuevas = hay_nuevas or not nuevas.get(FALLIDA)
+    if hay_nuevas:
+        from .versiones import incrementar_version
+        incrementar_version('productos')
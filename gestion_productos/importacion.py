@@ -0,0 +1,429 @@
+"""
+Importación masiva del catálogo desde CSV o XLSX.
+
+El archivo se lee por lotes (pandas para CSV, openpyxl en modo read_only para
+XLSX), así nunca está entero en memoria. Cada lote se valida contra diccionarios
+de marcas, categorías y sucursales cargados una sola vez y se guarda en una
+transacción con un puñado de consultas, sin importar cuántas filas traiga:
+
+1. Productos: upsert por SKU con bulk_create(update_conflicts=True). Solo se
+   pisan las columnas que trae el archivo.
+2. Precios: un HistorialPrecio nuevo (y el anterior deja de ser vigente) solo si
+   el precio cambió. Las columnas desnormalizadas del producto van en el upsert.
+   Sin columna precio_regular se conserva el regular vigente (y con él la oferta).
+3. Stock: columnas "stock:<Sucursal>" con la cantidad absoluta. Se hace upsert
+   de Stock y la diferencia queda registrada como MovimientoStock (ENT o AJU).
+
+Las filas con errores no frenan la importación: se informan en un reporte CSV
+(fila, sku, error).
+
+Columnas: sku, nombre, marca, categoria y precio_venta son obligatorias (el SKU
+es la clave del upsert: sin él no hay cómo saber si la fila es un producto nuevo);
+precio_regular, precio_costo, codigo_barras, descripcion_breve, unidad_medida,
+contenido_neto, peso_kg, esta_activo, imagen y stock:<Sucursal> son opcionales.
+La categoría se acepta por slug, por camino completo ("Almacén > Aceites") o por
+nombre si no es ambiguo. Los números aceptan "1500.50" o el formato local
+"1.500,50"; "1.500" (punto solo, en grupos de a tres) es ambiguo y se rechaza.
+"""
+import csv
+import io
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from gestion_sucursales.models import MovimientoStock, Stock, Sucursal
+from .models import Categoria, HistorialPrecio, Marca, Producto
+from .search import actualizar_vectores, normalizar_texto
+from .versiones import invalidar_al_confirmar
+
+LOTE = 2000
+OBLIGATORIAS = ['sku', 'nombre', 'marca', 'categoria', 'precio_venta']
+OPCIONALES = [
+    'precio_regular', 'precio_costo', 'codigo_barras', 'descripcion_breve', 'unidad_medida',
+    'contenido_neto', 'peso_kg', 'esta_activo', 'imagen',
+]
+PREFIJO_STOCK = 'stock:'
+UNIDADES = {codigo for codigo, _ in Producto.UNIDADES_MEDIDA_CHOICES}
+# "1.500" o "12.345.678": puede ser un separador de miles o de decimales
+MILES_CON_PUNTO = re.compile(r'^-?[1-9]\d{0,2}(\.\d{3})+$')
+VERDADERO = {'1', 'si', 'sí', 's', 'true', 'verdadero', 'x'}
+FALSO = {'0', 'no', 'n', 'false', 'falso', ''}
+
+
+class ImportacionError(ValueError):
+    """El archivo no se puede importar (formato o encabezados inválidos)."""
+
+
+# --- Lectura por lotes ---
+
+def _leer_csv(archivo, lote):
+    import pandas as pd
+
+    # Separador: Excel en español suele exportar con ';'
+    muestra = archivo.read(4096)
+    archivo.seek(0)
+    if isinstance(muestra, bytes):
+        muestra = muestra.decode('utf-8-sig', errors='ignore')
+    separador = ';' if muestra.count(';') > muestra.count(',') else ','
+
+    lector = pd.read_csv(archivo, sep=separador, dtype=str, keep_default_na=False, chunksize=lote, encoding='utf-8-sig')
+    for bloque in lector:
+        yield bloque.to_dict('records')
+
+
+def _celda(valor):
+    """Las celdas numéricas de Excel no son ambiguas: llegan como Decimal y no como texto."""
+    if valor is None:
+        return ''
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return Decimal(str(valor))
+    return str(valor)
+
+
+def _leer_xlsx(archivo, lote):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportacionError("Para importar archivos .xlsx hace falta el paquete openpyxl.")
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezados = [str(c).strip() if c is not None else '' for c in next(filas, ())]
+        bloque = []
+        for valores in filas:
+            if not any(v not in (None, '') for v in valores):
+                continue
+            bloque.append({encabezado: _celda(valor) for encabezado, valor in zip(encabezados, valores)})
+            if len(bloque) == lote:
+                yield bloque
+                bloque = []
+        if bloque:
+            yield bloque
+    finally:
+        libro.close()
+
+
+def leer_por_lotes(archivo, nombre, lote=LOTE):
+    """Lotes de filas {encabezado: texto} según la extensión del archivo."""
+    if nombre.lower().endswith(('.xlsx', '.xlsm')):
+        return _leer_xlsx(archivo, lote)
+    if nombre.lower().endswith(('.csv', '.txt')):
+        return _leer_csv(archivo, lote)
+    raise ImportacionError("Formato no soportado: usá un .csv o un .xlsx.")
+
+
+# --- Validación ---
+
+def _decimal(texto):
+    if isinstance(texto, Decimal):
+        return texto
+    texto = str(texto).strip().replace('$', '').replace(' ', '')
+    if not texto:
+        return None
+    if ',' in texto:
+        # Formato local: 1.234,56
+        texto = texto.replace('.', '').replace(',', '.')
+    elif MILES_CON_PUNTO.match(texto):
+        raise ValueError(f"'{texto}' es ambiguo: usá {texto.replace('.', '')} o {texto},00 si es separador de miles")
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"'{texto}' no es un número")
+
+
+def _booleano(texto):
+    texto = str(texto).strip().lower()
+    if texto in VERDADERO:
+        return True
+    if texto in FALSO:
+        return False
+    raise ValueError(f"'{texto}' no es sí/no")
+
+
+class Diccionarios:
+    """Marcas, categorías y sucursales cargadas una sola vez para todo el archivo."""
+
+    def __init__(self):
+        self.marcas = {nombre.lower(): (pk, nombre) for pk, nombre in Marca.objects.values_list('id', 'nombre')}
+
+        categorias = list(Categoria.objects.all())
+        self.rutas = Categoria.rutas_completas(categorias)
+        self.categorias = {}
+        nombres = {}
+        for c in categorias:
+            self.categorias[c.slug.lower()] = c.pk
+            self.categorias[self.rutas[c.pk].lower()] = c.pk
+            nombres.setdefault(c.nombre.lower(), []).append(c.pk)
+        for nombre, ids in nombres.items():
+            # Un nombre repetido en distintas ramas es ambiguo: hay que usar el camino completo
+            self.categorias.setdefault(nombre, ids[0] if len(ids) == 1 else None)
+
+        self.sucursales = {nombre.lower(): pk for pk, nombre in Sucursal.objects.values_list('id', 'nombre')}
+
+    def categoria(self, texto):
+        clave = ' > '.join(parte.strip() for parte in str(texto).split('>')).lower()
+        if clave not in self.categorias:
+            raise ValueError(f"Categoría '{texto}' inexistente")
+        if self.categorias[clave] is None:
+            raise ValueError(f"Categoría '{texto}' ambigua: usá el camino completo (Padre > Hija)")
+        return self.categorias[clave]
+
+    def marca(self, texto):
+        encontrada = self.marcas.get(str(texto).strip().lower())
+        if encontrada is None:
+            raise ValueError(f"Marca '{texto}' inexistente")
+        return encontrada
+
+
+def columnas_del_archivo(encabezados, diccionarios):
+    """Valida los encabezados. Devuelve (opcionales presentes, {columna stock: sucursal_id})."""
+    encabezados = [e.strip().lower() for e in encabezados]
+    faltan = [c for c in OBLIGATORIAS if c not in encabezados]
+    if faltan:
+        raise ImportacionError(f"Faltan columnas obligatorias: {', '.join(faltan)}")
+    stock = {}
+    for e in encabezados:
+        if e.startswith(PREFIJO_STOCK):
+            nombre = e[len(PREFIJO_STOCK):].strip()
+            if nombre not in diccionarios.sucursales:
+                raise ImportacionError(f"Columna '{e}': la sucursal '{nombre}' no existe")
+            stock[e] = diccionarios.sucursales[nombre]
+    return [c for c in OPCIONALES if c in encabezados], stock
+
+
+def validar_fila(fila, opcionales, columnas_stock, diccionarios):
+    """Devuelve los datos limpios de la fila o levanta ValueError con el motivo."""
+    # Los números se leen del valor original (las celdas numéricas de Excel llegan como Decimal)
+    crudos = {str(k).strip().lower(): v for k, v in fila.items()}
+    fila = {k: str(v).strip() for k, v in crudos.items()}
+    for columna in OBLIGATORIAS:
+        if not fila.get(columna):
+            raise ValueError(f"Falta '{columna}'")
+
+    marca_id, marca_nombre = diccionarios.marca(fila['marca'])
+    datos = {
+        'sku': fila['sku'],
+        'nombre': fila['nombre'][:200],
+        'marca_id': marca_id,
+        'marca_nombre': marca_nombre,
+        'categoria_id': diccionarios.categoria(fila['categoria']),
+        'precio_venta': _decimal(crudos['precio_venta']),
+        'stock': {},
+    }
+    if datos['precio_venta'] is None or datos['precio_venta'] < 0:
+        raise ValueError("precio_venta inválido")
+    for columna in ('precio_regular', 'precio_costo', 'peso_kg'):
+        if columna in opcionales:
+            datos[columna] = _decimal(crudos[columna])
+    for columna in ('codigo_barras', 'descripcion_breve', 'contenido_neto', 'imagen'):
+        if columna in opcionales:
+            datos[columna] = fila[columna]
+    if 'unidad_medida' in opcionales:
+        unidad = fila['unidad_medida'].upper() or 'UN'
+        if unidad not in UNIDADES:
+            raise ValueError(f"unidad_medida '{fila['unidad_medida']}' inválida")
+        datos['unidad_medida'] = unidad
+    if 'esta_activo' in opcionales:
+        datos['esta_activo'] = _booleano(fila['esta_activo'])
+    for columna, sucursal_id in columnas_stock.items():
+        if fila.get(columna, '') != '':
+            cantidad = _decimal(crudos[columna])
+            if cantidad is None or cantidad < 0 or cantidad != int(cantidad):
+                raise ValueError(f"{columna}: cantidad inválida")
+            datos['stock'][sucursal_id] = int(cantidad)
+    return datos
+
+
+# --- Guardado de un lote ---
+
+def _producto_de(datos, diccionarios, ahora, peso_anterior=None, regular_anterior=None):
+    if 'precio_regular' in datos:
+        # Columna presente: vacía significa sin oferta
+        precio_regular = datos['precio_regular'] or datos['precio_venta']
+    else:
+        # Sin columna se conserva el regular vigente, salvo que el precio nuevo lo supere
+        precio_regular = max(regular_anterior or 0, datos['precio_venta'])
+    # Sin columna peso_kg se respeta el peso cargado (para recalcular el precio por unidad)
+    peso = datos['peso_kg'] if 'peso_kg' in datos else peso_anterior
+    peso = peso or Decimal(0)
+    producto = Producto(
+        sku=datos['sku'],
+        nombre=datos['nombre'],
+        slug=slugify(f"{datos['nombre']}-{datos['sku']}")[:250],
+        marca_id=datos['marca_id'],
+        categoria_id=datos['categoria_id'],
+        codigo_barras=datos.get('codigo_barras') or None,
+        descripcion_breve=(datos.get('descripcion_breve') or datos['nombre'])[:255],
+        contenido_neto=datos.get('contenido_neto') or None,
+        unidad_medida=datos.get('unidad_medida', 'UN'),
+        peso_kg=peso,
+        esta_activo=datos.get('esta_activo', True),
+        imagen_principal=datos.get('imagen', ''),
+        precio_venta_actual=datos['precio_venta'],
+        precio_regular_actual=precio_regular,
+        descuento_actual=Producto.calcular_descuento(datos['precio_venta'], precio_regular),
+        precio_por_unidad_medida=round(datos['precio_venta'] / peso, 2) if peso > 0 else None,
+        creado_el=ahora,
+        actualizado_el=ahora,
+    )
+    # Mismo texto que arma texto_busqueda_para(), sin consultar marca ni categoría
+    producto.texto_busqueda = normalizar_texto(' '.join(p for p in [
+        producto.nombre, datos['marca_nombre'], diccionarios.rutas.get(producto.categoria_id, ''),
+        producto.descripcion_breve, producto.codigo_barras, producto.sku,
+    ] if p))
+    return producto
+
+
+def campos_a_actualizar(opcionales):
+    """Columnas que el upsert pisa en productos existentes: solo las que trae el archivo."""
+    campos = [
+        'nombre', 'marca', 'categoria', 'texto_busqueda', 'actualizado_el',
+        'precio_venta_actual', 'precio_regular_actual', 'descuento_actual', 'precio_por_unidad_medida',
+    ]
+    for columna in ('codigo_barras', 'descripcion_breve', 'contenido_neto', 'unidad_medida', 'esta_activo'):
+        if columna in opcionales:
+            campos.append(columna)
+    if 'peso_kg' in opcionales:
+        campos.append('peso_kg')
+    if 'imagen' in opcionales:
+        campos.append('imagen_principal')
+    return campos
+
+
+def guardar_lote(validas, opcionales, diccionarios, usuario=None):
+    """
+    Guarda las filas ya validadas [(nro_fila, datos)] de un lote.
+    Devuelve (creados, actualizados).
+    """
+    ahora = timezone.now()
+    skus = [datos['sku'] for _, datos in validas]
+    with transaction.atomic():
+        # 1. Estado anterior: qué existe y con qué precio
+        existentes = {
+            sku: (pk, venta, regular, peso)
+            for sku, pk, venta, regular, peso in Producto.objects.filter(sku__in=skus).values_list(
+                'sku', 'id', 'precio_venta_actual', 'precio_regular_actual', 'peso_kg'
+            )
+        }
+
+        # 2. Upsert de productos por SKU
+        productos = []
+        for _, datos in validas:
+            _, _, regular, peso = existentes.get(datos['sku'], (None,) * 4)
+            productos.append(_producto_de(datos, diccionarios, ahora, peso, regular))
+        Producto.objects.bulk_create(
+            productos, batch_size=500, update_conflicts=True,
+            unique_fields=['sku'], update_fields=campos_a_actualizar(opcionales),
+        )
+        ids = dict(Producto.objects.filter(sku__in=skus).values_list('sku', 'id'))
+
+        # 3. Historial de precios: solo los productos nuevos o con precio distinto
+        cambiados = [
+            p for p in productos
+            if p.sku not in existentes or existentes[p.sku][1:3] != (p.precio_venta_actual, p.precio_regular_actual)
+        ]
+        if cambiados:
+            HistorialPrecio.objects.filter(producto_id__in=[ids[p.sku] for p in cambiados], es_actual=True).update(es_actual=False)
+            costos = {datos['sku']: datos.get('precio_costo') for _, datos in validas}
+            HistorialPrecio.objects.bulk_create([
+                HistorialPrecio(
+                    producto_id=ids[p.sku], precio_venta=p.precio_venta_actual, precio_regular=p.precio_regular_actual,
+                    precio_costo=costos.get(p.sku), es_actual=True,
+                )
+                for p in cambiados
+            ], batch_size=500)
+
+        # 4. Stock absoluto por sucursal + movimiento por la diferencia
+        pedidos = {(ids[datos['sku']], s): c for _, datos in validas for s, c in datos['stock'].items()}
+        if pedidos:
+            anteriores = {
+                (producto_id, sucursal_id): cantidad
+                for producto_id, sucursal_id, cantidad in Stock.objects.filter(
+                    producto_id__in={p for p, _ in pedidos}, sucursal_id__in={s for _, s in pedidos}
+                ).values_list('producto_id', 'sucursal_id', 'cantidad')
+            }
+            Stock.objects.bulk_create(
+                [Stock(producto_id=p, sucursal_id=s, cantidad=c) for (p, s), c in pedidos.items()],
+                batch_size=500, update_conflicts=True, unique_fields=['producto', 'sucursal'], update_fields=['cantidad'],
+            )
+            movimientos = []
+            for (p, s), cantidad in pedidos.items():
+                diferencia = cantidad - anteriores.get((p, s), 0)
+                if diferencia:
+                    tipo = 'ENT' if diferencia > 0 else 'AJU'
+                    movimientos.append(MovimientoStock(
+                        producto_id=p, sucursal_id=s, tipo=tipo, usuario=usuario,
+                        cantidad=MovimientoStock.cantidad_con_signo(tipo, diferencia),
+                        observaciones="Importación de catálogo",
+                    ))
+            MovimientoStock.objects.bulk_create(movimientos, batch_size=500)
+
+        # 5. bulk_create no dispara señales: búsqueda e índices a mano
+        actualizar_vectores(list(ids.values()))
+        invalidar_al_confirmar('productos')
+
+    creados = sum(1 for sku in skus if sku not in existentes)
+    return creados, len(skus) - creados
+
+
+# --- Orquestación ---
+
+def importar_catalogo(archivo, nombre, lote=LOTE, usuario=None, al_avanzar=None):
+    """
+    Importa el archivo completo. Devuelve {'filas', 'creados', 'actualizados', 'errores'}
+    con errores = [(nro_fila, sku, mensaje)]. `al_avanzar(resumen)` se llama tras cada lote.
+    """
+    diccionarios = Diccionarios()
+    resumen = {'filas': 0, 'creados': 0, 'actualizados': 0, 'errores': []}
+    opcionales = columnas_stock = None
+    nro_fila = 1  # la 1 es el encabezado
+
+    for bloque in leer_por_lotes(archivo, nombre, lote):
+        if opcionales is None:
+            opcionales, columnas_stock = columnas_del_archivo(bloque[0].keys(), diccionarios)
+
+        validas, vistos = [], {}
+        for fila in bloque:
+            nro_fila += 1
+            sku = str(fila.get('sku', fila.get('SKU', ''))).strip()
+            try:
+                datos = validar_fila(fila, opcionales, columnas_stock, diccionarios)
+            except ValueError as e:
+                resumen['errores'].append((nro_fila, sku, str(e)))
+                continue
+            if datos['sku'] in vistos:
+                # El upsert no admite el mismo SKU dos veces en un lote: gana la última fila
+                anterior = vistos[datos['sku']]
+                resumen['errores'].append((validas[anterior][0], sku, f"SKU repetido: se usó la fila {nro_fila}"))
+                validas[anterior] = (nro_fila, datos)
+                continue
+            vistos[datos['sku']] = len(validas)
+            validas.append((nro_fila, datos))
+
+        resumen['filas'] += len(bloque)
+        if validas:
+            try:
+                creados, actualizados = guardar_lote(validas, opcionales, diccionarios, usuario)
+                resumen['creados'] += creados
+                resumen['actualizados'] += actualizados
+            except DatabaseError as e:
+                # El lote entero se revierte: se informa cada fila para poder reintentarlas
+                resumen['errores'] += [(n, datos['sku'], f"Error de base de datos en el lote: {e}") for n, datos in validas]
+        if al_avanzar:
+            al_avanzar(resumen)
+
+    resumen['errores'].sort()
+    return resumen
+
+
+def reporte_errores_csv(errores):
+    """El reporte de errores como texto CSV (fila, sku, error)."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(['fila', 'sku', 'error'])
+    escritor.writerows(errores)
+    return salida.getvalue()
@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from gestion_productos.models import Categoria, Marca, Producto
+from gestion_productos.search import ProductSearch, actualizar_vectores, normalizar_texto
+
+PALABRAS = [
+    'aceite', 'girasol', 'oliva', 'arroz', 'fideos', 'tallarín', 'azúcar', 'café', 'té', 'yerba',
+    'leche', 'yogur', 'queso', 'manteca', 'galletitas', 'jabón', 'shampoo', 'lavandina', 'detergente',
+    'gaseosa', 'cerveza', 'vino', 'agua', 'jugo', 'harina', 'polenta', 'atún', 'arvejas', 'mayonesa',
+]
+CONSULTAS = ['aceite', 'azucar', 'cafe molido', 'jabon liquido', 'yerba', 'leche desc', 'aciete', 'shampu']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mide la latencia de ProductSearch contra el icontains anterior sobre un catálogo sintético (se descarta al final)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=50000)
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.sembrar(options['productos'])
+                self.medir(options['repeticiones'])
+                raise _Rollback()
+        except _Rollback:
+            self.stdout.write("Datos sintéticos descartados (rollback).")
+
+    def sembrar(self, cantidad):
+        random.seed(42)
+        categoria = Categoria.objects.create(nombre='Benchmark', slug='benchmark-busqueda')
+        marcas = [Marca.objects.create(nombre=f'Marca Bench {i}') for i in range(50)]
+        productos = []
+        for i in range(cantidad):
+            marca = random.choice(marcas)
+            nombre = ' '.join(random.sample(PALABRAS, 3)).title()
+            p = Producto(
+                nombre=nombre, slug=f'bench-{i}', sku=f'B{i:09d}', codigo_barras=f'779{i:010d}',
+                categoria=categoria, marca=marca, descripcion_breve=nombre,
+                imagen_principal='productos/fotos/bench.jpg',
+            )
+            p.texto_busqueda = normalizar_texto(f"{nombre} {marca.nombre} Benchmark {nombre} {p.codigo_barras} {p.sku}")
+            productos.append(p)
+        creados = Producto.objects.bulk_create(productos, batch_size=2000)
+        actualizar_vectores([p.pk for p in creados])
+        self.stdout.write(f"Sembrados {cantidad} productos.")
+
+    def medir(self, repeticiones):
+        def legado(q):
+            return Producto.objects.filter(
+                Q(nombre__icontains=q) | Q(sku__icontains=q) | Q(descripcion_breve__icontains=q)
+            ).order_by('-id')
+
+        def nuevo(q):
+            return ProductSearch().buscar(q)
+
+        for etiqueta, funcion in [('icontains (anterior)', legado), ('ProductSearch', nuevo)]:
+            tiempos = []
+            for _ in range(repeticiones):
+                for q in CONSULTAS:
+                    inicio = time.perf_counter()
+                    list(funcion(q)[:12])
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+            tiempos.sort()
+            p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+            self.stdout.write(
+                f"{etiqueta:22} p50={statistics.median(tiempos):7.2f} ms  p95={p95:7.2f} ms  max={tiempos[-1]:7.2f} ms"
+            )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from gestion_productos.imagenes import ANCHOS, FALLIDA, completas, procesar_imagenes
+from gestion_productos.models import ImagenProducto, Producto
+from gestion_productos.versiones import incrementar_version
+
+
+class Command(BaseCommand):
+    help = (f"Genera las variantes responsive ({'/'.join(map(str, ANCHOS))} px, WebP y JPEG) de las imágenes "
+            "de producto y de galería que no las tienen completas.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help="Imágenes por tanda de procesamiento")
+        parser.add_argument('--forzar', action='store_true', help="Regenerar también las que ya están completas")
+
+    def _pendientes(self, queryset, campo, variantes):
+        return [
+            objeto for objeto in queryset.only('id', campo, variantes).iterator(chunk_size=2000)
+            if getattr(objeto, campo) and (self.forzar or not completas(getattr(objeto, campo), getattr(objeto, variantes)))
+        ]
+
+    def _procesar(self, objetos, campo, variantes, lote):
+        hechos = 0
+        for inicio in range(0, len(objetos), lote):
+            tanda = {o.pk: o for o in objetos[inicio:inicio + lote]}
+            resultado = procesar_imagenes({pk: getattr(o, campo).name for pk, o in tanda.items()})
+            for pk, datos in resultado.items():
+                # Sin variantes (Pillow no la pudo leer): marcada, para que save() no la reintente
+                setattr(tanda[pk], variantes, datos['variantes'] or {'origen': datos['imagen'], FALLIDA: True})
+            with transaction.atomic():
+                type(objetos[0]).objects.bulk_update([tanda[pk] for pk in resultado], [variantes])
+            hechos += len(resultado)
+            self.stdout.write(f"  {hechos}/{len(objetos)}...")
+        return hechos
+
+    def handle(self, *args, **options):
+        self.forzar = options['forzar']
+        productos = self._pendientes(Producto.objects.all(), 'imagen_principal', 'imagen_variantes')
+        galeria = self._pendientes(ImagenProducto.objects.all(), 'imagen', 'variantes')
+
+        hechos = 0
+        if productos:
+            hechos += self._procesar(productos, 'imagen_principal', 'imagen_variantes', options['lote'])
+        if galeria:
+            hechos += self._procesar(galeria, 'imagen', 'variantes', options['lote'])
+
+        # bulk_update no dispara señales: fichas y páginas apuntan a las imágenes nuevas
+        incrementar_version('productos')
+        self.stdout.write(self.style.SUCCESS(f"Variantes generadas para {hechos} imágenes."))
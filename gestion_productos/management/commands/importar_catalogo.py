@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from gestion_productos.importacion import LOTE, ImportacionError, importar_catalogo, reporte_errores_csv
+
+
+class Command(BaseCommand):
+    help = "Importa o actualiza productos, precios y stock desde un CSV/XLSX (upsert por SKU, por lotes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--lote', type=int, default=LOTE)
+        parser.add_argument('--errores', help="Ruta del reporte CSV de filas con error")
+
+    def handle(self, *args, **options):
+        archivo = Path(options['archivo'])
+        if not archivo.exists():
+            raise CommandError(f"No existe {archivo}")
+
+        def al_avanzar(resumen):
+            self.stdout.write(f"  {resumen['filas']} filas procesadas...")
+
+        try:
+            with archivo.open('rb') as f:
+                resumen = importar_catalogo(f, archivo.name, lote=options['lote'], al_avanzar=al_avanzar)
+        except ImportacionError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['creados']} creados, {resumen['actualizados']} actualizados, "
+            f"{len(resumen['errores'])} filas con error."
+        ))
+        if resumen['errores']:
+            if options['errores']:
+                Path(options['errores']).write_text(reporte_errores_csv(resumen['errores']), encoding='utf-8')
+                self.stdout.write(f"Reporte de errores: {options['errores']}")
+            else:
+                for fila, sku, error in resumen['errores'][:20]:
+                    self.stdout.write(self.style.WARNING(f"  fila {fila} ({sku or 'sin SKU'}): {error}"))
@@ -0,0 +1,36 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from configuracion_principal.storage_backends import CARPETAS_TEMPORALES
+from gestion_productos.models import ArchivoMedia
+
+
+class Command(BaseCommand):
+    help = "Carga en el índice de media (ArchivoMedia) los archivos del storage que todavía no figuran."
+
+    def _listar(self, carpeta=''):
+        """(nombre, tamaño, etag) de todo el storage."""
+        if hasattr(default_storage, 'bucket'):
+            # S3: un ListObjects trae tamaño y ETag de mil objetos por llamada
+            prefijo = f"{default_storage.location}/" if default_storage.location else ''
+            for objeto in default_storage.bucket.objects.filter(Prefix=prefijo):
+                yield objeto.key[len(prefijo):], objeto.size, objeto.e_tag.strip('"')
+            return
+        directorios, archivos = default_storage.listdir(carpeta)
+        for archivo in archivos:
+            nombre = f"{carpeta}{archivo}"
+            yield nombre, default_storage.size(nombre), ''
+        for directorio in directorios:
+            yield from self._listar(f"{carpeta}{directorio}/")
+
+    def handle(self, *args, **options):
+        indexados = set(ArchivoMedia.objects.values_list('nombre', flat=True))
+        nuevos = [
+            ArchivoMedia(
+                nombre=nombre, tamano=tamano, etag=etag,
+                # El ETag de una subida multiparte ("abc-3") no es el MD5: ese archivo no se deduplica
+                hash=etag if etag and '-' not in etag and not nombre.startswith(CARPETAS_TEMPORALES) else '',
+            )
+            for nombre, tamano, etag in self._listar() if nombre not in indexados
+        ]
+        ArchivoMedia.objects.bulk_create(nuevos, batch_size=1000, ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS(f"{len(nuevos)} archivos agregados al índice de media."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from gestion_productos.search import reindexar
+from gestion_productos.versiones import incrementar_version
+
+
+class Command(BaseCommand):
+    help = "Reconstruye texto_busqueda/search_vector de todos los productos (tras renombrar marcas o categorías)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = reindexar(lote=options['lote'])
+        incrementar_version('productos')
+        self.stdout.write(self.style.SUCCESS(f"Índice de búsqueda reconstruido para {total} productos."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from gestion_productos.models import Producto, HistorialPrecio
+from gestion_productos.versiones import incrementar_version
+
+
+class Command(BaseCommand):
+    help = "Recalcula las columnas de precio vigente de Producto a partir de HistorialPrecio (backfill)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help="Cantidad de productos por transacción")
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+        actualizados = 0
+
+        for inicio in range(0, len(ids), lote):
+            ids_lote = ids[inicio:inicio + lote]
+
+            # 1. Un solo query por lote para traer los precios vigentes
+            vigentes = {}
+            for precio in HistorialPrecio.objects.filter(producto_id__in=ids_lote, es_actual=True).order_by('-fecha_inicio'):
+                vigentes.setdefault(precio.producto_id, precio)
+
+            # 2. Actualizamos en bloque
+            productos = []
+            for producto in Producto.objects.filter(id__in=ids_lote).only('id'):
+                precio = vigentes.get(producto.id)
+                producto.precio_venta_actual = precio.precio_venta if precio else None
+                producto.precio_regular_actual = precio.precio_regular if precio else None
+                producto.descuento_actual = Producto.calcular_descuento(precio.precio_venta, precio.precio_regular) if precio else 0
+                productos.append(producto)
+
+            with transaction.atomic():
+                Producto.objects.bulk_update(productos, ['precio_venta_actual', 'precio_regular_actual', 'descuento_actual'])
+            actualizados += len(productos)
+
+        # bulk_update no dispara señales: invalidamos a mano lo que depende del precio
+        incrementar_version('productos')
+        self.stdout.write(self.style.SUCCESS(f"Precios sincronizados en {actualizados} productos."))
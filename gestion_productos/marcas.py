@@ -0,0 +1,88 @@
+"""
+Detección de marcas en los nombres de archivo de la carga masiva con un autómata
+Aho-Corasick.
+
+El autómata se arma una vez por request con todas las marcas (una sola consulta) y
+después cada nombre de archivo se recorre una sola vez, sin importar cuántas marcas
+haya. Marcas y nombres se comparan normalizados (minúsculas, sin tildes, cualquier
+separador como un espacio) y por palabras completas: "Arcor" no aparece en
+"marcorp". Si aparecen varias gana la más larga ("La Serenísima Clásica" antes
+que "La Serenísima").
+"""
+import re
+from collections import deque
+
+from .search import normalizar_texto
+
+SEPARADORES = re.compile(r'[^0-9a-z]+')
+
+
+def normalizar_marca(texto):
+    """' palabra palabra ': normalizado, con un espacio entre palabras y en los bordes ('' si no hay palabras)."""
+    palabras = SEPARADORES.sub(' ', normalizar_texto(texto)).split()
+    return f" {' '.join(palabras)} " if palabras else ''
+
+
+class DetectorMarcas:
+    """
+    Autómata sobre las marcas normalizadas. Como cada patrón y el texto van bordeados
+    de espacios, una coincidencia siempre es una secuencia de palabras completas.
+    """
+
+    def __init__(self, marcas):
+        """marcas: iterable de (id, nombre)."""
+        self._hijos = [{}]     # nodo -> {caracter: nodo}
+        self._falla = [0]      # nodo -> sufijo propio más largo que también es un nodo
+        self._salida = [None]  # nodo -> (largo, id) de la marca más larga que termina en él
+        for pk, nombre in marcas:
+            patron = normalizar_marca(nombre)
+            if patron:
+                self._agregar(patron, pk)
+        self._enlazar()
+
+    @classmethod
+    def desde_base(cls):
+        from .models import Marca
+        return cls(Marca.objects.order_by('id').values_list('id', 'nombre'))
+
+    def _agregar(self, patron, pk):
+        nodo = 0
+        for caracter in patron:
+            siguiente = self._hijos[nodo].get(caracter)
+            if siguiente is None:
+                siguiente = len(self._hijos)
+                self._hijos[nodo][caracter] = siguiente
+                self._hijos.append({})
+                self._falla.append(0)
+                self._salida.append(None)
+            nodo = siguiente
+        # Dos marcas que normalizan igual: queda la primera
+        if self._salida[nodo] is None:
+            self._salida[nodo] = (len(patron), pk)
+
+    def _enlazar(self):
+        # Por niveles: el enlace de falla de un nodo apunta a uno menos profundo, ya resuelto
+        cola = deque(self._hijos[0].values())
+        while cola:
+            nodo = cola.popleft()
+            for caracter, hijo in self._hijos[nodo].items():
+                falla = self._falla[nodo]
+                while falla and caracter not in self._hijos[falla]:
+                    falla = self._falla[falla]
+                self._falla[hijo] = self._hijos[falla].get(caracter, 0)
+                # La marca propia (si hay) siempre es más larga que las de su sufijo
+                self._salida[hijo] = self._salida[hijo] or self._salida[self._falla[hijo]]
+                cola.append(hijo)
+
+    def buscar(self, texto):
+        """id de la marca más larga que aparece en `texto` como palabras completas (None si no hay)."""
+        nodo, mejor = 0, None
+        for caracter in normalizar_marca(texto):
+            while nodo and caracter not in self._hijos[nodo]:
+                nodo = self._falla[nodo]
+            nodo = self._hijos[nodo].get(caracter, 0)
+            salida = self._salida[nodo]
+            # Empate de largo: la que aparece primero
+            if salida and (mejor is None or salida[0] > mejor[0]):
+                mejor = salida
+        return mejor[1] if mejor else None
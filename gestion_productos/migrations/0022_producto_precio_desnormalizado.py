@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 07:30
+
+from django.db import migrations, models
+
+
+def backfill_precio_actual(apps, schema_editor):
+    """Copia el HistorialPrecio vigente de cada producto a las nuevas columnas."""
+    Producto = apps.get_model('gestion_productos', 'Producto')
+    HistorialPrecio = apps.get_model('gestion_productos', 'HistorialPrecio')
+    actuales = HistorialPrecio.objects.filter(es_actual=True).order_by('producto_id', '-fecha_inicio')
+    vistos = set()
+    for precio in actuales.iterator():
+        if precio.producto_id in vistos:
+            continue
+        vistos.add(precio.producto_id)
+        descuento = 0
+        if precio.precio_regular and precio.precio_regular > 0 and precio.precio_venta < precio.precio_regular:
+            descuento = int(round(((precio.precio_regular - precio.precio_venta) / precio.precio_regular) * 100))
+        Producto.objects.filter(pk=precio.producto_id).update(
+            precio_venta_actual=precio.precio_venta,
+            precio_regular_actual=precio.precio_regular,
+            descuento_actual=descuento,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_productos', '0021_producto_ahorrames_producto_exclusivo_online'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='descuento_actual',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='precio_regular_actual',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='precio_venta_actual',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.RunPython(backfill_precio_actual, migrations.RunPython.noop),
+    ]
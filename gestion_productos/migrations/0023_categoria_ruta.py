@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+def construir_rutas(apps, schema_editor):
+    """Calcula la ruta materializada de todas las categorías existentes recorriendo el árbol en memoria."""
+    Categoria = apps.get_model('gestion_productos', 'Categoria')
+    hijos = {}
+    for cat_id, padre_id in Categoria.objects.values_list('id', 'padre_id'):
+        hijos.setdefault(padre_id, []).append(cat_id)
+
+    rutas = {}
+    pendientes = [(cat_id, '') for cat_id in hijos.get(None, [])]
+    while pendientes:
+        cat_id, ruta_padre = pendientes.pop()
+        rutas[cat_id] = f"{ruta_padre}{cat_id}/"
+        pendientes.extend((hijo, rutas[cat_id]) for hijo in hijos.get(cat_id, []))
+
+    for cat_id, ruta in rutas.items():
+        Categoria.objects.filter(pk=cat_id).update(ruta=ruta)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_productos', '0022_producto_precio_desnormalizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='ruta',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(construir_rutas, migrations.RunPython.noop),
+    ]
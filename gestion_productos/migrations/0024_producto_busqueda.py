@@ -0,0 +1,80 @@
+# Generated by Django 6.0 on 2026-10-18 07:33
+
+import unicodedata
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower().strip()
+
+
+def poblar_texto_busqueda(apps, schema_editor):
+    Categoria = apps.get_model('gestion_productos', 'Categoria')
+    Producto = apps.get_model('gestion_productos', 'Producto')
+
+    nombres = dict(Categoria.objects.values_list('id', 'nombre'))
+    rutas = {}
+    for cat_id, ruta in Categoria.objects.values_list('id', 'ruta'):
+        ids = [int(x) for x in ruta.split('/') if x] or [cat_id]
+        rutas[cat_id] = ' > '.join(nombres.get(i, '') for i in ids)
+
+    lote = []
+    for p in Producto.objects.select_related('marca').iterator(chunk_size=1000):
+        partes = [p.nombre, p.marca.nombre, rutas.get(p.categoria_id, ''), p.descripcion_breve, p.codigo_barras, p.sku]
+        p.texto_busqueda = _normalizar(' '.join(x for x in partes if x))
+        lote.append(p)
+        if len(lote) >= 1000:
+            Producto.objects.bulk_update(lote, ['texto_busqueda'])
+            lote = []
+    if lote:
+        Producto.objects.bulk_update(lote, ['texto_busqueda'])
+
+
+def crear_indices_postgres(apps, schema_editor):
+    """Los índices GIN/trigramas solo existen en PostgreSQL; en SQLite se omiten."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "UPDATE gestion_productos_producto SET search_vector = to_tsvector('simple', texto_busqueda)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS producto_search_vector_gin "
+        "ON gestion_productos_producto USING gin (search_vector)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS producto_texto_busqueda_trgm "
+        "ON gestion_productos_producto USING gin (texto_busqueda gin_trgm_ops)"
+    )
+
+
+def borrar_indices_postgres(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS producto_search_vector_gin")
+    schema_editor.execute("DROP INDEX IF EXISTS producto_texto_busqueda_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_productos', '0023_categoria_ruta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='texto_busqueda',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(poblar_texto_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices_postgres, borrar_indices_postgres),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 08:02
+
+import re
+
+from django.db import migrations, models
+
+
+def sembrar_secuencia(apps, schema_editor):
+    """La secuencia arranca después del mayor id o SKU numérico ya usado."""
+    Producto = apps.get_model('gestion_productos', 'Producto')
+    SecuenciaSKU = apps.get_model('gestion_productos', 'SecuenciaSKU')
+
+    maximo = 0
+    for pk, sku in Producto.objects.values_list('id', 'sku').iterator(chunk_size=2000):
+        maximo = max(maximo, pk, int(sku) if re.fullmatch(r'[0-9]{1,18}', sku or '') else 0)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE SEQUENCE IF NOT EXISTS gestion_productos_sku_seq")
+        # setval(..., false): el próximo nextval() devuelve exactamente maximo + 1
+        schema_editor.execute("SELECT setval('gestion_productos_sku_seq', %s, false)", [maximo + 1])
+    else:
+        SecuenciaSKU.objects.update_or_create(nombre='sku', defaults={'ultimo': maximo})
+
+
+def borrar_secuencia(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP SEQUENCE IF EXISTS gestion_productos_sku_seq")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_productos', '0024_producto_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaSKU',
+            fields=[
+                ('nombre', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('ultimo', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Secuencia de SKU',
+                'verbose_name_plural': 'Secuencias de SKU',
+            },
+        ),
+        migrations.RunPython(sembrar_secuencia, borrar_secuencia),
+    ]
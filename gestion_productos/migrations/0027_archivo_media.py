@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_productos', '0026_imagen_variantes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True)),
+                ('tamano', models.BigIntegerField(default=0)),
+                ('hash', models.CharField(blank=True, db_index=True, help_text='MD5 del contenido', max_length=32)),
+                ('etag', models.CharField(blank=True, max_length=100)),
+                ('usos', models.PositiveIntegerField(default=1, help_text='Cuántos guardados apuntan a este archivo')),
+                ('creado_el', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archivo media',
+                'verbose_name_plural': 'Archivos media',
+            },
+        ),
+    ]
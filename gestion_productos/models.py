@@ -1,6 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Substr
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.text import slugify
 
+from .imagenes import generar_al_confirmar, url_variante
+
 # 1. CATEGORÍA (Debe ir primero para que Producto pueda verla)
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100)
@@ -20,32 +25,108 @@ class Categoria(models.Model):
     orden = models.PositiveIntegerField(default=0, help_text="Para ordenar en el menú")
     activa = models.BooleanField(default=True, verbose_name="¿Activa?", help_text="Desmarcar para ocultar esta categoría y sus productos de la tienda.")
 
+    # Camino materializado "id_raiz/id_hijo/.../id_propio/" (lo mantiene save())
+    # Permite resolver descendientes con un LIKE 'ruta%' indexado y ancestros con un solo IN
+    ruta = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+
     class Meta:
         verbose_name = "Categoría"
         verbose_name_plural = "Categorías"
         ordering = ['nombre']
 
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        if self.pk and self.padre_id:
+            if self.padre_id == self.pk or (self.padre.ruta and f"/{self.pk}/" in f"/{self.padre.ruta}"):
+                raise ValidationError({'padre': "Una categoría no puede colgar de sí misma ni de una de sus subcategorías."})
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.nombre)
-        super().save(*args, **kwargs)
 
-    def __str__(self):
-        full_path = [self.nombre]
-        k = self.padre
-        while k is not None:
-            full_path.append(k.nombre)
-            k = k.padre
-        return ' > '.join(reversed(full_path))
+        with transaction.atomic():
+            ruta_anterior = None
+            if self.pk:
+                ruta_anterior = Categoria.objects.filter(pk=self.pk).values_list('ruta', flat=True).first()
+
+            super().save(*args, **kwargs)
+
+            ruta_padre = self.padre.ruta if self.padre_id else ''
+            nueva_ruta = f"{ruta_padre}{self.pk}/"
+            if nueva_ruta == ruta_anterior:
+                return
+
+            if ruta_anterior:
+                # Se movió de rama: reescribimos el prefijo de toda la descendencia en un solo UPDATE
+                Categoria.objects.filter(ruta__startswith=ruta_anterior).update(
+                    ruta=Concat(Value(nueva_ruta), Substr('ruta', len(ruta_anterior) + 1))
+                )
+            else:
+                Categoria.objects.filter(pk=self.pk).update(ruta=nueva_ruta)
+            self.ruta = nueva_ruta
+            self.__dict__.pop('_ancestros_cache', None)
+
+    def ancestros_ids(self):
+        """IDs desde la raíz hasta el padre, leídos de la ruta (sin consultas)"""
+        return [int(x) for x in self.ruta.split('/') if x][:-1]
+
+    def descendientes_ids(self):
+        """IDs de la categoría y toda su descendencia (un solo query, usable como subquery)"""
+        return Categoria.objects.filter(ruta__startswith=self.ruta).values_list('id', flat=True)
+
+    @staticmethod
+    def descendientes_ids_de(categorias):
+        """Igual que descendientes_ids() pero para varias categorías a la vez"""
+        filtro = Q()
+        for cat in categorias:
+            filtro |= Q(ruta__startswith=cat.ruta)
+        if not filtro:
+            return Categoria.objects.none().values_list('id', flat=True)
+        return Categoria.objects.filter(filtro).values_list('id', flat=True)
+
+    def ancestros(self):
+        """Retorna una lista de objetos Categoria desde la raíz hasta el padre (un solo query)"""
+        ids = self.ancestros_ids()
+        if not ids:
+            return []
+        por_id = Categoria.objects.in_bulk(ids)
+        return [por_id[i] for i in ids if i in por_id]
 
     def get_ancestros(self):
         """Retorna una lista de objetos Categoria desde la raíz hasta la actual"""
-        ancestros = []
-        p = self.padre
-        while p is not None:
-            ancestros.insert(0, p)
-            p = p.padre
-        return ancestros
+        if '_ancestros_cache' not in self.__dict__:
+            if self.ruta:
+                self.__dict__['_ancestros_cache'] = self.ancestros()
+            else:
+                # Instancia sin guardar: caminamos por padre
+                ancestros = []
+                p = self.padre
+                while p is not None:
+                    ancestros.insert(0, p)
+                    p = p.padre
+                self.__dict__['_ancestros_cache'] = ancestros
+        return self.__dict__['_ancestros_cache']
+
+    @staticmethod
+    def rutas_completas(categorias):
+        """
+        Devuelve {id: "Abuelo > Padre > Hijo"} para varias categorías
+        resolviendo todos los ancestros en un único query.
+        """
+        categorias = list(categorias)
+        ids_necesarios = set()
+        for cat in categorias:
+            ids_necesarios.update(cat.ancestros_ids())
+        nombres = dict(Categoria.objects.filter(id__in=ids_necesarios).values_list('id', 'nombre')) if ids_necesarios else {}
+        return {
+            cat.id: ' > '.join([nombres[i] for i in cat.ancestros_ids() if i in nombres] + [cat.nombre])
+            for cat in categorias
+        }
+
+    def __str__(self):
+        full_path = [a.nombre for a in self.get_ancestros()]
+        full_path.append(self.nombre)
+        return ' > '.join(full_path)
 
 # 2. MARCA
 class Marca(models.Model):
@@ -90,30 +171,84 @@ class Producto(models.Model):
         (0.00, '0% (Exento)'),
     ]
 
+    # --- Relaciones para templates: usan el cargador del request si lo hay (gestion_productos/cargador.py) ---
+
+    @property
+    def galeria(self):
+        """Imágenes de la galería ordenadas"""
+        cargador = getattr(self, '_cargador', None)
+        if cargador is not None:
+            return cargador.galeria(self)
+        if '_galeria' not in self.__dict__:
+            self.__dict__['_galeria'] = list(self.imagenes_galeria.all())
+        return self.__dict__['_galeria']
+
+    @property
+    def categoria_ancestros(self):
+        """Categorías desde la raíz hasta el padre de la categoría del producto"""
+        cargador = getattr(self, '_cargador', None)
+        if cargador is not None:
+            return cargador.ancestros(self)
+        return self.categoria.get_ancestros()
+
+    @property
+    def imagen_tarjeta_url(self):
+        """Variante WebP para tarjetas (o la imagen original si todavía no se generó)"""
+        return url_variante(self.imagen_principal, self.imagen_variantes, 'tarjeta')
+
+    @property
+    def imagen_miniatura_url(self):
+        """Variante WebP para carritos y miniaturas"""
+        return url_variante(self.imagen_principal, self.imagen_variantes, 'miniatura')
+
+    @property
+    def tarjeta_html(self):
+        """card_producto.html cacheada (solo con cargador: en los listados)"""
+        cargador = getattr(self, '_cargador', None)
+        return cargador.tarjeta(self) if cargador is not None else None
+
     def get_precio_actual_obj(self):
         """Retorna el objeto HistorialPrecio actual"""
         return self.precios.filter(es_actual=True).first()
 
     def precio_actual(self):
-        """Retorna el valor numérico del precio de venta actual"""
-        precio = self.get_precio_actual_obj()
-        return precio.precio_venta if precio else 0
+        """Retorna el valor numérico del precio de venta actual (columna desnormalizada)"""
+        return self.precio_venta_actual if self.precio_venta_actual is not None else 0
 
     def precio_antes(self):
         """Retorna el precio regular si es mayor al de venta (para tachar)"""
-        precio = self.get_precio_actual_obj()
-        if precio and precio.precio_regular > precio.precio_venta:
-            return precio.precio_regular
+        if self.precio_venta_actual is not None and self.precio_regular_actual is not None \
+                and self.precio_regular_actual > self.precio_venta_actual:
+            return self.precio_regular_actual
         return None
 
     def descuento_porcentaje(self):
+        """Porcentaje de descuento precalculado al guardar el HistorialPrecio vigente"""
+        return self.descuento_actual
+
+    @staticmethod
+    def calcular_descuento(precio_venta, precio_regular):
         """Calcula el porcentaje de descuento basado en precio_regular y precio_venta"""
-        precio = self.get_precio_actual_obj()
-        if precio and precio.precio_regular > 0 and precio.precio_venta < precio.precio_regular:
-            descuento = ((precio.precio_regular - precio.precio_venta) / precio.precio_regular) * 100
+        if precio_venta is not None and precio_regular and precio_regular > 0 and precio_venta < precio_regular:
+            descuento = ((precio_regular - precio_venta) / precio_regular) * 100
             return int(round(descuento))
         return 0
 
+    def sincronizar_precio_actual(self):
+        """
+        Recalcula las columnas desnormalizadas de precio a partir del HistorialPrecio vigente.
+        Se usa cuando el precio actual deja de serlo (edición o borrado) y en el backfill.
+        """
+        precio = self.get_precio_actual_obj()
+        valores = {
+            'precio_venta_actual': precio.precio_venta if precio else None,
+            'precio_regular_actual': precio.precio_regular if precio else None,
+            'descuento_actual': Producto.calcular_descuento(precio.precio_venta, precio.precio_regular) if precio else 0,
+        }
+        for campo, valor in valores.items():
+            setattr(self, campo, valor)
+        Producto.objects.filter(pk=self.pk).update(**valores)
+
     # Identificación Básica
     nombre = models.CharField(max_length=200)
     slug = models.SlugField(max_length=250, unique=True, blank=True)
@@ -190,6 +325,8 @@ class Producto(models.Model):
         verbose_name="Descripción detallada"
     )
     imagen_principal = models.ImageField(upload_to='productos/fotos/')
+    # Variantes WebP chicas de imagen_principal (ver gestion_productos/imagenes.py)
+    imagen_variantes = models.JSONField(default=dict, blank=True, editable=False)
 
     # 1. Definimos la función de la guía (Ponela arriba de la clase Producto)
     def guia_especificaciones():
@@ -238,6 +375,18 @@ class Producto(models.Model):
     volumen_m3 = models.DecimalField(max_digits=8, decimal_places=4, default=0.0)
     
     esta_activo = models.BooleanField(default=True)
+
+    # Precio vigente desnormalizado (lo mantiene HistorialPrecio.save)
+    # Evita una consulta por tarjeta y permite ordenar/filtrar por precio sin JOIN
+    precio_venta_actual = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False, db_index=True)
+    precio_regular_actual = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    descuento_actual = models.PositiveSmallIntegerField(default=0, editable=False)
+    CAMPOS_PRECIO_ACTUAL = ('precio_venta_actual', 'precio_regular_actual', 'descuento_actual')
+
+    # Búsqueda: texto normalizado (sin tildes) y su tsvector en PostgreSQL (índices GIN en la migración)
+    texto_busqueda = models.TextField(blank=True, default='', editable=False)
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
     creado_el = models.DateTimeField(auto_now_add=True)
     actualizado_el = models.DateTimeField(auto_now=True)
 
@@ -251,10 +400,9 @@ class Producto(models.Model):
         Calcula el valor neto partiendo del precio con IVA incluido.
         Fórmula: Precio Total / (1 + (IVA / 100))
         """
-        precio_obj = self.precios.filter(es_actual=True).first()
-        if precio_obj and precio_obj.precio_venta:
+        if self.precio_venta_actual:
             divisor = 1 + (float(self.iva) / 100)
-            return round(float(precio_obj.precio_venta) / divisor, 2)
+            return round(float(self.precio_venta_actual) / divisor, 2)
         return 0
 
     def save(self, *args, **kwargs):
@@ -264,23 +412,37 @@ class Producto(models.Model):
             self.slug = slugify(self.nombre)
         
         if not self.sku:
-            ultimo_p = Producto.objects.order_by('id').last()
-            nuevo_id = (ultimo_p.id + 1) if ultimo_p else 1
-            self.sku = f"{nuevo_id:08d}"
-
-        # 2. Guardado inicial (para que el producto exista en la DB)
+            # Secuencia propia: sin carreras entre altas simultáneas (ver gestion_productos/sku.py)
+            from .sku import siguiente_sku
+            self.sku = siguiente_sku(using=kwargs.get('using') or 'default')
+
+        # Texto normalizado para el buscador (ver gestion_productos/search.py)
+        from .search import texto_busqueda_para, actualizar_vectores
+        self.texto_busqueda = texto_busqueda_para(self)
+
+        # 2. Guardado inicial (para que el producto exista en la DB). Las columnas de precio
+        # desnormalizadas solo las escribe HistorialPrecio: una instancia leída antes de un
+        # cambio de precio no las pisa con los valores viejos al guardarse.
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CAMPOS_PRECIO_ACTUAL
+            ]
         super().save(*args, **kwargs)
+        actualizar_vectores([self.pk], using=kwargs.get('using') or 'default')
 
-        # 3. Intento de cálculo inmediato
-        precio_actual = self.precios.filter(es_actual=True).first()
-        
-        if precio_actual and self.peso_kg > 0:
-            nuevo_valor = round(precio_actual.precio_venta / self.peso_kg, 2)
+        # 3. Intento de cálculo inmediato (usamos el precio desnormalizado, sin consulta extra)
+        if self.precio_venta_actual is not None and self.peso_kg > 0:
+            nuevo_valor = round(self.precio_venta_actual / self.peso_kg, 2)
             
             if self.precio_por_unidad_medida != nuevo_valor:
                 self.precio_por_unidad_medida = nuevo_valor
                 Producto.objects.filter(pk=self.pk).update(precio_por_unidad_medida=nuevo_valor)
 
+        # 4. Imagen nueva: sus variantes responsive se generan al confirmar
+        generar_al_confirmar(self, 'imagen_principal', 'imagen_variantes')
+
     def __str__(self):
         return self.nombre
             
@@ -294,6 +456,7 @@ class ImagenProducto(models.Model):
         related_name='imagenes_galeria'
     )
     imagen = models.ImageField(upload_to='productos/galeria/')
+    variantes = models.JSONField(default=dict, blank=True, editable=False)
     orden = models.PositiveIntegerField(default=0, help_text="Para decidir cuál va primero")
 
     class Meta:
@@ -301,6 +464,14 @@ class ImagenProducto(models.Model):
         verbose_name_plural = "Galería de Imágenes"
         ordering = ['orden']
 
+    @property
+    def miniatura_url(self):
+        return url_variante(self.imagen, self.variantes, 'miniatura')
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        generar_al_confirmar(self, 'imagen', 'variantes')
+
     def __str__(self):
         return f"Imagen para {self.producto.nombre}"
 
@@ -331,15 +502,41 @@ class HistorialPrecio(models.Model):
         ordering = ['-fecha_inicio']
 
     def save(self, *args, **kwargs):
-        if self.es_actual:
-            HistorialPrecio.objects.filter(producto=self.producto, es_actual=True).exclude(pk=self.pk).update(es_actual=False)
-        
-        super().save(*args, **kwargs)
-        
-        # REFUERZO: Forzamos al producto a recalcular su unidad de medida
-        if self.es_actual and self.producto.peso_kg > 0:
-            valor_kilo = round(self.precio_venta / self.producto.peso_kg, 2)
-            Producto.objects.filter(pk=self.producto.pk).update(precio_por_unidad_medida=valor_kilo)
+        # Todo junto: el historial y las columnas desnormalizadas del producto no pueden divergir
+        with transaction.atomic():
+            if self.es_actual:
+                HistorialPrecio.objects.filter(producto=self.producto, es_actual=True).exclude(pk=self.pk).update(es_actual=False)
+
+            super().save(*args, **kwargs)
+
+            producto = self.producto
+            if not self.es_actual:
+                # Pudo haber sido el vigente hasta ahora: recalculamos desde la DB
+                producto.sincronizar_precio_actual()
+                return
+
+            valores = {
+                'precio_venta_actual': self.precio_venta,
+                'precio_regular_actual': self.precio_regular,
+                'descuento_actual': Producto.calcular_descuento(self.precio_venta, self.precio_regular),
+            }
+            # REFUERZO: Forzamos al producto a recalcular su unidad de medida
+            if producto.peso_kg > 0:
+                valores['precio_por_unidad_medida'] = round(self.precio_venta / producto.peso_kg, 2)
+
+            # Mantenemos la instancia en memoria al día para que un save() posterior no pise los valores
+            for campo, valor in valores.items():
+                setattr(producto, campo, valor)
+            Producto.objects.filter(pk=producto.pk).update(**valores)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            era_actual = self.es_actual
+            producto = self.producto
+            resultado = super().delete(*args, **kwargs)
+            if era_actual:
+                producto.sincronizar_precio_actual()
+            return resultado
 
     def __str__(self):
         return f"{self.producto.nombre} - ${self.precio_venta} ({self.fecha_inicio.date()})"
@@ -357,3 +554,31 @@ class Favorito(models.Model):
 
     def __str__(self):
         return f"{self.usuario.username} - {self.producto.nombre}"
+
+# 7. SECUENCIA DE SKU (respaldo para bases sin secuencias; ver gestion_productos/sku.py)
+class SecuenciaSKU(models.Model):
+    nombre = models.CharField(max_length=30, primary_key=True)
+    ultimo = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Secuencia de SKU"
+        verbose_name_plural = "Secuencias de SKU"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ultimo}"
+
+# 8. ÍNDICE DE ARCHIVOS MEDIA (lo mantiene MediaStorage; ver configuracion_principal/storage_backends.py)
+class ArchivoMedia(models.Model):
+    nombre = models.CharField(max_length=255, unique=True)
+    tamano = models.BigIntegerField(default=0)
+    hash = models.CharField(max_length=32, blank=True, db_index=True, help_text="MD5 del contenido")
+    etag = models.CharField(max_length=100, blank=True)
+    usos = models.PositiveIntegerField(default=1, help_text="Cuántos guardados apuntan a este archivo")
+    creado_el = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Archivo media"
+        verbose_name_plural = "Archivos media"
+
+    def __str__(self):
+        return self.nombre
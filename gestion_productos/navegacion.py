@@ -0,0 +1,97 @@
+"""
+Datos "de cromo" que necesitan todas las páginas (menú de categorías y sucursales).
+
+Se arman una vez, se guardan en la caché compartida con una clave que incluye las
+versiones 'categorias' y 'sucursales' (las incrementan las señales de Categoria y
+Sucursal) y los context processors los exponen como objetos perezosos: una vista
+que devuelve JSON o un fragmento que no usa el menú nunca los evalúa.
+
+El menú de categorías se cachea ya renderizado: el árbol sale de una sola consulta
+y el HTML (templates/menu_categorias.html) se arma una vez por versión de 'categorias'.
+Lo mismo las rutas "Abuelo > Padre > Hijo" de los selectores de categoría (rutas_categorias).
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.functional import SimpleLazyObject
+from django.utils.safestring import mark_safe
+
+from gestion_sucursales.models import Sucursal
+from .models import Categoria
+from .versiones import obtener_version
+
+DURACION = 60 * 60 * 24  # las versiones invalidan antes; esto solo limpia claves viejas
+NIVELES_MENU = 3
+
+
+def arbol_categorias(niveles=NIVELES_MENU):
+    """
+    Categorías activas como árbol [{'id', 'nombre', 'slug', 'hijos': [...]}, ...] armado en
+    Python a partir de una sola consulta. Una categoría inactiva oculta todo lo que cuelga de ella.
+    """
+    # 1. Todas las activas, ya en el orden del menú
+    filas = Categoria.objects.filter(activa=True).order_by('orden', 'nombre').values('id', 'padre_id', 'nombre', 'slug')
+
+    # 2. Padre -> hijos
+    hijos_de = {}
+    for fila in filas:
+        hijos_de.setdefault(fila.pop('padre_id'), []).append(fila)
+
+    # 3. Desde las raíces, hasta `niveles` de profundidad
+    def armar(padre_id, nivel):
+        nodos = hijos_de.get(padre_id, [])
+        for nodo in nodos:
+            nodo['hijos'] = armar(nodo['id'], nivel + 1) if nivel < niveles else []
+        return nodos
+
+    return armar(None, 1)
+
+
+def rutas_categorias():
+    """
+    {id: "Abuelo > Padre > Hijo"} de todas las categorías (activas o no), ordenado por ruta.
+    Sale de una sola consulta, resuelta en memoria con el camino materializado, y queda
+    cacheado hasta que cambie la versión de 'categorias'.
+    """
+    clave = f"categorias_rutas:{obtener_version('categorias')}"
+    rutas = cache.get(clave)
+    if rutas is None:
+        filas = list(Categoria.objects.values_list('id', 'nombre', 'ruta'))
+        nombres = {pk: nombre for pk, nombre, _ in filas}
+        completas = {}
+        for pk, nombre, ruta in filas:
+            ids = [int(x) for x in ruta.split('/') if x] or [pk]
+            completas[pk] = ' > '.join(nombres[i] for i in ids if i in nombres)
+        rutas = dict(sorted(completas.items(), key=lambda item: item[1].casefold()))
+        cache.set(clave, rutas, DURACION)
+    return rutas
+
+
+def construir_navegacion():
+    sucursales = list(Sucursal.objects.all())
+    return {
+        'menu_categorias': mark_safe(render_to_string('menu_categorias.html', {'categorias': arbol_categorias()})),
+        'sucursales': sucursales,
+        'cantidad_sucursales': len(sucursales),
+        'sucursal_unica': sucursales[0] if len(sucursales) == 1 else None,
+    }
+
+
+def obtener_navegacion():
+    clave = f"navegacion:{obtener_version('categorias')}:{obtener_version('sucursales')}"
+    datos = cache.get(clave)
+    if datos is None:
+        datos = construir_navegacion()
+        cache.set(clave, datos, DURACION)
+    return datos
+
+
+def navegacion_de(request):
+    """Un único objeto perezoso por request, compartido por todos los context processors."""
+    if not hasattr(request, '_navegacion'):
+        request._navegacion = SimpleLazyObject(obtener_navegacion)
+    return request._navegacion
+
+
+def valor_perezoso(request, nombre):
+    navegacion = navegacion_de(request)
+    return SimpleLazyObject(lambda: navegacion[nombre])
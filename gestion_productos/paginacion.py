@@ -0,0 +1,270 @@
+"""
+Paginación por cursor (keyset) para los listados de productos.
+
+En lugar de COUNT(*) + OFFSET, cada página pide "los N siguientes después de la
+última fila vista" según el mismo orden del queryset: ('precio_val', 'id'),
+('-precio_val', '-id'), ('-rango', '-id'), ('-id',)... Así la página 50 cuesta lo
+mismo que la 1. El cursor viaja en la URL (?cursor=...) y no tiene número de
+página; el total se informa aparte, opcionalmente estimado.
+
+Los órdenes por relevancia ('-rango', '-similitud') no usan claves: el puntaje es
+un float4 y la igualdad después de pasar por la URL no es confiable, así que en
+los empates se saltearían o repetirían filas. Ahí el cursor lleva el desplazamiento
+(una búsqueda rara vez pasa de unas pocas páginas).
+
+Un cursor inválido o con valores que no corresponden a los campos del orden
+vuelve a la primera página. Los links viejos con ?page=N siguen funcionando con
+el Paginator clásico.
+"""
+import base64
+import json
+from decimal import Decimal
+from functools import cached_property
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q
+
+POR_PAGINA = 12
+# Puntajes float: se paginan por desplazamiento
+CAMPOS_RELEVANCIA = {'rango', 'similitud'}
+
+
+def _codificar(valores, direccion):
+    datos = json.dumps({'v': valores, 'd': direccion}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def _decodificar(cursor):
+    """Devuelve (valores, direccion) o None si el cursor es inválido."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if datos['d'] not in ('sig', 'ant', 'pos') or not isinstance(datos['v'], list):
+            return None
+        return datos['v'], datos['d']
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def claves_de_orden(queryset):
+    """[(campo, descendente), ...] según el order_by del queryset, con 'id' como desempate."""
+    claves = []
+    for campo in queryset.query.order_by:
+        if not isinstance(campo, str):
+            raise ValueError("La paginación por cursor solo admite order_by por nombre de campo.")
+        claves.append((campo.lstrip('-'), campo.startswith('-')))
+    if not any(campo in ('id', 'pk') for campo, _ in claves):
+        # El desempate sigue la dirección de la última clave
+        claves.append(('id', claves[-1][1] if claves else True))
+    return claves
+
+
+def _campo(queryset, nombre):
+    """Campo (o output_field de la anotación) por el que se ordena, para validar los valores del cursor."""
+    if nombre in queryset.query.annotations:
+        return queryset.query.annotations[nombre].output_field
+    opciones = queryset.model._meta
+    *relaciones, final = nombre.split('__')
+    for relacion in relaciones:
+        opciones = opciones.get_field(relacion).related_model._meta
+    return opciones.get_field('id' if final == 'pk' else final)
+
+
+def _validar(queryset, claves, valores):
+    """Los valores del cursor convertidos al tipo de cada campo, o None si alguno no corresponde."""
+    convertidos = []
+    try:
+        for (campo, _), valor in zip(claves, valores):
+            convertidos.append(None if valor is None else _campo(queryset, campo).to_python(valor))
+    except (FieldDoesNotExist, ValidationError, TypeError, ValueError, AttributeError):
+        return None
+    return convertidos
+
+
+def _filtro_despues(claves, valores, hacia_atras):
+    """
+    Filas estrictamente posteriores (o anteriores) al cursor, con los NULL siempre al final:
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    """
+    filtro = Q(pk__in=[])
+    iguales = Q()
+    for (campo, desc), valor in zip(claves, valores):
+        # Hacia adelante en orden ascendente buscamos mayores; hacia atrás, menores (y al revés si es desc)
+        operador = 'lt' if desc != hacia_atras else 'gt'
+        if hacia_atras:
+            # Antes de un NULL está cualquier valor; antes de un valor, solo valores
+            paso = Q(**{f"{campo}__isnull": False}) if valor is None else Q(**{f"{campo}__{operador}": valor})
+        else:
+            # Después de un valor vienen los NULL; después de un NULL, nada (salvo desempate)
+            paso = Q(pk__in=[]) if valor is None else (
+                Q(**{f"{campo}__{operador}": valor}) | Q(**{f"{campo}__isnull": True})
+            )
+        filtro |= iguales & paso
+        iguales &= Q(**{f"{campo}__isnull": True}) if valor is None else Q(**{campo: valor})
+    return filtro
+
+
+def _orden(claves, hacia_atras):
+    orden = []
+    for campo, desc in claves:
+        if hacia_atras:
+            orden.append(F(campo).asc(nulls_first=True) if desc else F(campo).desc(nulls_first=True))
+        else:
+            orden.append(F(campo).desc(nulls_last=True) if desc else F(campo).asc(nulls_last=True))
+    return orden
+
+
+def contar_estimado(queryset):
+    """
+    Total aproximado sin recorrer la tabla, según la estimación del planificador (EXPLAIN).
+    Solo PostgreSQL; en otras bases devuelve None y se cuenta de forma exacta.
+    """
+    conexion = connections[queryset.db]
+    if conexion.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with conexion.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class _Totales:
+    """Imita lo que los templates leen de `page.paginator` (count y num_pages)."""
+
+    def __init__(self, pagina):
+        self._pagina = pagina
+
+    @cached_property
+    def count(self):
+        return self._pagina.total
+
+    @property
+    def num_pages(self):
+        return max(1, -(-self.count // self._pagina.por_pagina))
+
+    @property
+    def es_estimado(self):
+        return self._pagina.total is not None and self._pagina.es_estimado
+
+
+class PaginaCursor:
+    es_cursor = True
+
+    def __init__(self, request, queryset, por_pagina=POR_PAGINA, contar='estimado', total=None):
+        self.por_pagina = por_pagina
+        self.contar = contar
+        self._request = request
+        self._queryset = queryset
+        if total is not None:
+            # El total ya se conoce (p. ej. por las facetas): no hace falta contar
+            self.__dict__['total'] = total
+            self.es_estimado = False
+        self.claves = claves_de_orden(queryset)
+
+        decodificado = _decodificar(request.GET.get('cursor', ''))
+        self.por_desplazamiento = any(campo in CAMPOS_RELEVANCIA for campo, _ in self.claves)
+        if self.por_desplazamiento:
+            self._paginar_por_desplazamiento(queryset, decodificado)
+        else:
+            self._paginar_por_claves(queryset, decodificado)
+        self.paginator = _Totales(self)
+
+    def _paginar_por_claves(self, queryset, decodificado):
+        valores, direccion = None, 'sig'
+        if decodificado and decodificado[1] != 'pos' and len(decodificado[0]) == len(self.claves):
+            valores = _validar(queryset, self.claves, decodificado[0])
+            if valores is not None:
+                direccion = decodificado[1]
+        hacia_atras = direccion == 'ant'
+
+        # 1. Una sola consulta: N+1 filas para saber si hay más en esa dirección
+        filas = queryset.order_by(*_orden(self.claves, hacia_atras))
+        if valores is not None:
+            filas = filas.filter(_filtro_despues(self.claves, valores, hacia_atras))
+        filas = list(filas[:self.por_pagina + 1])
+        hay_mas = len(filas) > self.por_pagina
+        filas = filas[:self.por_pagina]
+        if hacia_atras:
+            filas.reverse()
+
+        self.object_list = filas
+        # 2. Desde el primer cursor solo se puede avanzar; hacia atrás, lo contrario
+        if hacia_atras:
+            self.has_previous, self.has_next = hay_mas, True
+        else:
+            self.has_previous, self.has_next = valores is not None, hay_mas
+
+    def _paginar_por_desplazamiento(self, queryset, decodificado):
+        self.desde = 0
+        if decodificado and decodificado[1] == 'pos' and len(decodificado[0]) == 1:
+            desde = decodificado[0][0]
+            if isinstance(desde, int) and not isinstance(desde, bool) and desde >= 0:
+                self.desde = desde
+
+        filas = list(queryset.order_by(*_orden(self.claves, False))[self.desde:self.desde + self.por_pagina + 1])
+        self.object_list = filas[:self.por_pagina]
+        self.has_previous, self.has_next = self.desde > 0, len(filas) > self.por_pagina
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+    def has_other_pages(self):
+        return self.has_previous or self.has_next
+
+    @cached_property
+    def total(self):
+        estimado = contar_estimado(self._queryset) if self.contar == 'estimado' else None
+        self.es_estimado = estimado is not None
+        return estimado if self.es_estimado else self._queryset.count()
+
+    def _valores(self, fila):
+        valores = []
+        for campo, _ in self.claves:
+            valor = getattr(fila, 'pk' if campo == 'id' else campo)
+            valores.append(str(valor) if isinstance(valor, Decimal) else valor)
+        return valores
+
+    def _url(self, cursor):
+        parametros = self._request.GET.copy()
+        parametros.pop('page', None)
+        parametros['cursor'] = cursor
+        return '?' + parametros.urlencode()
+
+    @property
+    def url_siguiente(self):
+        if not (self.has_next and self.object_list):
+            return None
+        if self.por_desplazamiento:
+            return self._url(_codificar([self.desde + self.por_pagina], 'pos'))
+        return self._url(_codificar(self._valores(self.object_list[-1]), 'sig'))
+
+    @property
+    def url_anterior(self):
+        if not self.has_previous:
+            return None
+        if self.por_desplazamiento:
+            return self._url(_codificar([max(0, self.desde - self.por_pagina)], 'pos'))
+        if not self.object_list:
+            return None
+        return self._url(_codificar(self._valores(self.object_list[0]), 'ant'))
+
+
+def paginar(request, queryset, por_pagina=POR_PAGINA, contar='estimado', total=None):
+    """
+    Página de resultados para los listados. Usa el cursor salvo que llegue un ?page=N
+    de un link anterior, en cuyo caso responde con el Paginator clásico.
+    """
+    if 'page' in request.GET and 'cursor' not in request.GET:
+        return Paginator(queryset, por_pagina).get_page(request.GET.get('page'))
+    return PaginaCursor(request, queryset, por_pagina=por_pagina, contar=contar, total=total)
@@ -0,0 +1,144 @@
+"""
+Motor de búsqueda de productos.
+
+Todos los buscadores del sitio (home, header público, gestión y transferencias)
+pasan por ProductSearch. Cada producto guarda un `texto_busqueda` normalizado
+(minúsculas, sin tildes) con nombre, marca, ruta de categoría, descripción,
+código de barras y SKU.
+
+- PostgreSQL: `search_vector` (tsvector, índice GIN) con coincidencia por prefijo
+  y ranking, más un fallback por trigramas (pg_trgm) para errores de tipeo.
+- Otras bases (SQLite en desarrollo/tests): AND de `icontains` por término sobre
+  el mismo texto normalizado, así que también ignora tildes.
+
+Una consulta que parece un código (una sola palabra con dígitos) también busca
+como subcadena en SKU y código de barras, como hacían los buscadores de gestión y
+de transferencias. Renombrar una marca o una categoría, o mover una categoría,
+reindexa sus productos (signals.py).
+"""
+import re
+import unicodedata
+
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import F, Q, Value
+
+from .models import Categoria, Producto
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin tildes/diéresis para indexar y buscar de la misma forma."""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower().strip()
+
+
+def texto_busqueda_para(producto, ruta_categoria=None):
+    """Arma el texto indexable de un producto. `ruta_categoria` evita consultar ancestros si ya se conoce."""
+    if ruta_categoria is None:
+        ruta_categoria = str(producto.categoria) if producto.categoria_id else ''
+    partes = [
+        producto.nombre,
+        producto.marca.nombre if producto.marca_id else '',
+        ruta_categoria,
+        producto.descripcion_breve,
+        producto.codigo_barras,
+        producto.sku,
+    ]
+    return normalizar_texto(' '.join(p for p in partes if p))
+
+
+def actualizar_vectores(ids, using='default'):
+    """Recalcula search_vector desde texto_busqueda (solo PostgreSQL, un único UPDATE)."""
+    if connections[using].vendor != 'postgresql':
+        return
+    Producto.objects.using(using).filter(pk__in=ids).update(
+        search_vector=SearchVector('texto_busqueda', config='simple')
+    )
+
+
+def reindexar(queryset=None, lote=1000):
+    """Reconstruye texto_busqueda y search_vector en lotes. Devuelve cuántos productos reindexó."""
+    queryset = queryset if queryset is not None else Producto.objects.all()
+    ids = list(queryset.order_by('id').values_list('id', flat=True))
+    for inicio in range(0, len(ids), lote):
+        productos = list(Producto.objects.filter(id__in=ids[inicio:inicio + lote]).select_related('marca', 'categoria'))
+        rutas = Categoria.rutas_completas({p.categoria_id: p.categoria for p in productos}.values())
+        for p in productos:
+            p.texto_busqueda = texto_busqueda_para(p, rutas.get(p.categoria_id, ''))
+        Producto.objects.bulk_update(productos, ['texto_busqueda'])
+        actualizar_vectores([p.id for p in productos], using=queryset.db)
+    return len(ids)
+
+
+class ProductSearch:
+    """
+    API única de búsqueda de productos.
+
+        ProductSearch(Producto.objects.filter(esta_activo=True)).buscar("aceite natura")
+
+    Devuelve un queryset filtrado y, si `ordenar=True`, ordenado por relevancia.
+    """
+    # Largo mínimo de un término para intentar el fallback por trigramas
+    MINIMO_TRIGRAMA = 4
+
+    def __init__(self, queryset=None):
+        self.queryset = queryset if queryset is not None else Producto.objects.all()
+
+    @property
+    def es_postgres(self):
+        return connections[self.queryset.db].vendor == 'postgresql'
+
+    @staticmethod
+    def terminos(consulta):
+        return [t for t in re.split(r'[^\w]+', normalizar_texto(consulta)) if t]
+
+    @staticmethod
+    def codigo(consulta):
+        """La consulta tal cual si parece un SKU o código de barras (una palabra con dígitos); si no, None."""
+        codigo = (consulta or '').strip()
+        if codigo and not any(c.isspace() for c in codigo) and any(c.isdigit() for c in codigo):
+            return codigo
+        return None
+
+    def buscar(self, consulta, ordenar=True):
+        terminos = self.terminos(consulta)
+        if not terminos:
+            return self.queryset
+        if self.es_postgres:
+            return self._buscar_postgres(terminos, ordenar, self.codigo(consulta))
+        # texto_busqueda ya contiene SKU y código de barras, y acá se busca por subcadena
+        return self._buscar_basico(terminos, ordenar)
+
+    def _buscar_basico(self, terminos, ordenar):
+        filtro = Q()
+        for t in terminos:
+            filtro &= Q(texto_busqueda__contains=t)
+        resultado = self.queryset.filter(filtro)
+        return resultado.order_by('-id') if ordenar else resultado
+
+    def _buscar_postgres(self, terminos, ordenar, codigo=None):
+        # 1. Full-text por prefijo: "acei natu" -> 'acei':* & 'natu':*
+        query = SearchQuery(' & '.join(f"{t}:*" for t in terminos), search_type='raw', config='simple')
+        filtro = Q(search_vector=query)
+        if codigo:
+            # Parte de un SKU o código de barras ("7790" o "0042"), que el prefijo no encuentra
+            filtro |= Q(sku__icontains=codigo) | Q(codigo_barras__icontains=codigo)
+        resultado = self.queryset.filter(filtro)
+        if ordenar:
+            resultado = resultado.annotate(rango=SearchRank(F('search_vector'), query)).order_by('-rango', '-id')
+
+        # 2. Fallback por trigramas (errores de tipeo) solo si el full-text no encontró nada
+        texto = ' '.join(terminos)
+        if len(texto) < self.MINIMO_TRIGRAMA or resultado.exists():
+            return resultado
+
+        # Operador %> (indexable con gin_trgm_ops), sin registrar el lookup en todos los TextField
+        resultado = self.queryset.filter(TrigramWordSimilar(F('texto_busqueda'), texto))
+        if ordenar:
+            resultado = resultado.annotate(
+                similitud=TrigramWordSimilarity(Value(texto), 'texto_busqueda')
+            ).order_by('-similitud', '-id')
+        return resultado
@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Producto, HistorialPrecio, Marca, Categoria
+from .versiones import incrementar_version, invalidar_al_confirmar
+
+
+@receiver([post_save, post_delete], sender=Producto)
+@receiver([post_save, post_delete], sender=HistorialPrecio)
+@receiver([post_save, post_delete], sender=Marca)
+@receiver([post_save, post_delete], sender=Categoria)
+def invalidar_indice_productos(sender, **kwargs):
+    """Cualquier cambio de producto, precio, marca o categoría invalida el índice de sugerencias."""
+    invalidar_al_confirmar('productos')
+
+
+@receiver([post_save, post_delete], sender=Categoria)
+def invalidar_navegacion_categorias(sender, **kwargs):
+    """El menú de categorías cacheado (navegacion.py) depende de cualquier cambio en el árbol."""
+    invalidar_al_confirmar('categorias')
+
+
+def _indexado(instance):
+    """Lo de una marca o categoría que entra en el texto_busqueda de sus productos."""
+    return (instance.nombre, getattr(instance, 'padre_id', None))
+
+
+@receiver(pre_save, sender=Marca)
+@receiver(pre_save, sender=Categoria)
+def recordar_indexado_anterior(sender, instance, **kwargs):
+    anterior = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._indexado_anterior = _indexado(anterior) if anterior else None
+
+
+@receiver(post_save, sender=Marca)
+@receiver(post_save, sender=Categoria)
+def reindexar_busqueda(sender, instance, created, **kwargs):
+    """
+    texto_busqueda incluye la marca y la ruta de categoría: renombrar una marca o
+    renombrar/mover una categoría reindexa sus productos (y los de toda la rama).
+    """
+    anterior = getattr(instance, '_indexado_anterior', None)
+    if created or anterior is None or anterior == _indexado(instance):
+        return
+    pk = instance.pk
+
+    def reindexar_productos():
+        from .search import reindexar
+        if sender is Marca:
+            productos = Producto.objects.filter(marca_id=pk)
+        else:
+            # La ruta ya es la nueva: Categoria.save() reescribe la de la descendencia en la misma transacción
+            productos = Producto.objects.filter(categoria__ruta__startswith=Categoria.objects.get(pk=pk).ruta)
+        if reindexar(productos):
+            # El índice de sugerencias pudo reconstruirse con el texto viejo antes de esto
+            incrementar_version('productos')
+
+    transaction.on_commit(reindexar_productos, robust=True)
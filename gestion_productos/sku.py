@@ -0,0 +1,63 @@
+"""
+Asignación de SKUs automáticos ("00000042") sin carreras.
+
+En PostgreSQL los números salen de la secuencia gestion_productos_sku_seq:
+nextval() nunca repite un valor entre transacciones concurrentes y
+reservar_skus(n) pide los n de una sola vez (generate_series). En las demás
+bases (SQLite en desarrollo) la secuencia es la fila 'sku' de SecuenciaSKU:
+un UPDATE ultimo = ultimo + n toma el bloqueo de escritura y el bloque
+reservado queda para esa transacción.
+
+Un número reservado no se reutiliza aunque la transacción se revierta (igual
+que los ids): puede haber huecos, nunca duplicados.
+"""
+from django.db import connections, transaction
+from django.db.models import F
+
+from .models import Producto, SecuenciaSKU
+
+SECUENCIA = 'gestion_productos_sku_seq'
+NOMBRE = 'sku'
+
+
+def formatear_sku(numero):
+    return f"{numero:08d}"
+
+
+def maximo_en_uso(using='default'):
+    """Mayor número ya usado (id o SKU numérico): desde ahí arranca la secuencia."""
+    ultimo_id = Producto.objects.using(using).order_by('-id').values_list('id', flat=True).first() or 0
+    numericos = Producto.objects.using(using).filter(sku__regex=r'^[0-9]{1,18}$').values_list('sku', flat=True)
+    return max([ultimo_id] + [int(sku) for sku in numericos.iterator()])
+
+
+def _reservar_postgres(cantidad, using):
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [SECUENCIA, cantidad])
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def _reservar_tabla(cantidad, using):
+    secuencia = SecuenciaSKU.objects.using(using).filter(pk=NOMBRE)
+    with transaction.atomic(using=using):
+        if not secuencia.update(ultimo=F('ultimo') + cantidad):
+            # Base sin la fila (recién vaciada): se siembra con lo que ya está en uso
+            SecuenciaSKU.objects.using(using).get_or_create(pk=NOMBRE, defaults={'ultimo': maximo_en_uso(using)})
+            secuencia.update(ultimo=F('ultimo') + cantidad)
+        ultimo = secuencia.values_list('ultimo', flat=True).get()
+    return list(range(ultimo - cantidad + 1, ultimo + 1))
+
+
+def reservar_skus(cantidad, using='default'):
+    """Lista de `cantidad` SKUs nuevos y consecutivos dentro del bloque, en una sola ida a la base."""
+    if cantidad <= 0:
+        return []
+    if connections[using].vendor == 'postgresql':
+        numeros = _reservar_postgres(cantidad, using)
+    else:
+        numeros = _reservar_tabla(cantidad, using)
+    return [formatear_sku(n) for n in numeros]
+
+
+def siguiente_sku(using='default'):
+    return reservar_skus(1, using)[0]
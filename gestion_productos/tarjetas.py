@@ -0,0 +1,52 @@
+"""
+Caché de las tarjetas de producto (card_producto.html) ya renderizadas.
+
+La tarjeta es igual para todos los visitantes: el corazón de favorito se marca
+del lado del cliente con los ids que base.html publica en #favoritos-ids.
+
+La clave de cada tarjeta sale de todo lo que la tarjeta muestra: los datos del
+producto (y su actualizado_el), los precios desnormalizados, la marca y la
+imagen con sus variantes. Si algo cambia, cambia la clave y la próxima lectura
+renderiza una tarjeta nueva; no hay nada que borrar ni versiones aparte, y las
+tarjetas viejas vencen solas a las DURACION.
+
+Una página de listado resuelve sus 12 tarjetas con una sola lectura a la caché
+y solo renderiza las que faltan.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+DURACION = 60 * 60 * 24
+
+
+def clave_de(producto):
+    """Clave de la tarjeta del producto: distinta en cuanto cambia cualquier dato que se ve en ella."""
+    datos = (
+        producto.actualizado_el.timestamp() if producto.actualizado_el else 0,
+        producto.nombre, producto.slug, producto.exclusivo_online, producto.ahorrames,
+        producto.unidad_medida, producto.precio_por_unidad_medida,
+        # Los precios se escriben con update() (sincronizar_precio_actual): no tocan actualizado_el
+        producto.precio_venta_actual, producto.precio_regular_actual, producto.descuento_actual,
+        producto.marca.nombre,
+        producto.imagen_principal.name, sorted((producto.imagen_variantes or {}).items()),
+    )
+    return f"tarjeta:{producto.pk}:{hashlib.md5(repr(datos).encode()).hexdigest()}"
+
+
+def tarjetas_de(productos):
+    """{id: html} de la tarjeta de cada producto, renderizando y guardando solo las que faltan."""
+    productos = list(productos)
+    claves = {p.pk: clave_de(p) for p in productos}
+    encontradas = cache.get_many(list(claves.values()))
+    tarjetas, nuevas = {}, {}
+    for p in productos:
+        html = encontradas.get(claves[p.pk])
+        if html is None:
+            html = nuevas[claves[p.pk]] = render_to_string('card_producto.html', {'producto': p})
+        tarjetas[p.pk] = mark_safe(html)
+    if nuevas:
+        cache.set_many(nuevas, DURACION)
+    return tarjetas
@@ -1,4 +1,7 @@
 from django import template
+from django.utils.html import format_html
+
+from gestion_productos.imagenes import srcset, url_variante
 
 register = template.Library()
 
@@ -7,3 +10,29 @@ def get_item(dictionary, key):
     if not dictionary:
         return None
     return dictionary.get(key)
+
+
+@register.simple_tag
+def imagen_responsive(objeto, sizes='100vw', alt='', clase='', estilo='', lazy=True):
+    """
+    <picture> con srcset WebP y JPEG de las variantes de un Producto o ImagenProducto
+    (ver gestion_productos/imagenes.py). Sin variantes, un <img> con la imagen original.
+    Uso: {% imagen_responsive producto sizes="(max-width: 576px) 50vw, 200px" alt=producto.nombre %}
+    """
+    if hasattr(objeto, 'imagen_principal'):
+        imagen, variantes = objeto.imagen_principal, objeto.imagen_variantes
+    else:
+        imagen, variantes = objeto.imagen, objeto.variantes
+    if not imagen:
+        return ''
+
+    webp, jpg = srcset(imagen, variantes, 'webp'), srcset(imagen, variantes, 'jpg')
+    img = format_html(
+        '<img src="{}"{} alt="{}" class="{}" style="{}" loading="{}" decoding="async">',
+        url_variante(imagen, variantes, 'jpg640'),
+        format_html(' srcset="{}" sizes="{}"', jpg, sizes) if jpg else '',
+        alt, clase, estilo, 'lazy' if lazy else 'eager',
+    )
+    if not webp:
+        return img
+    return format_html('<picture><source type="image/webp" srcset="{}" sizes="{}">{}</picture>', webp, sizes, img)
@@ -1,3 +1,981 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import Storage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from configuracion_principal.storage_backends import IndiceMediaMixin
+from gestion_sucursales.models import MovimientoStock, Stock, Sucursal
+from .cargador import CargadorProductos
+from .imagenes import guardar_temporales, procesar_imagenes
+from .importacion import importar_catalogo
+from .forms import ProductoCargaForm
+from .forms_batch import UploadBatchForm
+from .marcas import DetectorMarcas
+from .navegacion import arbol_categorias
+from .models import ArchivoMedia, Categoria, Marca, Producto, HistorialPrecio, ImagenProducto, SecuenciaSKU
+from .search import ProductSearch
+from .sku import reservar_skus
+from . import typeahead
+from .typeahead import obtener_indice
+from .versiones import incrementar_version, obtener_version
+from .views_batch import CargaMasivaView
+
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+# Sin la caché de página completa: estos tests miden lo que cuesta la vista
+@override_settings(CACHES=CACHE_LOCAL, CACHE_PAGINAS=False)
+class HomeConsultasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            Sucursal.objects.create(nombre=f"Sucursal {i}", direccion="Calle 123", ciudad="Córdoba")
+        marca = Marca.objects.create(nombre="Natura")
+        for i in range(4):
+            raiz = Categoria.objects.create(nombre=f"Raiz {i}")
+            hija = Categoria.objects.create(nombre=f"Hija {i}", padre=raiz)
+            Categoria.objects.create(nombre=f"Nieta {i}", padre=hija)
+            for j in range(5):
+                producto = Producto.objects.create(
+                    nombre=f"Producto {i}-{j}", categoria=hija, marca=marca,
+                    descripcion_breve="Descripción", imagen_principal='productos/fotos/x.jpg',
+                )
+                HistorialPrecio.objects.create(producto=producto, precio_venta=100 + j, precio_regular=150)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_home_consultas_constantes(self):
+        # Primer request: arma y cachea la navegación (menú + sucursales)
+        self.client.get(reverse('home'))
+        # Con la navegación en caché: solo la página de productos (el cursor no hace COUNT)
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(reverse('home'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.context['productos']), 12)
+
+    def test_navegacion_se_invalida_al_cambiar_categorias(self):
+        self.client.get(reverse('home'))
+        # La versión se incrementa en on_commit
+        with self.captureOnCommitCallbacks(execute=True):
+            Categoria.objects.create(nombre="Nueva Raiz")
+        respuesta = self.client.get(reverse('home'))
+        self.assertContains(respuesta, "Nueva Raiz")
+
+    def test_menu_de_categorias_sale_de_una_consulta_y_oculta_inactivas(self):
+        raiz = Categoria.objects.create(nombre="Menu Raiz")
+        hija = Categoria.objects.create(nombre="Menu Hija", padre=raiz)
+        nieta = Categoria.objects.create(nombre="Menu Nieta", padre=hija)
+        Categoria.objects.create(nombre="Menu Bisnieta", padre=nieta)
+        inactiva = Categoria.objects.create(nombre="Menu Inactiva", padre=raiz, activa=False)
+        Categoria.objects.create(nombre="Menu Bajo Inactiva", padre=inactiva)
+
+        with self.assertNumQueries(1):
+            arbol = arbol_categorias()
+        nodo = next(c for c in arbol if c['nombre'] == "Menu Raiz")
+        self.assertEqual([h['nombre'] for h in nodo['hijos']], ["Menu Hija"])
+        self.assertEqual([n['nombre'] for n in nodo['hijos'][0]['hijos']], ["Menu Nieta"])
+        # Tres niveles: la bisnieta no entra al menú
+        self.assertEqual(nodo['hijos'][0]['hijos'][0]['hijos'], [])
+
+        # El HTML queda en la caché: la segunda página no vuelve a consultar categorías
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('home'))
+        self.assertFalse([q for q in consultas if 'FROM "gestion_productos_categoria"' in q['sql']])
+        self.assertContains(respuesta, "Menu Nieta")
+        self.assertNotContains(respuesta, "Menu Bisnieta")
+        self.assertNotContains(respuesta, "Menu Bajo Inactiva")
+
+
+    def test_paginacion_por_cursor_recorre_todo_sin_repetir(self):
+        # Uno sin precio para cubrir los NULL (van siempre al final)
+        Producto.objects.create(nombre="Sin precio", categoria=Categoria.objects.get(nombre="Hija 0"), marca=Marca.objects.get(),
+                                descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+        total = Producto.objects.count()
+        for orden in ['relevantes', 'menor_precio', 'mayor_precio']:
+            vistos, paginas, url = [], [], f"{reverse('home')}?orden={orden}"
+            while url:
+                pagina = self.client.get(url).context['productos']
+                paginas.append([p.id for p in pagina])
+                vistos += paginas[-1]
+                url = pagina.url_siguiente and reverse('home') + pagina.url_siguiente
+            self.assertEqual(len(vistos), total, orden)
+            self.assertEqual(len(set(vistos)), total, orden)
+            if orden != 'relevantes':
+                self.assertEqual(Producto.objects.get(id=vistos[-1]).nombre, "Sin precio")
+
+            # Volviendo desde la última página se obtiene la anterior exacta
+            url_anterior = reverse('home') + pagina.url_anterior
+            self.assertEqual([p.id for p in self.client.get(url_anterior).context['productos']], paginas[-2])
+
+    def test_cursor_con_valores_de_otro_tipo_vuelve_a_la_primera_pagina(self):
+        from .paginacion import _codificar
+        primera = [p.id for p in self.client.get(reverse('home') + '?orden=menor_precio').context['productos']]
+        for valores in (["no es un precio", 5], [{"x": 1}, [2]], [None, "abc"]):
+            url = f"{reverse('home')}?orden=menor_precio&cursor={_codificar(valores, 'sig')}"
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual([p.id for p in respuesta.context['productos']], primera)
+
+    def test_orden_por_relevancia_pagina_por_desplazamiento(self):
+        from django.db.models import FloatField, Value
+        from django.test import RequestFactory
+        from .paginacion import paginar
+        # Todos empatados en el puntaje: con claves float se saltearían o repetirían filas
+        productos = Producto.objects.annotate(rango=Value(0.0607927, output_field=FloatField())).order_by('-rango', '-id')
+        vistos, url = [], '/'
+        while url:
+            pagina = paginar(RequestFactory().get(url), productos, por_pagina=7)
+            self.assertTrue(pagina.por_desplazamiento)
+            vistos += [p.id for p in pagina]
+            url = pagina.url_siguiente and '/' + pagina.url_siguiente
+        self.assertEqual(vistos, list(productos.values_list('id', flat=True)))
+        self.assertEqual([p.id for p in paginar(RequestFactory().get('/' + pagina.url_anterior), productos, por_pagina=7)],
+                         vistos[-len(pagina) - 7:-len(pagina)])
+
+    def test_links_con_page_siguen_funcionando(self):
+        respuesta = self.client.get(reverse('home') + '?page=2')
+        self.assertEqual(respuesta.context['productos'].number, 2)
+
+    def test_tarjetas_cacheadas_se_invalidan_al_cambiar_el_precio(self):
+        def tarjetas_renderizadas(respuesta):
+            return sum(1 for t in respuesta.templates if t.name == 'card_producto.html')
+
+        self.assertEqual(tarjetas_renderizadas(self.client.get(reverse('home'))), 12)
+        self.assertEqual(tarjetas_renderizadas(self.client.get(reverse('home'))), 0)
+
+        producto = Producto.objects.order_by('-id').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            HistorialPrecio.objects.create(producto=producto, precio_venta=4321, precio_regular=4321)
+        respuesta = self.client.get(reverse('home'))
+        self.assertEqual(tarjetas_renderizadas(respuesta), 1)
+        self.assertContains(respuesta, '$ 4321.00')
+
+        # La marca es parte de la clave: renombrarla renueva las tarjetas de sus productos
+        Marca.objects.filter(pk=producto.marca_id).update(nombre="Marca Renombrada")
+        respuesta = self.client.get(reverse('home'))
+        self.assertEqual(tarjetas_renderizadas(respuesta), 12)
+        self.assertContains(respuesta, "Marca Renombrada")
+
+    def test_cargador_resuelve_relaciones_de_todos_los_productos_juntas(self):
+        productos = list(Producto.objects.order_by('id'))
+        ImagenProducto.objects.create(producto=productos[0], imagen='productos/galeria/a.jpg', orden=1)
+        ImagenProducto.objects.create(producto=productos[0], imagen='productos/galeria/b.jpg', orden=0)
+        CargadorProductos().registrar(productos)
+        # Galerías: una consulta; categorías y ancestros: una cada una
+        with self.assertNumQueries(3):
+            galerias = [p.galeria for p in productos]
+            ancestros = [[c.nombre for c in p.categoria_ancestros] for p in productos]
+        self.assertEqual([i.imagen.name for i in galerias[0]], ['productos/galeria/b.jpg', 'productos/galeria/a.jpg'])
+        self.assertFalse(any(galerias[1:]))
+        self.assertEqual(ancestros[0], ['Raiz 0'])
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class FacetasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.raiz = Categoria.objects.create(nombre="Almacén")
+        hijas = [Categoria.objects.create(nombre=f"Sub {i}", padre=cls.raiz) for i in range(3)]
+        marcas = [Marca.objects.create(nombre=f"Marca {i}") for i in range(3)]
+        for i in range(30):
+            producto = Producto.objects.create(
+                nombre=f"Producto {i}", categoria=hijas[i % 3], marca=marcas[i % 2 + (i % 5 == 0)],
+                descripcion_breve="x", imagen_principal='productos/fotos/x.jpg',
+                es_sin_tacc=i % 4 == 0, es_vegano=i % 6 == 0,
+            )
+            HistorialPrecio.objects.create(producto=producto, precio_venta=100 + 10 * i)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_contadores_coinciden_con_la_base(self):
+        url = reverse('categoria', args=[self.raiz.slug])
+        filtros = "?marca=Marca 0&subcategoria=sub-0&subcategoria=sub-1&dieta=sin_tacc&min_price=150&max_price=350"
+        contexto = self.client.get(url + filtros).context
+
+        esperados = Producto.objects.filter(
+            categoria__slug__in=['sub-0', 'sub-1'], marca__nombre='Marca 0', es_sin_tacc=True,
+            precio_venta_actual__gte=150, precio_venta_actual__lte=350,
+        )
+        self.assertEqual(contexto['productos'].paginator.count, esperados.count())
+        self.assertEqual(sorted(p.id for p in contexto['productos']), sorted(esperados.values_list('id', flat=True)))
+
+        # La faceta de marca no se filtra a sí misma: cuenta lo que sumaría cada marca
+        marcas = dict(contexto['marcas_disponibles'])
+        self.assertEqual(marcas['Marca 1'], Producto.objects.filter(
+            categoria__slug__in=['sub-0', 'sub-1'], marca__nombre='Marca 1', es_sin_tacc=True,
+            precio_venta_actual__gte=150, precio_venta_actual__lte=350,
+        ).count())
+        self.assertEqual(sum(b['cantidad'] for b in contexto['histograma_precios']), Producto.objects.filter(
+            categoria__slug__in=['sub-0', 'sub-1'], marca__nombre='Marca 0', es_sin_tacc=True,
+        ).count())
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.marca = Marca.objects.create(nombre="Natura")
+        cls.almacen = Categoria.objects.create(nombre="Almacén")
+        cls.aceites = Categoria.objects.create(nombre="Aceites", padre=cls.almacen)
+        cls.aceite = Producto.objects.create(
+            nombre="Aceite de Girasol 900ml", categoria=cls.aceites, marca=cls.marca, descripcion_breve="x",
+            codigo_barras="7790001234567", imagen_principal='productos/fotos/x.jpg',
+        )
+        Producto.objects.create(nombre="Aceite de Oliva", categoria=cls.almacen, marca=Marca.objects.create(nombre="Cocinero"),
+                                descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+
+    def buscar(self, consulta):
+        return list(ProductSearch().buscar(consulta).values_list('nombre', flat=True))
+
+    def test_ignora_tildes_y_exige_todos_los_terminos(self):
+        self.assertEqual(self.buscar("ACEITE almacen natura"), ["Aceite de Girasol 900ml"])
+        self.assertEqual(len(self.buscar("aceite almacén")), 2)
+        self.assertEqual(self.buscar("aceite arcor"), [])
+
+    def test_parte_del_sku_o_del_codigo_de_barras(self):
+        self.assertEqual(self.buscar("0001234"), ["Aceite de Girasol 900ml"])
+        self.assertEqual(self.buscar(self.aceite.sku[-3:]), ["Aceite de Girasol 900ml"])
+        self.assertEqual(ProductSearch.codigo(" A-12 "), "A-12")
+        self.assertIsNone(ProductSearch.codigo("aceite 900"))
+        self.assertIsNone(ProductSearch.codigo("aceite"))
+
+    def test_renombrar_marca_o_mover_categoria_reindexa(self):
+        self.marca.nombre = "Natura Premium"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.marca.save()
+        self.assertEqual(self.buscar("premium"), ["Aceite de Girasol 900ml"])
+
+        despensa = Categoria.objects.create(nombre="Despensa")
+        self.aceites.padre = despensa
+        with self.captureOnCommitCallbacks(execute=True):
+            self.aceites.save()
+        self.assertEqual(self.buscar("despensa"), ["Aceite de Girasol 900ml"])
+        self.assertEqual(self.buscar("almacen"), ["Aceite de Oliva"])
+
+        # Renombrar la raíz llega a los productos de toda la rama
+        despensa.nombre = "Góndola"
+        with self.captureOnCommitCallbacks(execute=True):
+            despensa.save()
+        self.assertEqual(self.buscar("gondola girasol"), ["Aceite de Girasol 900ml"])
+
+    def test_guardar_sin_cambios_no_reindexa(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.marca.save()
+            self.almacen.save()
+        self.assertFalse([c for c in callbacks if c.__name__ == 'reindexar_productos'])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', "Full-text y trigramas de PostgreSQL")
+    def test_postgres_prefijo_codigo_y_errores_de_tipeo(self):
+        from .search import reindexar
+        reindexar()
+        self.assertEqual(self.buscar("gira natu"), ["Aceite de Girasol 900ml"])
+        self.assertEqual(self.buscar("0001234"), ["Aceite de Girasol 900ml"])
+        self.assertIn("Aceite de Girasol 900ml", self.buscar("girasoll"))
+
+
+# Con la caché configurada (en base), no con CACHE_LOCAL
+class TypeaheadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.marca = Marca.objects.create(nombre="Natura")
+        almacen = Categoria.objects.create(nombre="Almacén")
+        cls.aceites = Categoria.objects.create(nombre="Aceites", padre=almacen)
+        cls.aceite = Producto.objects.create(nombre="Aceite de girasol 900ml", categoria=cls.aceites, marca=cls.marca,
+                                             descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+        HistorialPrecio.objects.create(producto=cls.aceite, precio_venta=100, es_actual=True)
+        Producto.objects.create(nombre="Yerba mate", categoria=almacen, marca=Marca.objects.create(nombre="Playadito"),
+                                descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+
+    def setUp(self):
+        cache.clear()
+        typeahead._estado.update(indice=None, version=None, verificado=0.0)
+
+    def indice(self):
+        # Sin esperar VERIFICAR_CADA segundos entre una verificación y la siguiente
+        typeahead._estado['verificado'] = 0.0
+        return obtener_indice()
+
+    def test_busca_por_marca_y_ruta_de_categoria(self):
+        indice = self.indice()
+        self.assertEqual([p['id'] for p in indice.buscar("natura")[0]], [self.aceite.pk])
+        self.assertEqual(indice.buscar("almacen")[1], 2)
+        self.assertEqual([p['id'] for p in indice.buscar("aceites gira")[0]], [self.aceite.pk])
+        self.assertEqual(indice.buscar(self.aceite.sku)[1], 1)
+
+    def test_se_reconstruye_tras_cambios_de_producto_precio_marca_y_categoria(self):
+        anterior = self.indice()
+        self.assertIs(self.indice(), anterior)
+        cambios = [
+            lambda: Producto.objects.filter(pk=self.aceite.pk).get().save(),
+            lambda: HistorialPrecio.objects.create(producto=self.aceite, precio_venta=90, es_actual=True),
+            self.marca.save,
+            self.aceites.save,
+        ]
+        for cambio in cambios:
+            with self.captureOnCommitCallbacks(execute=True):
+                cambio()
+            # Dentro de VERIFICAR_CADA segundos se sigue usando el mismo
+            self.assertIs(obtener_indice(), anterior)
+            nuevo = self.indice()
+            self.assertIsNot(nuevo, anterior)
+            anterior = nuevo
+        self.assertEqual(Decimal(anterior.buscar("girasol")[0][0]['precio']), Decimal('90'))
+
+    def test_una_version_perdida_no_vuelve_a_un_numero_usado(self):
+        inicial = obtener_version('productos')
+        for _ in range(3):
+            incrementar_version('productos')
+        cache.delete('version:productos')
+        time.sleep(0.005)
+        self.assertGreater(obtener_version('productos'), inicial + 3)
+
+    def test_la_cache_en_base_no_se_vacia_con_el_catalogo(self):
+        if 'redis' in type(cache).__module__:
+            self.skipTest("Redis expulsa según su propia política")
+        self.assertGreaterEqual(cache._max_entries, 10000)
+
+
+@override_settings(CACHES=CACHE_LOCAL, CACHE_PAGINAS=True)
+class CachePaginasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Almacén")
+        cls.producto = Producto.objects.create(nombre="Arroz", categoria=categoria, marca=Marca.objects.create(nombre="Natura"),
+                                               descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonimo_se_sirve_de_cache_y_revalida_con_304(self):
+        primera = self.client.get(reverse('home'))
+        # Cero consultas solo con una caché en memoria (LocMem acá, Redis en producción)
+        with self.assertNumQueries(0):
+            segunda = self.client.get(reverse('home'))
+        self.assertEqual(segunda.content, primera.content)
+        self.assertTrue(segunda['ETag'].startswith('"'))
+        self.assertIn('public', segunda['Cache-Control'])
+
+        no_modificada = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=segunda['ETag'])
+        self.assertEqual(no_modificada.status_code, 304)
+        self.assertEqual(no_modificada.content, b'')
+
+    def test_cambio_de_catalogo_genera_pagina_nueva(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            HistorialPrecio.objects.create(producto=self.producto, precio_venta=999, precio_regular=999)
+        respuesta = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, '$ 999.00')
+
+    def test_carrito_con_productos_no_usa_la_cache(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('agregar', args=[self.producto.id]))
+        respuesta = self.client.get(reverse('home'))
+        self.assertNotIn('ETag', respuesta)
+        self.assertIn('private', respuesta['Cache-Control'])
+        self.assertEqual(respuesta.context['unidades_totales_carrito'], 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_table'}},
+                   CACHE_PAGINAS=True)
+class CachePaginasEnBaseTests(TestCase):
+    """La caché por defecto (en base): un acierto no ejecuta la vista, pero lee la caché con consultas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('createcachetable', verbosity=0)
+        categoria = Categoria.objects.create(nombre="Almacén")
+        Producto.objects.create(nombre="Arroz", categoria=categoria, marca=Marca.objects.create(nombre="Natura"),
+                                descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+
+    def test_acierto_solo_consulta_la_tabla_de_cache(self):
+        primera = self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get(reverse('home'))
+        self.assertEqual(segunda.content, primera.content)
+        # Versiones del catálogo y la página: dos lecturas, ninguna al catálogo
+        self.assertEqual(len(consultas), 2)
+        self.assertTrue(all('cache_table' in c['sql'] for c in consultas))
+
+
+class PrecioDesnormalizadoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = Producto.objects.create(nombre="Arroz", categoria=Categoria.objects.create(nombre="Almacén"),
+                                               marca=Marca.objects.create(nombre="Natura"), descripcion_breve="x",
+                                               imagen_principal='productos/fotos/x.jpg')
+
+    def columnas(self):
+        return Producto.objects.values_list('precio_venta_actual', 'precio_regular_actual', 'descuento_actual').get(
+            pk=self.producto.pk)
+
+    def test_siguen_al_historial_al_crear_editar_y_borrar(self):
+        anterior = HistorialPrecio.objects.create(producto=self.producto, precio_venta=100, precio_regular=100)
+        self.assertEqual(self.columnas(), (Decimal('100'), Decimal('100'), 0))
+
+        vigente = HistorialPrecio.objects.create(producto=self.producto, precio_venta=80, precio_regular=100)
+        self.assertEqual(self.columnas(), (Decimal('80'), Decimal('100'), 20))
+
+        vigente.precio_venta = 90
+        vigente.save()
+        self.assertEqual(self.columnas(), (Decimal('90'), Decimal('100'), 10))
+
+        # El vigente deja de serlo: vuelve a leerse del historial (ya no queda ninguno actual)
+        vigente.es_actual = False
+        vigente.save()
+        self.assertEqual(self.columnas(), (None, None, 0))
+
+        anterior.es_actual = True
+        anterior.save()
+        self.assertEqual(self.columnas(), (Decimal('100'), Decimal('100'), 0))
+        anterior.delete()
+        self.assertEqual(self.columnas(), (None, None, 0))
+
+    def test_guardar_una_instancia_vieja_no_pisa_el_precio(self):
+        vieja = Producto.objects.get(pk=self.producto.pk)
+        HistorialPrecio.objects.create(producto=self.producto, precio_venta=80, precio_regular=100)
+        vieja.nombre = "Arroz largo fino"
+        vieja.save()
+        self.assertEqual(self.columnas(), (Decimal('80'), Decimal('100'), 20))
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).nombre, "Arroz largo fino")
+
+
+class ImportacionCatalogoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.centro = Sucursal.objects.create(nombre="Centro", direccion="Calle 123", ciudad="Córdoba")
+        Marca.objects.create(nombre="Natura")
+        almacen = Categoria.objects.create(nombre="Almacén")
+        Categoria.objects.create(nombre="Aceites", padre=almacen)
+
+    def importar(self, texto, lote=100):
+        return importar_catalogo(io.BytesIO(texto.encode('utf-8')), 'catalogo.csv', lote=lote)
+
+    def test_crea_y_actualiza_por_sku_con_precios_y_stock(self):
+        resumen = self.importar(
+            "sku;nombre;marca;categoria;precio_venta;precio_regular;stock:Centro\n"
+            "A1;Aceite 900ml;natura;Almacén > Aceites;1.500,50;2000;10\n"
+            "A2;Aceite 1.5l;Natura;aceites;2500;;5\n"
+        )
+        self.assertEqual((resumen['creados'], resumen['actualizados'], resumen['errores']), (2, 0, []))
+        a1 = Producto.objects.get(sku='A1')
+        self.assertEqual(a1.precio_venta_actual, Decimal('1500.50'))
+        self.assertEqual(a1.descuento_actual, 25)
+        self.assertIn('aceite', a1.texto_busqueda)
+        self.assertEqual(Stock.objects.get(producto=a1, sucursal=self.centro).cantidad, 10)
+
+        # Reimportar: mismo precio no genera historial; el stock se ajusta y queda registrado
+        resumen = self.importar(
+            "sku,nombre,marca,categoria,precio_venta,precio_regular,stock:Centro\n"
+            "A1,Aceite 900ml,Natura,Aceites,1500.50,2000,4\n"
+        )
+        self.assertEqual((resumen['creados'], resumen['actualizados']), (0, 1))
+        self.assertEqual(a1.precios.count(), 1)
+        self.assertEqual(Stock.objects.get(producto=a1, sucursal=self.centro).cantidad, 4)
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(producto=a1).order_by('id').values_list('tipo', 'cantidad')),
+            [('ENT', 10), ('AJU', -6)]
+        )
+
+        # Precio nuevo: el anterior deja de ser el vigente; sin columna precio_regular la oferta sigue
+        self.importar("sku,nombre,marca,categoria,precio_venta\nA1,Aceite 900ml,Natura,Aceites,1800\n")
+        self.assertEqual(a1.precios.count(), 2)
+        vigente = a1.precios.get(es_actual=True)
+        self.assertEqual((vigente.precio_venta, vigente.precio_regular), (Decimal('1800'), Decimal('2000')))
+        a1.refresh_from_db()
+        self.assertEqual((a1.precio_regular_actual, a1.descuento_actual), (Decimal('2000'), 10))
+
+    def test_sin_columna_precio_regular_no_borra_las_ofertas(self):
+        self.importar("sku,nombre,marca,categoria,precio_venta,precio_regular\nC1,Arroz,Natura,Almacén,80,100\n")
+        # Mismo precio de venta: no hay precio nuevo ni cambia el descuento
+        self.importar("sku,nombre,marca,categoria,precio_venta\nC1,Arroz 1kg,Natura,Almacén,80\n")
+        c1 = Producto.objects.get(sku='C1')
+        self.assertEqual((c1.nombre, c1.precio_regular_actual, c1.descuento_actual), ("Arroz 1kg", Decimal('100'), 20))
+        self.assertEqual(c1.precios.count(), 1)
+        # Un precio por encima del regular anterior termina la oferta
+        self.importar("sku,nombre,marca,categoria,precio_venta\nC1,Arroz 1kg,Natura,Almacén,120\n")
+        c1.refresh_from_db()
+        self.assertEqual((c1.precio_regular_actual, c1.descuento_actual), (Decimal('120'), 0))
+        # Columna presente y vacía: sin oferta
+        self.importar("sku,nombre,marca,categoria,precio_venta,precio_regular\nC1,Arroz 1kg,Natura,Almacén,90,\n")
+        c1.refresh_from_db()
+        self.assertEqual((c1.precio_regular_actual, c1.descuento_actual), (Decimal('90'), 0))
+
+    def test_punto_como_separador_de_miles_es_ambiguo(self):
+        resumen = self.importar(
+            "sku;nombre;marca;categoria;precio_venta;peso_kg\n"
+            "D1;Yerba;Natura;Almacén;1.500;0.500\n"
+            "D2;Azúcar;Natura;Almacén;1.500,00;1.5\n"
+            "D3;Harina;Natura;Almacén;1500.5;0,250\n"
+        )
+        self.assertEqual([(fila, sku) for fila, sku, _ in resumen['errores']], [(2, 'D1')])
+        self.assertIn("ambiguo", resumen['errores'][0][2])
+        self.assertEqual(Producto.objects.get(sku='D2').precio_venta_actual, Decimal('1500'))
+        self.assertEqual(Producto.objects.get(sku='D3').precio_venta_actual, Decimal('1500.5'))
+        self.assertEqual(Producto.objects.get(sku='D3').peso_kg, Decimal('0.250'))
+
+    def test_las_filas_con_error_se_informan_sin_frenar_el_resto(self):
+        resumen = self.importar(
+            "sku,nombre,marca,categoria,precio_venta\n"
+            "B1,Arroz,Natura,Almacén,100\n"
+            ",Sin sku,Natura,Almacén,100\n"
+            "B2,Fideos,Marca X,Almacén,100\n"
+            "B3,Harina,Natura,Almacén,abc\n"
+            "B4,Azúcar,Natura,Almacén,100\n"
+            "B4,Azúcar x2,Natura,Almacén,200\n",
+            lote=3,
+        )
+        self.assertEqual(resumen['creados'], 2)
+        self.assertEqual([(fila, sku) for fila, sku, _ in resumen['errores']], [(3, ''), (4, 'B2'), (5, 'B3'), (6, 'B4')])
+        self.assertEqual(Producto.objects.get(sku='B4').nombre, "Azúcar x2")
+        # Sin SKU no hay upsert posible: la fila no crea un producto nuevo cada vez que se reimporta
+        self.assertFalse(Producto.objects.filter(nombre="Sin sku").exists())
+
+
+class SecuenciaSKUTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre="Almacén")
+        cls.marca = Marca.objects.create(nombre="Natura")
+
+    def crear(self, nombre, **datos):
+        return Producto.objects.create(nombre=nombre, categoria=self.categoria, marca=self.marca,
+                                       descripcion_breve="x", imagen_principal='productos/fotos/x.jpg', **datos)
+
+    def test_bloques_consecutivos_sin_reusar_tras_borrar(self):
+        primero = self.crear("Arroz")
+        bloque = reservar_skus(3)
+        self.assertEqual([int(s) for s in bloque], list(range(int(primero.sku) + 1, int(primero.sku) + 4)))
+        self.crear("Fideos").delete()
+        self.assertEqual(int(self.crear("Harina").sku), int(bloque[-1]) + 2)
+
+    @unittest.skipIf(connection.vendor == 'postgresql', "En PostgreSQL la secuencia no usa la tabla")
+    def test_sin_fila_arranca_despues_de_lo_usado(self):
+        self.crear("Arroz", sku="00000500")
+        SecuenciaSKU.objects.all().delete()
+        self.assertEqual(reservar_skus(2), ["00000501", "00000502"])
+        self.assertEqual(reservar_skus(1), ["00000503"])
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', "SQLite en memoria no admite escrituras concurrentes entre hilos")
+class SecuenciaSKUConcurrenciaTests(TransactionTestCase):
+    """Altas simultáneas desde muchos hilos: ningún SKU repetido."""
+
+    HILOS = 12
+    ALTAS = 10
+
+    def test_altas_concurrentes(self):
+        categoria = Categoria.objects.create(nombre="Almacén")
+        marca = Marca.objects.create(nombre="Natura")
+        reservados = []
+        barrera = threading.Barrier(self.HILOS)
+
+        def crear(indice):
+            barrera.wait()
+            try:
+                for i in range(self.ALTAS):
+                    # Mitad altas sueltas (Producto.save) y mitad bloques como los de la carga masiva
+                    if i % 2:
+                        reservados.extend(reservar_skus(5))
+                    else:
+                        Producto.objects.create(nombre=f"P {indice}-{i}", categoria=categoria, marca=marca,
+                                                descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+            finally:
+                close_old_connections()
+
+        hilos = [threading.Thread(target=crear, args=(i,)) for i in range(self.HILOS)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        skus = list(Producto.objects.values_list('sku', flat=True)) + reservados
+        self.assertEqual(Producto.objects.count(), self.HILOS * self.ALTAS // 2)
+        self.assertEqual(len(skus), len(set(skus)))
+
+
+def imagen_png(nombre, ancho=1200, alto=900):
+    from PIL import Image
+    salida = io.BytesIO()
+    Image.new('RGB', (ancho, alto), (200, 30, 30)).save(salida, 'PNG')
+    return SimpleUploadedFile(nombre, salida.getvalue(), content_type='image/png')
+
+
+class ImagenesTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = self.settings(MEDIA_ROOT=self.media, IMAGENES_PROCESOS=2, IMAGENES_HILOS=4)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_variantes_webp_en_paralelo(self):
+        from PIL import Image
+        temporales = guardar_temporales([imagen_png(f"foto_{i}.png") for i in range(3)])
+        resultado = procesar_imagenes(
+            dict(enumerate(temporales)), {i: f"productos/fotos/foto_{i}.png" for i in range(3)}
+        )
+        self.assertEqual(set(resultado), {0, 1, 2})
+        for i, datos in resultado.items():
+            self.assertTrue(default_storage.exists(datos['imagen']))
+            self.assertEqual(datos['variantes']['origen'], datos['imagen'])
+            with default_storage.open(datos['variantes']['webp320']) as f, Image.open(f) as imagen:
+                self.assertEqual((imagen.format, imagen.size), ('WEBP', (320, 240)))
+            # No se agranda: el ancho máximo es el de la foto (1200), no 1280
+            self.assertIn('jpg1200', datos['variantes'])
+            self.assertNotIn('jpg1280', datos['variantes'])
+
+    def test_los_hilos_del_storage_cierran_su_conexion(self):
+        from . import imagenes
+        with mock.patch.object(imagenes, 'connections') as conexiones:
+            self.assertEqual(imagenes._mapa(3, lambda a, b: a * b, range(10), range(10)), [i * i for i in range(10)])
+        # Una vez por hilo, no por archivo
+        self.assertEqual(conexiones.close_all.call_count, 3)
+
+    def test_subida_fallida_borra_lo_que_ya_se_habia_subido(self):
+        from . import imagenes
+        temporales = guardar_temporales([imagen_png(f"foto_{i}.png", 400, 300) for i in range(2)])
+        subir = imagenes._subir
+        llamadas = []
+
+        def falla_a_la_quinta(ruta, nombre):
+            llamadas.append(nombre)
+            if len(llamadas) == 5:
+                raise RuntimeError("bucket caído")
+            return subir(ruta, nombre)
+
+        with self.settings(IMAGENES_HILOS=1), mock.patch.object(imagenes, '_subir', falla_a_la_quinta):
+            with self.assertRaises(RuntimeError):
+                procesar_imagenes(dict(enumerate(temporales)), {i: f"productos/fotos/foto_{i}.png" for i in range(2)})
+        _, variantes = default_storage.listdir('productos/variantes')
+        self.assertEqual(variantes, [])
+        self.assertFalse(default_storage.exists('productos/fotos/foto_0.png'))
+
+    def test_carga_masiva_con_error_de_imagenes_no_guarda_nada(self):
+        with mock.patch('gestion_productos.views_batch.procesar_imagenes', side_effect=RuntimeError("bucket caído")):
+            respuesta = self.cargar_por_lote()
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertFalse(Producto.objects.exists())
+
+    def cargar_por_lote(self):
+        categoria = Categoria.objects.create(nombre="Almacén")
+        marca = Marca.objects.create(nombre="Natura")
+        admin = get_user_model().objects.create_superuser(email='admin@test.com', password='x', username='admin')
+        self.client.force_login(admin)
+        temp, = guardar_temporales([imagen_png("aceite_natura_900_ml.png")])
+
+        respuesta = self.client.post(reverse('admin:gestion_productos_producto_batch_upload'), {
+            'confirm_save': '1', 'categoria_id': categoria.id,
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '0',
+            'form-0-nombre': 'Aceite Natura 900ML', 'form-0-marca': marca.id, 'form-0-contenido_neto': '900',
+            'form-0-unidad_medida': 'ML', 'form-0-tipo_envase': 'BOT', 'form-0-descripcion_breve': 'Aceite',
+            'form-0-precio_venta': '1500', 'form-0-temp_image_path': temp, 'form-0-peso_kg': '0.9',
+        })
+        respuesta.temp = temp
+        return respuesta
+
+    def test_carga_masiva_guarda_producto_con_variantes(self):
+        temp = self.cargar_por_lote().temp
+        producto = Producto.objects.get()
+        self.assertEqual(producto.imagen_principal.name, 'productos/fotos/aceite_natura_900_ml.png')
+        self.assertTrue(producto.imagen_tarjeta_url.endswith('_320.webp'))
+        self.assertFalse(default_storage.exists(temp))
+
+        # Si la imagen se reemplaza, las variantes viejas ya no se usan
+        producto.imagen_principal.name = 'productos/fotos/otra.png'
+        self.assertEqual(producto.imagen_tarjeta_url, producto.imagen_principal.url)
+
+    def test_variantes_al_guardar_y_srcset_en_la_tarjeta(self):
+        from django.template.loader import render_to_string
+        nombre = default_storage.save('productos/fotos/arroz.png', imagen_png('arroz.png', 800, 800))
+        with self.captureOnCommitCallbacks(execute=True):
+            producto = Producto.objects.create(
+                nombre="Arroz", categoria=Categoria.objects.create(nombre="Almacén"),
+                marca=Marca.objects.create(nombre="Natura"), descripcion_breve="x", imagen_principal=nombre,
+            )
+        producto.refresh_from_db()
+        self.assertEqual(
+            sorted(k for k in producto.imagen_variantes if k.startswith('webp')), ['webp160', 'webp320', 'webp640', 'webp800']
+        )
+
+        html = render_to_string('card_producto.html', {'producto': producto})
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(' 640w', html)
+        self.assertIn('loading="lazy"', html)
+
+    def crear_con_imagen(self, nombre):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Producto.objects.create(
+                nombre="Arroz", categoria=Categoria.objects.create(nombre="Almacén"),
+                marca=Marca.objects.create(nombre="Natura"), descripcion_breve="x", imagen_principal=nombre,
+            )
+
+    def test_producto_con_galeria_se_procesa_en_una_sola_tanda(self):
+        from django.db import transaction
+        from . import imagenes
+        nombres = [default_storage.save(f'productos/fotos/foto_{i}.png', imagen_png(f'foto_{i}.png', 400, 300))
+                   for i in range(4)]
+        with mock.patch.object(imagenes, 'procesar_imagenes', wraps=imagenes.procesar_imagenes) as procesar:
+            with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+                producto = Producto.objects.create(
+                    nombre="Arroz", categoria=Categoria.objects.create(nombre="Almacén"),
+                    marca=Marca.objects.create(nombre="Natura"), descripcion_breve="x", imagen_principal=nombres[0],
+                )
+                for orden, nombre in enumerate(nombres[1:]):
+                    ImagenProducto.objects.create(producto=producto, imagen=nombre, orden=orden)
+        procesar.assert_called_once()
+        self.assertEqual(sorted(procesar.call_args.args[0].values()), sorted(nombres))
+        producto.refresh_from_db()
+        self.assertIn('webp320', producto.imagen_variantes)
+        for imagen in ImagenProducto.objects.filter(producto=producto):
+            self.assertEqual(imagen.variantes['origen'], imagen.imagen.name)
+            self.assertIn('webp160', imagen.variantes)
+
+    def test_imagen_ilegible_queda_marcada_y_no_se_reintenta(self):
+        nombre = default_storage.save('productos/fotos/rota.png', ContentFile(b'no es una imagen'))
+        producto = self.crear_con_imagen(nombre)
+        self.assertEqual(producto.imagen_variantes, {'origen': nombre, 'fallida': True})
+        producto.refresh_from_db()
+        self.assertEqual(producto.imagen_variantes, {'origen': nombre, 'fallida': True})
+        self.assertEqual(producto.imagen_tarjeta_url, producto.imagen_principal.url)
+
+        with mock.patch('gestion_productos.imagenes.procesar_imagenes') as procesar:
+            with self.captureOnCommitCallbacks(execute=True):
+                producto.save()
+        procesar.assert_not_called()
+
+    def test_error_del_storage_no_rompe_un_guardado_confirmado(self):
+        nombre = default_storage.save('productos/fotos/arroz.png', imagen_png('arroz.png', 400, 400))
+        with mock.patch('gestion_productos.imagenes._subir', side_effect=RuntimeError("bucket caído")):
+            producto = self.crear_con_imagen(nombre)
+        producto.refresh_from_db()
+        self.assertTrue(producto.imagen_variantes['fallida'])
+
+
+class S3EnMemoria(Storage):
+    """Bucket en memoria que cuenta las llamadas (el papel de un MinIO local en los tests)."""
+
+    def __init__(self):
+        self.objetos = {}
+        self.llamadas = Counter()
+
+    def _save(self, name, content):
+        self.llamadas['put'] += 1
+        self.objetos[name] = content.read()
+        return name
+
+    def _open(self, name, mode='rb'):
+        self.llamadas['get'] += 1
+        return ContentFile(self.objetos[name], name=name)
+
+    def exists(self, name):
+        self.llamadas['head'] += 1
+        return name in self.objetos
+
+    def size(self, name):
+        self.llamadas['head'] += 1
+        return len(self.objetos[name])
+
+    def delete(self, name):
+        self.llamadas['delete'] += 1
+        self.objetos.pop(name, None)
+
+    def url(self, name):
+        return f"/media/{name}"
+
+
+class MediaEnMemoria(IndiceMediaMixin, S3EnMemoria):
+    pass
+
+
+class IndiceMediaTests(TestCase):
+    def setUp(self):
+        self.storage = MediaEnMemoria()
+
+    def test_mismo_contenido_se_sube_una_vez_y_se_borra_con_el_ultimo_uso(self):
+        primero = self.storage.save('productos/fotos/a.png', ContentFile(b'foto'))
+        segundo = self.storage.save('productos/fotos/b.png', ContentFile(b'foto'))
+        self.assertEqual((primero, segundo), ('productos/fotos/a.png', 'productos/fotos/a.png'))
+        self.assertEqual(self.storage.llamadas['put'], 1)
+
+        # exists() y size() no van al remoto
+        self.assertTrue(self.storage.exists(primero))
+        self.assertEqual(self.storage.size(primero), 4)
+        self.assertEqual(self.storage.llamadas['head'], 0)
+
+        self.storage.delete(primero)
+        self.assertIn(primero, self.storage.objetos)
+        self.storage.delete(primero)
+        self.assertNotIn(primero, self.storage.objetos)
+        self.assertFalse(ArchivoMedia.objects.exists())
+
+    def test_nombre_ocupado_con_otro_contenido_no_se_pisa(self):
+        primero = self.storage.save('productos/fotos/a.png', ContentFile(b'foto 1'))
+        segundo = self.storage.save('productos/fotos/a.png', ContentFile(b'foto 2'))
+        self.assertNotEqual(primero, segundo)
+        self.assertEqual(self.storage.objetos[primero], b'foto 1')
+        self.assertEqual(self.storage.llamadas['head'], 0)
+
+    def test_temporales_no_son_destino_de_deduplicacion(self):
+        temporal = self.storage.save('temp_batch/x_a.png', ContentFile(b'foto'))
+        final = self.storage.save('productos/fotos/a.png', ContentFile(b'foto'))
+        self.assertEqual(final, 'productos/fotos/a.png')
+        self.storage.delete(temporal)
+        self.assertEqual(set(self.storage.objetos), {final})
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class GrillaGestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sucursal = Sucursal.objects.create(nombre="Centro", direccion="Calle 1", ciudad="Córdoba")
+        categoria = Categoria.objects.create(nombre="Grilla")
+        marca = Marca.objects.create(nombre="Marca Grilla")
+        for i in range(30):
+            producto = Producto.objects.create(nombre=f"Grilla {i}", categoria=categoria, marca=marca,
+                                               descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+            HistorialPrecio.objects.create(producto=producto, precio_venta=100 + i, es_actual=True)
+            # Uno sin registro de stock: cuenta como 0
+            if i:
+                Stock.objects.create(producto=producto, sucursal=cls.sucursal, cantidad=(i * 7) % 31)
+        cls.admin = get_user_model().objects.create_user(username='grilla', email='grilla@example.com', password='x',
+                                                         rol='SA', sucursal=cls.sucursal)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_ordena_por_stock_local_y_recorre_las_paginas_por_cursor(self):
+        url = reverse('gestion_productos:buscar_gestion_ajax')
+        respuesta = self.client.get(url, {'orden': '-stock'})
+        pagina = respuesta.context['productos_gestion']
+        self.assertEqual(len(pagina), 25)
+        vistos = list(pagina)
+
+        respuesta = self.client.get(url + pagina.url_siguiente)
+        vistos += list(respuesta.context['productos_gestion'])
+        self.assertEqual(len({p.id for p in vistos}), 30)
+
+        stock = [p.stock_local for p in vistos]
+        self.assertEqual(stock, sorted(stock, reverse=True))
+        self.assertEqual(stock[-1], 0)
+        self.assertContains(respuesta, 'data-orden="stock"')
+
+    def test_dashboard_no_carga_el_catalogo(self):
+        respuesta = self.client.get(reverse('gestion_interna:dashboard'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('productos_todos', respuesta.context)
+        self.assertNotContains(respuesta, "Grilla 0")
+
+
+class CategoriaRutaTests(TestCase):
+    def setUp(self):
+        self.almacen = Categoria.objects.create(nombre="Almacén")
+        self.aceites = Categoria.objects.create(nombre="Aceites", padre=self.almacen)
+        self.girasol = Categoria.objects.create(nombre="Girasol", padre=self.aceites)
+        self.alto_oleico = Categoria.objects.create(nombre="Alto oleico", padre=self.girasol)
+        self.cocina = Categoria.objects.create(nombre="Cocina")
+
+    def rutas(self):
+        return dict(Categoria.objects.values_list('id', 'ruta'))
+
+    def test_mover_una_rama_reescribe_la_ruta_de_toda_la_descendencia(self):
+        self.aceites.padre = self.cocina
+        self.aceites.save()
+        c, a, g, o = self.cocina.pk, self.aceites.pk, self.girasol.pk, self.alto_oleico.pk
+        rutas = self.rutas()
+        self.assertEqual(rutas[a], f"{c}/{a}/")
+        self.assertEqual(rutas[g], f"{c}/{a}/{g}/")
+        self.assertEqual(rutas[o], f"{c}/{a}/{g}/{o}/")
+        self.assertEqual(rutas[self.almacen.pk], f"{self.almacen.pk}/")
+        self.assertEqual(Categoria.objects.get(pk=o).ancestros_ids(), [c, a, g])
+        self.assertEqual(set(self.almacen.descendientes_ids()), {self.almacen.pk})
+
+        # Y de vuelta a raíz
+        self.aceites.padre = None
+        self.aceites.save()
+        self.assertEqual(self.rutas()[o], f"{a}/{g}/{o}/")
+
+    def test_clean_rechaza_ciclos(self):
+        for padre in (self.aceites, self.alto_oleico):
+            self.aceites.padre = Categoria.objects.get(pk=padre.pk)
+            with self.assertRaises(ValidationError):
+                self.aceites.clean()
+        self.aceites.padre = self.cocina
+        self.aceites.clean()
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CategoriaChoiceFieldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.raiz = Categoria.objects.create(nombre="Almacén")
+        cls.hija = Categoria.objects.create(nombre="Aceites", padre=cls.raiz)
+        cls.nieta = Categoria.objects.create(nombre="Oliva", padre=cls.hija)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rutas_completas_sin_consultas_por_opcion(self):
+        with self.assertNumQueries(1):
+            html = str(ProductoCargaForm()['categoria'])
+        self.assertIn("Almacén &gt; Aceites &gt; Oliva", html)
+        # Cacheadas por versión de 'categorias': el segundo render no consulta
+        with self.assertNumQueries(0):
+            str(ProductoCargaForm()['categoria'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.raiz.nombre = "Despensa"
+            self.raiz.save()
+        self.assertIn("Despensa &gt; Aceites &gt; Oliva", str(ProductoCargaForm()['categoria']))
+
+    @override_settings(CATEGORIAS_MAX_SELECT=2)
+    def test_con_muchas_categorias_solo_renderiza_la_elegida(self):
+        form = UploadBatchForm(initial={'categoria': self.hija.pk})
+        self.assertTrue(form.fields['categoria'].usa_buscador)
+        html = str(form['categoria'])
+        self.assertIn('data-buscador="categoria"', html)
+        self.assertIn("Almacén &gt; Aceites", html)
+        self.assertNotIn("Oliva", html)
+        # La validación no depende de las opciones renderizadas
+        self.assertEqual(form.fields['categoria'].clean(self.nieta.pk), self.nieta)
+
+
+class DetectorMarcasTests(TestCase):
+    def test_marca_mas_larga_por_palabras_completas(self):
+        detector = DetectorMarcas([(1, "La Serenísima"), (2, "La Serenisima Clásica"), (3, "Arcor"), (4, "Coca-Cola")])
+        self.assertEqual(detector.buscar("leche la serenisima clasica 1 lt"), 2)
+        self.assertEqual(detector.buscar("Dulce LA SERENÍSIMA 400 gr"), 1)
+        self.assertEqual(detector.buscar("gaseosa coca cola 2.25 lt"), 4)
+        # Dentro de otra palabra no cuenta
+        self.assertIsNone(detector.buscar("galletitas marcorp 300 gr"))
+
+    def test_parse_filename_lee_las_marcas_una_sola_vez(self):
+        Marca.objects.create(nombre="Natura")
+        Marca.objects.create(nombre="Natura Light")
+        vista = CargaMasivaView()
+        with self.assertNumQueries(1):
+            detector = DetectorMarcas.desde_base()
+        with self.assertNumQueries(0):
+            datos = [vista.parse_filename(n, detector) for n in ("aceite_natura_light_900_ml.jpg", "mayonesa-natura-250-gr.png")]
+        self.assertEqual([Marca.objects.get(pk=d['marca']).nombre for d in datos], ["Natura Light", "Natura"])
+        self.assertEqual(datos[1]['unidad_medida'], 'GR')
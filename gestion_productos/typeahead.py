@@ -0,0 +1,111 @@
+"""
+Índice de sugerencias del buscador del header (typeahead).
+
+Se arma en memoria una sola vez por worker con todos los productos visibles
+y se responde cada tecla con búsquedas binarias sobre arrays ordenados, sin
+tocar la base. Las palabras salen del mismo `texto_busqueda` que usa
+ProductSearch (nombre, marca, ruta de categoría, descripción y códigos), así que
+"natura" o "almacen" encuentran lo mismo que en el buscador de la home. La versión
+'productos' (ver versiones.py / signals.py) indica cuándo hay que reconstruirlo;
+se consulta como mucho cada VERIFICAR_CADA segundos para no pagar un acceso a la
+caché por tecla.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from .models import Producto
+from .imagenes import srcset
+from .search import ProductSearch
+from .versiones import obtener_version
+
+VERIFICAR_CADA = 2  # segundos
+IMAGEN_POR_DEFECTO = '/static/img/no-product.png'
+
+
+class IndiceSugerencias:
+    def __init__(self, productos):
+        entradas = []
+        self.palabras = {}
+        self.datos = {}
+
+        for p in productos:
+            palabras = ProductSearch.terminos(p.texto_busqueda or ' '.join(filter(None, (p.nombre, p.sku, p.codigo_barras))))
+            self.palabras[p.id] = palabras
+            for clave in set(palabras):
+                entradas.append((clave, p.id))
+
+            self.datos[p.id] = {
+                'id': p.id,
+                'sku': p.sku,
+                'nombre': p.nombre,
+                'precio': str(p.precio_actual()),
+                'slug': p.slug,
+                'marca': p.marca.nombre if p.marca else "",
+                'categoria': p.categoria.nombre if p.categoria else "General",
+                'imagen_url': p.imagen_miniatura_url or IMAGEN_POR_DEFECTO,
+                # Solo los anchos chicos: las mini cards miden ~110 px
+                'imagen_srcset': srcset(p.imagen_principal, p.imagen_variantes, 'webp', maximo=320),
+            }
+
+        entradas.sort()
+        self.claves = [clave for clave, _ in entradas]
+        self.ids = [pid for _, pid in entradas]
+
+    @classmethod
+    def construir(cls):
+        productos = (
+            Producto.objects.filter(esta_activo=True, categoria__activa=True)
+            .select_related('marca', 'categoria')
+            .only('id', 'sku', 'codigo_barras', 'nombre', 'slug', 'precio_venta_actual', 'texto_busqueda',
+                  'imagen_principal', 'imagen_variantes', 'marca__nombre', 'categoria__nombre')
+        )
+        return cls(productos.iterator(chunk_size=2000))
+
+    def _por_prefijo(self, prefijo):
+        i = bisect_left(self.claves, prefijo)
+        encontrados = set()
+        while i < len(self.claves) and self.claves[i].startswith(prefijo):
+            encontrados.add(self.ids[i])
+            i += 1
+        return encontrados
+
+    def buscar(self, consulta, limite=4):
+        """Retorna (lista de dicts para las mini cards, total de coincidencias)."""
+        terminos = ProductSearch.terminos(consulta)
+        if not terminos:
+            return [], 0
+
+        # El término más largo es el más selectivo: de ahí salen los candidatos
+        terminos.sort(key=len, reverse=True)
+        candidatos = self._por_prefijo(terminos[0])
+        resto = terminos[1:]
+        if resto:
+            candidatos = {
+                pid for pid in candidatos
+                if all(any(palabra.startswith(t) for palabra in self.palabras[pid]) for t in resto)
+            }
+
+        # Más nuevos primero, igual que los listados
+        mejores = sorted(candidatos, reverse=True)[:limite]
+        return [self.datos[pid] for pid in mejores], len(candidatos)
+
+
+_estado = {'indice': None, 'version': None, 'verificado': 0.0}
+_lock = threading.Lock()
+
+
+def obtener_indice():
+    """Devuelve el índice del worker, reconstruyéndolo si cambió la versión del catálogo."""
+    ahora = time.monotonic()
+    if _estado['indice'] is not None and ahora - _estado['verificado'] < VERIFICAR_CADA:
+        return _estado['indice']
+
+    version = obtener_version('productos')
+    if _estado['indice'] is None or version != _estado['version']:
+        with _lock:
+            if _estado['indice'] is None or version != _estado['version']:
+                _estado['indice'] = IndiceSugerencias.construir()
+                _estado['version'] = version
+    _estado['verificado'] = ahora
+    return _estado['indice']
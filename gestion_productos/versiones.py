@@ -0,0 +1,61 @@
+"""
+Contadores de versión guardados en la caché compartida.
+
+Cada vez que cambia algo del catálogo se incrementa la versión correspondiente;
+los índices y fragmentos cacheados comparan su versión contra esta para saber
+si quedaron viejos. Como vive en la caché compartida, todos los workers de
+gunicorn ven el mismo número.
+
+Un contador puede desaparecer (caché reiniciada o expulsión por tamaño). Para que
+no vuelva a un número ya usado, y con eso a fragmentos viejos que sigan en la
+caché, cada contador nuevo arranca en el reloj actual en milisegundos.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+PREFIJO = 'version'
+
+
+def _clave(nombre):
+    return f"{PREFIJO}:{nombre}"
+
+
+def _inicial():
+    return time.time_ns() // 1_000_000
+
+
+def obtener_version(nombre):
+    version = cache.get(_clave(nombre))
+    if version is None:
+        # add() no pisa el valor si otro worker lo creó al mismo tiempo
+        inicial = _inicial()
+        cache.add(_clave(nombre), inicial, None)
+        version = cache.get(_clave(nombre), inicial)
+    return version
+
+
+def obtener_versiones(*nombres):
+    """Varias versiones en una sola lectura; las que no existen se crean como en obtener_version()."""
+    claves = [_clave(nombre) for nombre in nombres]
+    valores = cache.get_many(claves)
+    return [valores[clave] if clave in valores else obtener_version(nombre) for nombre, clave in zip(nombres, claves)]
+
+
+def incrementar_version(nombre):
+    try:
+        return cache.incr(_clave(nombre))
+    except ValueError:
+        # La clave no existía (caché vacía o expulsada)
+        inicial = _inicial()
+        cache.set(_clave(nombre), inicial, None)
+        return inicial
+
+
+def invalidar_al_confirmar(*nombres):
+    """Incrementa las versiones recién cuando la transacción actual se confirma."""
+    def _incrementar():
+        for nombre in nombres:
+            incrementar_version(nombre)
+    transaction.on_commit(_incrementar)
@@ -1,10 +1,15 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.forms import inlineformset_factory
 from gestion_productos.forms import ProductoCargaForm, GaleriaFormSet
-from django.db.models import Q, Min, Max
+from django.db.models import F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.db import transaction
-from django.core.paginator import Paginator
 from .models import Producto, Categoria, Marca, HistorialPrecio, Favorito
+from .search import ProductSearch
+from .paginacion import paginar
+from .cargador import cargar_productos
+from .cache_paginas import pagina_de_catalogo
+from .facetas import DIETAS, POSICION_DIETA, Facetas, foto_de
 import json
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
@@ -12,36 +17,31 @@ from django.contrib import messages
 from .forms import ProductoCargaForm, GaleriaFormSet, StockFormSet, PrecioFormSet
 from gestion_sucursales.models import Stock, Sucursal
 
+@pagina_de_catalogo
 def home(request):
     query = request.GET.get('q')
     orden = request.GET.get('orden', 'relevantes')
     
-    # Usamos prefetch_related para optimizar la carga de precios
+    # El precio vigente vive desnormalizado en Producto, no hace falta prefetch de 'precios'
     # FILTRO: Solo productos activos de categorías activas
-    lista_completa = Producto.objects.filter(esta_activo=True, categoria__activa=True).prefetch_related('precios')
+    lista_completa = Producto.objects.filter(esta_activo=True, categoria__activa=True).select_related('marca')
 
     if query:
-        lista_completa = lista_completa.filter(
-            Q(nombre__icontains=query) | 
-            Q(sku__icontains=query) |
-            Q(descripcion_breve__icontains=query)
-        )
+        # El buscador ya devuelve el resultado ordenado por relevancia
+        lista_completa = ProductSearch(lista_completa).buscar(query)
 
     # Ordenamiento en Home (Igual que en categorías para que no falle)
     if orden in ['menor_precio', 'mayor_precio']:
-        lista_completa = lista_completa.annotate(
-            precio_val=Min('precios__precio_venta', filter=Q(precios__es_actual=True))
-        )
+        lista_completa = lista_completa.annotate(precio_val=F('precio_venta_actual'))
         if orden == 'menor_precio':
             lista_completa = lista_completa.order_by('precio_val')
         else:
             lista_completa = lista_completa.order_by('-precio_val')
-    else:
+    elif not query:
         lista_completa = lista_completa.order_by('-id')
 
-    paginator = Paginator(lista_completa, 12) 
-    page_number = request.GET.get('page')
-    productos_paginados = paginator.get_page(page_number)
+    # Paginación por cursor: cualquier página cuesta lo mismo que la primera
+    productos_paginados = cargar_productos(request, paginar(request, lista_completa))
 
     return render(request, 'home.html', {
         'productos': productos_paginados,
@@ -51,92 +51,78 @@ def home(request):
 
 # --- FUNCIONES DE CATEGORÍA ---
 
-def obtener_descendientes_ids(categoria):
-    """Función recursiva para obtener todas las IDs de las subcategorías"""
-    ids = [categoria.id]
-    for hija in categoria.subcategorias.all(): 
-        ids.extend(obtener_descendientes_ids(hija))
-    return ids
+def _parse_localized_float(val, default):
+    """Convierte a float con seguridad, manejando posibles comas por localización."""
+    if not val:
+        return default
+    try:
+        # Reemplazamos coma por punto por si llega localizado
+        return float(str(val).replace(',', '.'))
+    except (ValueError, TypeError):
+        return default
 
-def lista_productos_categoria(request, slug):
-    # FILTRO: Solo permitimos ver categorías activas
-    categoria_actual = get_object_or_404(Categoria, slug=slug, activa=True)
-    
-    # 1. Jerarquía completa (Bolsa inicial de productos activos)
-    familias_ids = obtener_descendientes_ids(categoria_actual)
-    productos_filtrados = Producto.objects.filter(
-        categoria_id__in=familias_ids, 
-        esta_activo=True
-    ).select_related('marca')
 
-    # 2. Captura de parámetros de la URL
+def _listado_con_facetas(request, productos_filtrados, clave_facetas, subcategorias_menu=None):
+    """
+    Filtros, facetas, orden y paginación comunes a categoría, ofertas y ahorrames.
+    Retorna el contexto que espera lista_productos.html.
+    """
+    # 1. Captura de parámetros de la URL
     marcas_sel = request.GET.getlist('marca')
     subs_sel = request.GET.getlist('subcategoria')
+    dietas_sel = [d for d in request.GET.getlist('dieta') if d in POSICION_DIETA]
     orden = request.GET.get('orden', 'relevantes')
 
-    # 3. FILTRADO POR SUBCATEGORÍA (Primero para limpiar las marcas)
+    # 2. Foto de la bolsa base (una consulta, cacheada por versión del catálogo)
+    facetas_base = foto_de(productos_filtrados, clave_facetas)
+
+    # 3. FILTRADO POR SUBCATEGORÍA (incluye toda su descendencia)
+    rutas_sel = []
     if subs_sel:
-        categorias_filtradas = Categoria.objects.filter(slug__in=subs_sel)
-        ids_finales = []
-        for cat in categorias_filtradas:
-            ids_finales.extend(obtener_descendientes_ids(cat))
+        categorias_filtradas = list(Categoria.objects.filter(slug__in=subs_sel))
+        rutas_sel = [c.ruta for c in categorias_filtradas]
+        ids_finales = Categoria.descendientes_ids_de(categorias_filtradas)
         productos_filtrados = productos_filtrados.filter(categoria_id__in=ids_finales)
 
-    # 4. MARCAS DISPONIBLES (Se calculan basándose en los productos filtrados por subcategoría)
-    # Esto asegura que si estás en "Aderezos", solo veas marcas de aderezos.
-    marcas_disponibles = productos_filtrados.values_list('marca__nombre', flat=True).distinct().order_by('marca__nombre')
-
-    # 5. FILTRADO POR MARCA (Se aplica después de obtener las marcas disponibles)
+    # 4. FILTRADO POR MARCA Y DIETA
     if marcas_sel:
         productos_filtrados = productos_filtrados.filter(marca__nombre__in=marcas_sel)
-    
-    # --- LÓGICA DE PRECIOS (NUEVO) ---
-    # 1. Anotamos el precio actual CORRECTO antes de filtrar
-    productos_filtrados = productos_filtrados.annotate(
-        precio_val=Min('precios__precio_venta', filter=Q(precios__es_actual=True))
-    )
+    for clave, campo, _ in DIETAS:
+        if clave in dietas_sel:
+            productos_filtrados = productos_filtrados.filter(**{campo: True})
 
-    # 2. Calculamos los límites extremos para el Slider (basado en lo filtrado hasta ahora)
-    # Usamos aggregate para obtener el min y max global de esta selección
-    rangos = productos_filtrados.aggregate(
-        min_global=Min('precio_val'), 
-        max_global=Max('precio_val') 
-    )
-    
-    min_limit = rangos['min_global'] or 0
-    max_limit = rangos['max_global'] or 1000000 # Default alto si no hay productos
+    facetas = Facetas(facetas_base, marcas=marcas_sel, rutas=rutas_sel, dietas=dietas_sel)
 
-    # 3. Capturamos lo que el usuario eligió en el slider
-    sel_min_raw = request.GET.get('min_price')
-    sel_max_raw = request.GET.get('max_price')
+    # --- LÓGICA DE PRECIOS ---
+    # 1. Anotamos el precio actual (columna desnormalizada, sin JOIN a precios)
+    productos_filtrados = productos_filtrados.annotate(precio_val=F('precio_venta_actual'))
 
-    # Convertimos a float/decimal con seguridad, manejando posibles comas por localización
-    def parse_localized_float(val, default):
-        if not val:
-            return default
-        try:
-            # Reemplazamos coma por punto por si llega localizado
-            return float(str(val).replace(',', '.'))
-        except (ValueError, TypeError):
-            return default
+    # 2. Límites extremos para el Slider (salen de la foto, sin aggregate)
+    min_global, max_global = facetas.limites_precio()
+    min_limit = min_global or 0
+    max_limit = max_global or 1000000 # Default alto si no hay productos
 
-    sel_min = parse_localized_float(sel_min_raw, min_limit)
-    sel_max = parse_localized_float(sel_max_raw, max_limit)
+    # 3. Capturamos lo que el usuario eligió en el slider
+    sel_min = _parse_localized_float(request.GET.get('min_price'), min_limit)
+    sel_max = _parse_localized_float(request.GET.get('max_price'), max_limit)
 
-    # 4. Aplicamos el filtro de Rango de precios
-    # Solo filtramos si los valors elegidos son distintos a los límites (optimización)
-    # Pero para consistencia visual, filtramos siempre que sea válido dentro del rango
+    # 4. Aplicamos el filtro de Rango de precios solo si es más angosto que los límites
     if sel_min > min_limit or sel_max < max_limit:
-         productos_filtrados = productos_filtrados.filter(
-             precio_val__gte=sel_min, 
-             precio_val__lte=sel_max
-         )
+        productos_filtrados = productos_filtrados.filter(
+            precio_val__gte=sel_min,
+            precio_val__lte=sel_max
+        )
+        facetas.aplicar_rango(sel_min, sel_max)
 
-    # 6. Menú lateral (Hijas directas de la categoría actual, SOLO ACTIVAS)
-    subcategorias_menu = categoria_actual.subcategorias.filter(activa=True)
+    # 5. Menú lateral con la cantidad de productos de cada opción
+    if subcategorias_menu is None:
+        # Categorías que tienen productos en la bolsa base
+        subcategorias_menu = Categoria.objects.filter(pk__in=facetas.categorias_ids(), activa=True)
+    subcategorias_menu = list(subcategorias_menu)
+    for sub, cantidad in facetas.subcategorias(subcategorias_menu):
+        sub.cantidad = cantidad
 
-    # 7. ORDENAMIENTO (Mantenemos tu lógica corregida)
-    # NOTA: Ya anotamos 'precio_val' arriba, así que reutilizamos eso
+    # 6. ORDENAMIENTO
     if orden == 'menor_precio':
         productos_filtrados = productos_filtrados.order_by('precio_val')
     elif orden == 'mayor_precio':
@@ -144,19 +130,18 @@ def lista_productos_categoria(request, slug):
     else:
         productos_filtrados = productos_filtrados.order_by('-id')
 
-    # 8. PAGINACIÓN
-    paginator = Paginator(productos_filtrados, 12) 
-    page_number = request.GET.get('page')
-    productos_paginados = paginator.get_page(page_number)
-    
-    context = {
-        'categoria': categoria_actual,
-        'titulo_pagina': categoria_actual.nombre,
+    # 7. PAGINACIÓN (el total ya lo conocen las facetas)
+    productos_paginados = cargar_productos(request, paginar(request, productos_filtrados, total=facetas.total))
+
+    return {
         'productos': productos_paginados,
-        'marcas_disponibles': marcas_disponibles,
+        'marcas_disponibles': facetas.marcas(),
         'subcategorias_disponibles': subcategorias_menu,
+        'dietas_disponibles': facetas.dietas(),
+        'histograma_precios': facetas.histograma(),
         'marcas_sel': marcas_sel,
         'subs_sel': subs_sel,
+        'dietas_sel': dietas_sel,
         'orden_actual': orden,
         # Variables Slider
         'min_limit': min_limit,
@@ -164,8 +149,34 @@ def lista_productos_categoria(request, slug):
         'sel_min': sel_min,
         'sel_max': sel_max,
     }
+
+
+@pagina_de_catalogo
+def lista_productos_categoria(request, slug):
+    # FILTRO: Solo permitimos ver categorías activas
+    categoria_actual = get_object_or_404(Categoria, slug=slug, activa=True)
+    
+    # 1. Jerarquía completa (Bolsa inicial de productos activos)
+    # descendientes_ids() es un subquery sobre la ruta materializada, no recursión
+    familias_ids = categoria_actual.descendientes_ids()
+    productos_filtrados = Producto.objects.filter(
+        categoria_id__in=familias_ids, 
+        esta_activo=True
+    ).select_related('marca')
+
+    # 2. Menú lateral (Hijas directas de la categoría actual, SOLO ACTIVAS)
+    subcategorias_menu = categoria_actual.subcategorias.filter(activa=True)
+
+    context = _listado_con_facetas(
+        request, productos_filtrados, f"categoria:{categoria_actual.pk}", subcategorias_menu
+    )
+    context.update({
+        'categoria': categoria_actual,
+        'titulo_pagina': categoria_actual.nombre,
+    })
     return render(request, 'lista_productos.html', context)
 
+@pagina_de_catalogo
 def lista_ofertas(request):
     """Vista para mostrar todos los productos en oferta con filtros"""
     # 1. Bolsa inicial de productos (Solo ofertas activas)
@@ -175,94 +186,15 @@ def lista_ofertas(request):
         categoria__activa=True
     ).select_related('marca', 'categoria')
 
-    # 2. Captura de parámetros de la URL
-    marcas_sel = request.GET.getlist('marca')
-    subs_sel = request.GET.getlist('subcategoria')
-    orden = request.GET.get('orden', 'relevantes')
-
-    # 3. FILTRADO POR CATEGORÍA (En ofertas usamos las categorías como filtros)
-    if subs_sel:
-        # En el caso de ofertas, 'subcategoria' filtra por categorías que contienen estas ofertas
-        # Usamos slugs de categorías de primer o segundo nivel
-        categorias_filtradas = Categoria.objects.filter(slug__in=subs_sel)
-        ids_finales = []
-        for cat in categorias_filtradas:
-            ids_finales.extend(obtener_descendientes_ids(cat))
-        productos_filtrados = productos_filtrados.filter(categoria_id__in=ids_finales)
-
-    # 4. MARCAS DISPONIBLES (Basadas en los productos en oferta)
-    marcas_disponibles = productos_filtrados.values_list('marca__nombre', flat=True).distinct().order_by('marca__nombre')
-
-    # 5. FILTRADO POR MARCA
-    if marcas_sel:
-        productos_filtrados = productos_filtrados.filter(marca__nombre__in=marcas_sel)
-    
-    # --- LÓGICA DE PRECIOS ---
-    productos_filtrados = productos_filtrados.annotate(
-        precio_val=Min('precios__precio_venta', filter=Q(precios__es_actual=True))
-    )
-
-    rangos = productos_filtrados.aggregate(
-        min_global=Min('precio_val'), 
-        max_global=Max('precio_val') 
-    )
-    
-    min_limit = rangos['min_global'] or 0
-    max_limit = rangos['max_global'] or 1000000
-
-    sel_min_raw = request.GET.get('min_price')
-    sel_max_raw = request.GET.get('max_price')
-
-    def parse_localized_float(val, default):
-        if not val: return default
-        try: return float(str(val).replace(',', '.'))
-        except (ValueError, TypeError): return default
-
-    sel_min = parse_localized_float(sel_min_raw, min_limit)
-    sel_max = parse_localized_float(sel_max_raw, max_limit)
-
-    if sel_min > min_limit or sel_max < max_limit:
-         productos_filtrados = productos_filtrados.filter(
-             precio_val__gte=sel_min, 
-             precio_val__lte=sel_max
-         )
-
-    # 6. Menú lateral (Categorías que tienen ofertas para filtrar)
-    # Mostramos las categorías padre que tienen productos en oferta
-    ids_cat_ofertas = Producto.objects.filter(es_oferta=True).values_list('categoria_id', flat=True).distinct()
-    # Obtenemos las categorías raíz que contienen estas ofertas (o las categorías directas si preferis)
-    # Por simplicidad, mostramos categorías "Padre" activas que tienen ofertas en su descendencia
-    subcategorias_menu = Categoria.objects.filter(pk__in=ids_cat_ofertas, activa=True)
-
-    # 7. ORDENAMIENTO
-    if orden == 'menor_precio':
-        productos_filtrados = productos_filtrados.order_by('precio_val')
-    elif orden == 'mayor_precio':
-        productos_filtrados = productos_filtrados.order_by('-precio_val')
-    else:
-        productos_filtrados = productos_filtrados.order_by('-id')
-
-    # 8. PAGINACIÓN
-    paginator = Paginator(productos_filtrados, 12) 
-    page_number = request.GET.get('page')
-    productos_paginados = paginator.get_page(page_number)
-    
-    context = {
+    # 2. En ofertas el menú lateral son las categorías que tienen ofertas
+    context = _listado_con_facetas(request, productos_filtrados, 'ofertas')
+    context.update({
         'titulo_pagina': 'Ofertas Imperdibles',
         'es_ofertas_page': True, # Bandera para el template
-        'productos': productos_paginados,
-        'marcas_disponibles': marcas_disponibles,
-        'subcategorias_disponibles': subcategorias_menu,
-        'marcas_sel': marcas_sel,
-        'subs_sel': subs_sel,
-        'orden_actual': orden,
-        'min_limit': min_limit,
-        'max_limit': max_limit,
-        'sel_min': sel_min,
-        'sel_max': sel_max,
-    }
+    })
     return render(request, 'lista_productos.html', context)
 
+@pagina_de_catalogo
 def lista_ahorrames(request):
     """Vista para mostrar los productos del especial Ahorrames"""
     # 1. Bolsa inicial de productos (Solo ahorrames activos)
@@ -272,91 +204,19 @@ def lista_ahorrames(request):
         categoria__activa=True
     ).select_related('marca', 'categoria')
 
-    # 2. Captura de parámetros de la URL
-    marcas_sel = request.GET.getlist('marca')
-    subs_sel = request.GET.getlist('subcategoria')
-    orden = request.GET.get('orden', 'relevantes')
-
-    # 3. FILTRADO POR CATEGORÍA
-    if subs_sel:
-        categorias_filtradas = Categoria.objects.filter(slug__in=subs_sel)
-        ids_finales = []
-        for cat in categorias_filtradas:
-            ids_finales.extend(obtener_descendientes_ids(cat))
-        productos_filtrados = productos_filtrados.filter(categoria_id__in=ids_finales)
-
-    # 4. MARCAS DISPONIBLES
-    marcas_disponibles = productos_filtrados.values_list('marca__nombre', flat=True).distinct().order_by('marca__nombre')
-
-    # 5. FILTRADO POR MARCA
-    if marcas_sel:
-        productos_filtrados = productos_filtrados.filter(marca__nombre__in=marcas_sel)
-    
-    # --- LÓGICA DE PRECIOS ---
-    productos_filtrados = productos_filtrados.annotate(
-        precio_val=Min('precios__precio_venta', filter=Q(precios__es_actual=True))
-    )
-
-    rangos = productos_filtrados.aggregate(
-        min_global=Min('precio_val'), 
-        max_global=Max('precio_val') 
-    )
-    
-    min_limit = rangos['min_global'] or 0
-    max_limit = rangos['max_global'] or 1000000
-
-    sel_min_raw = request.GET.get('min_price')
-    sel_max_raw = request.GET.get('max_price')
-
-    def parse_localized_float(val, default):
-        if not val: return default
-        try: return float(str(val).replace(',', '.'))
-        except (ValueError, TypeError): return default
-
-    sel_min = parse_localized_float(sel_min_raw, min_limit)
-    sel_max = parse_localized_float(sel_max_raw, max_limit)
-
-    if sel_min > min_limit or sel_max < max_limit:
-         productos_filtrados = productos_filtrados.filter(
-             precio_val__gte=sel_min, 
-             precio_val__lte=sel_max
-         )
-
-    # 6. Menú lateral (Categorías que tienen ahorrames para filtrar)
-    ids_cat_ahorrames = Producto.objects.filter(ahorrames=True).values_list('categoria_id', flat=True).distinct()
-    subcategorias_menu = Categoria.objects.filter(pk__in=ids_cat_ahorrames, activa=True)
-
-    # 7. ORDENAMIENTO
-    if orden == 'menor_precio':
-        productos_filtrados = productos_filtrados.order_by('precio_val')
-    elif orden == 'mayor_precio':
-        productos_filtrados = productos_filtrados.order_by('-precio_val')
-    else:
-        productos_filtrados = productos_filtrados.order_by('-id')
-
-    # 8. PAGINACIÓN
-    paginator = Paginator(productos_filtrados, 12) 
-    page_number = request.GET.get('page')
-    productos_paginados = paginator.get_page(page_number)
-    
-    context = {
+    # 2. Menú lateral: categorías que tienen productos ahorrames
+    context = _listado_con_facetas(request, productos_filtrados, 'ahorrames')
+    context.update({
         'titulo_pagina': 'Especial Ahorrames',
         'es_ofertas_page': True,
-        'productos': productos_paginados,
-        'marcas_disponibles': marcas_disponibles,
-        'subcategorias_disponibles': subcategorias_menu,
-        'marcas_sel': marcas_sel,
-        'subs_sel': subs_sel,
-        'orden_actual': orden,
-        'min_limit': min_limit,
-        'max_limit': max_limit,
-        'sel_min': sel_min,
-        'sel_max': sel_max,
-    }
+    })
     return render(request, 'lista_productos.html', context)
 
+@pagina_de_catalogo
 def detalle_producto(request, slug):
-    producto = get_object_or_404(Producto, slug=slug)
+    producto = get_object_or_404(Producto.objects.select_related('categoria', 'marca'), slug=slug)
+    # Galería y ancestros de la categoría los resuelve el cargador del request (una consulta cada uno)
+    cargar_productos(request, [producto])
     es_favorito = False
     if request.user.is_authenticated:
         es_favorito = Favorito.objects.filter(usuario=request.user, producto=producto).exists()
@@ -474,12 +334,10 @@ def buscar_categorias_marcas_ajax(request):
 
     elif tipo == 'categoria':
         # Búsqueda de Categorías con jerarquía
-        # Ojo: __str__ es costoso si iteramos muchos, pero limitamos a 20.
-        cats = Categoria.objects.filter(nombre__icontains=q)[:20]
-        for c in cats:
-            # Construimos la ruta completa "Abuelo > Padre > Hijo"
-            full_path = str(c) 
-            results.append({'id': c.id, 'text': full_path})
+        cats = list(Categoria.objects.filter(nombre__icontains=q)[:20])
+        # Construimos las rutas completas "Abuelo > Padre > Hijo" con un solo query de ancestros
+        rutas = Categoria.rutas_completas(cats)
+        results = [{'id': c.id, 'text': rutas[c.id]} for c in cats]
 
     return JsonResponse({'results': results})
 
@@ -501,15 +359,14 @@ def toggle_favorito(request, producto_id):
 
 @login_required
 def lista_favoritos(request):
-    favoritos_list = Favorito.objects.filter(usuario=request.user).select_related('producto', 'producto__marca')
+    favoritos_list = Favorito.objects.filter(usuario=request.user).select_related('producto', 'producto__marca').order_by('-id')
     
-    paginator = Paginator(favoritos_list, 12)
-    page_number = request.GET.get('page')
-    favoritos_paginados = paginator.get_page(page_number)
+    favoritos_paginados = paginar(request, favoritos_list, contar='exacto')
+    cargar_productos(request, [f.producto for f in favoritos_paginados])
     
     return render(request, 'favoritos.html', {
         'productos': favoritos_paginados, # Usamos 'productos' para que paginacion.html funcione directamente
-        'cantidad_total': favoritos_list.count()
+        'cantidad_total': favoritos_paginados.paginator.count
     })
 
 @login_required
@@ -522,45 +379,71 @@ def vaciar_favoritos(request):
 
 # --- CRUD DE PRODUCTOS (GESTIÓN) ---
 
-@login_required
-def buscar_productos_gestion_ajax(request):
+# Columnas ordenables de la grilla de gestión: clave en la URL -> campo del queryset
+ORDENES_GESTION = {
+    'nombre': 'nombre',
+    'categoria': 'categoria_nombre',
+    'stock': 'stock_local',
+    'precio': 'precio_venta_actual',
+    'id': 'id',
+}
+COLUMNAS_GESTION = [
+    ('PRODUCTO', 'nombre', 'ps-4'),
+    ('CATEGORÍA', 'categoria', ''),
+    ('STOCK LOCAL', 'stock', 'text-center'),
+    ('PRECIO', 'precio', ''),
+    ('ACCIONES', None, 'text-center'),
+]
+POR_PAGINA_GESTION = 25
+
+
+def productos_gestion(sucursal=None, query='', orden=''):
     """
-    Buscador para la tabla de Gestión de Productos en el Dashboard.
-    Retorna una tabla HTML (fragmento) con los resultados.
+    Una sola consulta para la grilla de gestión: categoría, precio vigente (desnormalizado
+    en Producto) y stock de la sucursal del usuario como subconsulta (0 si no hay registro).
     """
-    query = request.GET.get('q', '').strip()
-    
-    productos = Producto.objects.all().prefetch_related('precios').order_by('-id')
+    productos = Producto.objects.select_related('categoria').annotate(categoria_nombre=F('categoria__nombre'))
+    if sucursal:
+        stock = Stock.objects.filter(sucursal=sucursal, producto=OuterRef('pk')).values('cantidad')[:1]
+        productos = productos.annotate(stock_local=Coalesce(Subquery(stock), 0))
+    else:
+        productos = productos.annotate(stock_local=Value(None, output_field=IntegerField()))
 
     if query:
-        # Reemplazamos vocales en la query por un patrón que busque con/sin tilde si la DB no es inteligente
-        # Pero Django con icontains suele manejarlo bien en muchas configuraciones.
-        # Refuerzo: Si la DB no es PostgreSQL con unaccent, podemos usar regex o simplemente confiar en icontains
-        # que suele ser suficiente para el usuario en entornos estándar.
-        productos = productos.filter(
-            Q(nombre__icontains=query) | 
-            Q(sku__icontains=query) |
-            Q(codigo_barras__icontains=query) |
-            Q(categoria__nombre__icontains=query) |
-            Q(marca__nombre__icontains=query)
-        )
+        # El buscador ya ignora tildes y cubre nombre, SKU, código de barras, categoría y marca
+        productos = ProductSearch(productos).buscar(query)
 
-    # Limitamos a 20 para velocidad, ya que es gestión rápida
-    productos = productos[:20]
+    campo = ORDENES_GESTION.get(orden.lstrip('-'))
+    if campo and not (campo == 'stock_local' and not sucursal):
+        return productos.order_by(f"-{campo}" if orden.startswith('-') else campo)
+    # Sin orden elegido: relevancia si hay búsqueda, los más nuevos primero si no
+    return productos if query else productos.order_by('-id')
 
-    # Mapear stock local para la sucursal del usuario
-    user = request.user
-    if user.is_authenticated and user.sucursal:
-        stocks = Stock.objects.filter(sucursal=user.sucursal, producto__in=productos)
-        stock_map = {s.producto_id: s.cantidad for s in stocks}
-        for p in productos:
-            p.stock_local = stock_map.get(p.id, 0)
-    else:
-        for p in productos:
-            p.stock_local = None
 
-    return render(request, 'gestion_productos/tabla_gestion_fragment.html', {
-        'productos_gestion': productos
+@login_required
+def buscar_productos_gestion_ajax(request):
+    """
+    Grilla de Gestión de Productos del Dashboard (se pide por AJAX al abrir la pestaña).
+    Retorna la tabla HTML (fragmento) paginada por cursor y ordenable por columna.
+    """
+    query = request.GET.get('q', '').strip()
+    orden = request.GET.get('orden', '')
+    productos = productos_gestion(request.user.sucursal, query, orden)
+
+    columnas = []
+    for titulo, clave, clase in COLUMNAS_GESTION:
+        actual = clave and orden.lstrip('-') == clave
+        columnas.append({
+            'titulo': titulo,
+            'clase': clase,
+            # Un clic ordena ascendente; el segundo sobre la misma columna, descendente
+            'orden': None if not clave else (f"-{clave}" if actual and not orden.startswith('-') else clave),
+            'direccion': ('desc' if orden.startswith('-') else 'asc') if actual else None,
+        })
+
+    return render(request, 'gestion_productos/grilla_gestion.html', {
+        'productos_gestion': paginar(request, productos, por_pagina=POR_PAGINA_GESTION),
+        'columnas': columnas,
     })
 
 
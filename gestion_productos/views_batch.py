@@ -8,9 +8,12 @@ from django.utils.decorators import method_decorator
 from django.db import transaction
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from django.conf import settings
-from .models import Producto, Categoria, Marca, HistorialPrecio
-from .forms_batch import UploadBatchForm, ProductoBatchForm
+from .models import Producto, Categoria, HistorialPrecio
+from .forms_batch import UploadBatchForm, ProductoBatchForm, ImportarCatalogoForm
+from .importacion import ImportacionError, importar_catalogo, reporte_errores_csv
+from .sku import reservar_skus
+from .imagenes import descartar, guardar_temporales, procesar_imagenes
+from .marcas import DetectorMarcas
 from django.forms import formset_factory
 
 @method_decorator(staff_member_required, name='dispatch')
@@ -35,20 +38,14 @@ class CargaMasivaView(View):
             tipo_envase_global = form.cleaned_data['tipo_envase']
             files = form.cleaned_data['imagenes']
             
-            # Asegurar que el directorio temporal existe en el sistema de archivos local
-            # si estamos usando FileSystemStorage (que es lo común por defecto)
-            temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp_batch')
-            if not os.path.exists(temp_dir):
-                os.makedirs(temp_dir, exist_ok=True)
+            # 1. Guardar temporalmente: por trozos y varios archivos a la vez (ver imagenes.py)
+            paths = guardar_temporales(files)
 
+            # 2. Parsear nombres: las marcas se leen una sola vez para toda la carga
+            detector = DetectorMarcas.desde_base()
             initial_data = []
-            for f in files:
-                # 1. Guardar temporalmente
-                temp_name = f"temp_batch/{uuid.uuid4()}_{f.name}"
-                path = default_storage.save(temp_name, ContentFile(f.read()))
-                
-                # 2. Parsear nombre
-                parsed_data = self.parse_filename(f.name)
+            for f, path in zip(files, paths):
+                parsed_data = self.parse_filename(f.name, detector)
                 parsed_data['temp_image_path'] = path
                 parsed_data['categoria'] = categoria_id
                 parsed_data['tipo_envase'] = tipo_envase_global
@@ -65,7 +62,7 @@ class CargaMasivaView(View):
         
         return render(request, self.template_step1, {'form': form})
 
-    def parse_filename(self, filename):
+    def parse_filename(self, filename, detector=None):
         # 1. Limpieza básica: quitar extensión y reemplazar guiones por espacios
         name_only = os.path.splitext(filename)[0].replace('_', ' ').replace('-', ' ')
         # Quitar puntos al final si existen (ej: ml.)
@@ -127,17 +124,9 @@ class CargaMasivaView(View):
             name_vibe = " ".join(parts[:idx_num]).title()
             data['nombre'] = name_vibe
         
-        # 3. Búsqueda de Marca (en todo el nombre)
-        # Esto es más lento pero más seguro
-        marcas = Marca.objects.all()
-        found_marca = None
-        for m in marcas:
-            if m.nombre.lower() in name_only.lower():
-                found_marca = m
-                break
-        
-        if found_marca:
-            data['marca'] = found_marca.id
+        # 3. Búsqueda de Marca (en todo el nombre): la más larga, por palabras completas (ver marcas.py)
+        detector = detector or DetectorMarcas.desde_base()
+        data['marca'] = detector.buscar(name_only)
         
         full_name = f"{data['nombre']} {data['contenido_neto']}{data['unidad_medida']}".strip()
         data['nombre'] = full_name
@@ -173,16 +162,36 @@ class CargaMasivaView(View):
 
         if formset.is_valid():
             created_count = 0
-            temp_files_to_delete = []  # Colectamos paths para borrar DESPUÉS del atomic
-            
+
+            # 1. Imágenes ANTES de la transacción: variantes WebP en paralelo y subida concurrente
+            # al storage (ver imagenes.py). La transacción queda solo con las escrituras a la base.
+            campo_imagen = Producto._meta.get_field('imagen_principal')
+            temporales = {}
+            for i, form in enumerate(formset):
+                temp_path = form.cleaned_data.get('temp_image_path')
+                if temp_path:
+                    # Quitamos el prefijo uuid (formato: uuid_nombre.jpg)
+                    parts = os.path.basename(temp_path).split('_')
+                    original_filename = "_".join(parts[1:]) if len(parts) > 1 else parts[0]
+                    temporales[i] = (temp_path, campo_imagen.generate_filename(None, original_filename))
+            imagenes = {}
+
             try:
+                # Si falla a mitad de las subidas, procesar_imagenes ya borró lo que había subido
+                imagenes = procesar_imagenes(
+                    {i: temp for i, (temp, _) in temporales.items()},
+                    {i: final for i, (_, final) in temporales.items()},
+                )
+
                 with transaction.atomic():
-                    for form in formset:
+                    # Todos los SKUs de la carga en una sola consulta
+                    skus = iter(reservar_skus(len(formset.forms)))
+                    for i, form in enumerate(formset):
                         data = form.cleaned_data
-                        temp_path = data.get('temp_image_path')
-                        
-                        # Instanciar el producto (todavía no guardamos)
+
+                        # Instanciar el producto con la imagen ya subida
                         producto = Producto(
+                            sku=next(skus),
                             nombre=data['nombre'],
                             marca=data['marca'],
                             categoria=categoria,
@@ -193,24 +202,13 @@ class CargaMasivaView(View):
                             peso_kg=data.get('peso_kg', 0.0),
                             esta_activo=True
                         )
-                        
-                        # Mover imagen si existe antes del save final
-                        if temp_path and default_storage.exists(temp_path):
-                            filename = os.path.basename(temp_path)
-                            # Quitamos el prefijo uuid (formato: uuid_nombre.jpg)
-                            parts = filename.split('_')
-                            original_filename = "_".join(parts[1:]) if len(parts) > 1 else filename
-                            final_name = f"{original_filename}" # Django añade productos/fotos/ por el upload_to
-                            
-                            with default_storage.open(temp_path) as f:
-                                producto.imagen_principal.save(final_name, ContentFile(f.read()), save=False)
-                            
-                            # Marcar para borrar DESPUÉS del commit exitoso
-                            temp_files_to_delete.append(temp_path)
-                        
-                        # Ahora sí guardamos el producto (crea Slug/SKU)
+                        if i in imagenes:
+                            producto.imagen_principal.name = imagenes[i]['imagen']
+                            producto.imagen_variantes = imagenes[i]['variantes']
+
+                        # Ahora sí guardamos el producto (crea Slug)
                         producto.save()
-                        
+
                         # Crear historial de precio
                         HistorialPrecio.objects.create(
                             producto=producto,
@@ -218,19 +216,20 @@ class CargaMasivaView(View):
                             es_actual=True
                         )
                         created_count += 1
-                
+
                 # ÉXITO: Ahora sí borramos los archivos temporales
                 # (fuera del atomic, después del commit)
-                for temp_path in temp_files_to_delete:
+                for temp_path, _ in temporales.values():
                     try:
-                        if default_storage.exists(temp_path):
-                            default_storage.delete(temp_path)
+                        default_storage.delete(temp_path)
                     except Exception:
                         pass  # Ignoramos errores de limpieza
-                
+
                 messages.success(request, f"Se cargaron con éxito {created_count} productos.")
                 return redirect('admin:gestion_productos_producto_changelist')
             except Exception as e:
+                # Nada quedó en la base: las imágenes subidas no las usa nadie
+                descartar(imagenes)
                 messages.error(request, f"Error al procesar la carga: {str(e)}")
         else:
             messages.error(request, "Hay errores en la grilla de productos.")
@@ -241,3 +240,45 @@ class CargaMasivaView(View):
             })
         
         return redirect('admin:gestion_productos_producto_changelist')
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ImportarCatalogoView(View):
+    """Importación de catálogo desde CSV/XLSX (ver importacion.py) con reporte de filas con error."""
+    template_name = 'admin/gestion_productos/importar_catalogo.html'
+
+    def get(self, request):
+        return render(request, self.template_name, {
+            'form': ImportarCatalogoForm(),
+            'title': 'Importar Catálogo'
+        })
+
+    def post(self, request):
+        form = ImportarCatalogoForm(request.POST, request.FILES)
+        contexto = {'form': form, 'title': 'Importar Catálogo'}
+        if form.is_valid():
+            archivo = form.cleaned_data['archivo']
+            try:
+                resumen = importar_catalogo(archivo, archivo.name, usuario=request.user)
+            except ImportacionError as e:
+                messages.error(request, str(e))
+                return render(request, self.template_name, contexto)
+
+            messages.success(
+                request,
+                f"Importación terminada: {resumen['creados']} productos creados y {resumen['actualizados']} actualizados."
+            )
+            if resumen['errores']:
+                # El reporte queda en el storage para descargarlo (CSV: fila, sku, error)
+                ruta = default_storage.save(
+                    f"importaciones/errores_{uuid.uuid4().hex}.csv",
+                    ContentFile(reporte_errores_csv(resumen['errores']).encode('utf-8'))
+                )
+                messages.warning(request, f"{len(resumen['errores'])} filas no se importaron.")
+                contexto.update({
+                    'errores': resumen['errores'][:50],
+                    'total_errores': len(resumen['errores']),
+                    'reporte_url': default_storage.url(ruta),
+                })
+            contexto['resumen'] = resumen
+        return render(request, self.template_name, contexto)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class GestionSucursalesConfig(AppConfig):
     name = 'gestion_sucursales'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registra los receivers)
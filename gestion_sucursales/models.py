@@ -1,5 +1,7 @@
 from django.db import models, transaction  # Importamos transaction para la seguridad
+from django.db.models import F
 from django.conf import settings
+from django.core.exceptions import ValidationError
 
 class Sucursal(models.Model):
     nombre = models.CharField(max_length=100, verbose_name="Nombre de la sucursal")
@@ -44,6 +46,26 @@ class Stock(models.Model):
     def __str__(self):
         return f"{self.producto.nombre} en {self.sucursal.nombre}: {self.cantidad}"
 
+    @classmethod
+    def ajustar(cls, producto_id, sucursal_id, delta):
+        """
+        Suma `delta` al saldo con un único UPDATE atómico (cantidad = cantidad + delta).
+        Las salidas solo se aplican si alcanza (WHERE cantidad >= n), así dos ventas
+        simultáneas nunca dejan el saldo negativo ni pisan la actualización de la otra.
+        Retorna False si no había stock suficiente.
+        """
+        filas = cls.objects.filter(producto_id=producto_id, sucursal_id=sucursal_id)
+        if delta < 0:
+            return filas.filter(cantidad__gte=-delta).update(cantidad=F('cantidad') + delta) == 1
+        if filas.update(cantidad=F('cantidad') + delta) == 0:
+            # Primera entrada del producto en la sucursal
+            _, creado = cls.objects.get_or_create(
+                producto_id=producto_id, sucursal_id=sucursal_id, defaults={'cantidad': delta}
+            )
+            if not creado:
+                filas.update(cantidad=F('cantidad') + delta)
+        return True
+
 
 class MovimientoStock(models.Model):
     TIPOS = [
@@ -67,35 +89,35 @@ class MovimientoStock(models.Model):
         verbose_name_plural = "Movimientos de Stock"
         ordering = ['-fecha']
 
+    @staticmethod
+    def cantidad_con_signo(tipo, cantidad):
+        # Salidas y Ajustes siempre restan (negativos)
+        if tipo in ['SAL', 'AJU', 'WEB']:
+            return -abs(cantidad)
+        # Entradas siempre suman (positivos)
+        if tipo == 'ENT':
+            return abs(cantidad)
+        # Transferencias: se respeta el signo recibido
+        return cantidad
+
     def save(self, *args, **kwargs):
         # Usamos transaction.atomic para asegurar que el movimiento y el stock se actualicen juntos
         with transaction.atomic():
             # Solo ejecutamos la lógica de actualización de stock si el registro es NUEVO
             if not self.pk:
                 # 1. Asegurar el signo correcto de la cantidad según el tipo de movimiento
-                # Salidas y Ajustes siempre restan (negativos)
-                if self.tipo in ['SAL', 'AJU', 'WEB']:
-                    self.cantidad = -abs(self.cantidad)
-                # Entradas siempre suman (positivos)
-                elif self.tipo == 'ENT':
-                    self.cantidad = abs(self.cantidad)
-
-                # 2. Buscar o crear el registro de stock para ese producto y sucursal
-                stock_reg, created = Stock.objects.get_or_create(
-                    producto=self.producto, 
-                    sucursal=self.sucursal
-                )
-
-                # 3. Actualizar la cantidad en la tabla Stock
-                stock_reg.cantidad += self.cantidad
-                
-                # Opcional: ELIMINADO para evitar enmascarar errores. La validación debe ser previa.
-                # if stock_reg.cantidad < 0:
-                #    stock_reg.cantidad = 0
-                    
-                stock_reg.save()
+                self.cantidad = self.cantidad_con_signo(self.tipo, self.cantidad)
+
+                # 2. Actualizar el saldo con un UPDATE condicional (sin leer y volver a escribir)
+                if not Stock.ajustar(self.producto_id, self.sucursal_id, self.cantidad):
+                    actual = Stock.objects.filter(
+                        producto_id=self.producto_id, sucursal_id=self.sucursal_id
+                    ).values_list('cantidad', flat=True).first() or 0
+                    raise ValidationError(
+                        f"Stock insuficiente para {self.producto.nombre}. Actual: {actual}, Solicitado: {abs(self.cantidad)}"
+                    )
             
-            # 4. Guardar el registro del movimiento (esto se ejecuta siempre para crear o editar)
+            # 3. Guardar el registro del movimiento (esto se ejecuta siempre para crear o editar)
             super().save(*args, **kwargs)
 
     def __str__(self):
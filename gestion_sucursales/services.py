@@ -1,5 +1,9 @@
+from collections import defaultdict
+
 from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
 from django.core.exceptions import ValidationError
+from gestion_productos.models import Producto
 from .models import Stock, MovimientoStock
 
 def validar_stock(producto, cantidad, sucursal):
@@ -14,46 +18,90 @@ def validar_stock(producto, cantidad, sucursal):
         # Si no existe registro de stock, asumimos 0
         return False
 
-def procesar_movimiento_stock(producto, sucursal, cantidad, tipo, usuario, observaciones=""):
+
+class StockInsuficiente(ValidationError):
+    """Una o más líneas no tenían stock. `resultados` trae el detalle de todas."""
+
+    def __init__(self, resultados):
+        self.resultados = resultados
+        faltantes = [r for r in resultados if not r['ok']]
+        super().__init__([
+            f"Stock insuficiente para {r['producto'].nombre}. Actual: {r['disponible']}, Solicitado: {r['cantidad']}"
+            for r in faltantes
+        ])
+
+
+def procesar_movimientos_bulk(sucursal, lineas, tipo, usuario, observaciones=""):
     """
-    Crea el movimiento de stock y actualiza el saldo.
-    Maneja la lógica de validación estricta para no romper el PositiveIntegerField.
+    Único punto de entrada para mover stock desde pedidos, caja, transferencias y
+    recepciones: la cantidad de consultas no depende de la cantidad de líneas.
+
+    `lineas` es una lista de (producto o producto_id, cantidad); si un producto se
+    repite, se suman. Pasos:
+    1. Bloquea (en PostgreSQL) los Stock involucrados en orden de producto, para que
+       dos pedidos concurrentes tomen las filas en el mismo orden y no se traben.
+    2. Crea en 0 los registros que faltan para las entradas.
+    3. Aplica todas las líneas con un único UPDATE condicional:
+       cantidad = cantidad + CASE ... WHERE cantidad >= CASE ... (lo que sale de cada una).
+       Si alguna fila no se actualizó, no alcanzaba: se deshace todo y se lanza
+       StockInsuficiente con todas las faltantes, no solo la primera.
+    4. Registra los movimientos con bulk_create.
+
+    Retorna la lista de MovimientoStock creados.
     """
+    deltas = defaultdict(int)
+    for producto, cantidad in lineas:
+        deltas[getattr(producto, 'pk', producto)] += MovimientoStock.cantidad_con_signo(tipo, int(cantidad))
+    deltas = {pid: delta for pid, delta in deltas.items() if delta}
+    if not deltas:
+        return []
+
     with transaction.atomic():
-        # Verificamos de nuevo dentro de la transacción por seguridad (concurrencia)
-        # Bloqueamos la fila del Stock para evitar condiciones de carrera (select_for_update)
-        # Nota: select_for_update puede no tener efecto en SQLite como se espera en Postgres,
-        # pero es buena práctica dejarlo listo.
-        
-        # Primero aseguramos que existe el registro de Stock
-        stock_item, created = Stock.objects.get_or_create(producto=producto, sucursal=sucursal)
-        
-        # Si necesitamos bloquear, lo haríamos aquí:
-        # stock_item = Stock.objects.select_for_update().get(pk=stock_item.pk)
-
-        # Calculamos el impacto según el tipo (replicando la lógica del modelo original por seguridad
-        # o confiando en que el modelo lo hace. Vamos a dejar que el modelo haga el cálculo de signo
-        # pero validamos aquí antes de guardar).
-        
-        cantidad_real = 0
-        if tipo in ['SAL', 'AJU', 'WEB']:
-            cantidad_real = -abs(cantidad)
-        elif tipo == 'ENT':
-            cantidad_real = abs(cantidad)
-            
-        # Validación Preventiva (Evitar Crash de PositiveIntegerField)
-        nuevo_saldo = stock_item.cantidad + cantidad_real
-        if nuevo_saldo < 0:
-            raise ValidationError(f"Stock insuficiente para {producto.nombre}. Actual: {stock_item.cantidad}, Solicitado: {abs(cantidad_real)}")
-
-        # Creamos el movimiento. El save() del modelo MovimientoStock actualizará el Stock.
-        # PERO, como vamos a quitar la lógica "safety" del modelo que pone a 0 si es negativo,
-        # esta validación de arriba es la que nos protege.
-        MovimientoStock.objects.create(
-            producto=producto,
-            sucursal=sucursal,
-            cantidad=cantidad, # Pasamos el absoluto o lo que venga, el modelo maneja el signo según 'tipo'
-            tipo=tipo,
-            usuario=usuario,
-            observaciones=observaciones
-        )
+        # 1. Filas bloqueadas en orden de producto: {producto_id: (pk, saldo)}
+        filas = Stock.objects.select_for_update().filter(sucursal=sucursal, producto_id__in=deltas).order_by('producto_id')
+        saldos = {pid: (pk, cantidad) for pid, pk, cantidad in filas.values_list('producto_id', 'pk', 'cantidad')}
+
+        # 2. Las entradas pueden ser la primera vez que el producto llega a la sucursal
+        nuevos = [pid for pid, delta in deltas.items() if pid not in saldos and delta > 0]
+        if nuevos:
+            Stock.objects.bulk_create(
+                [Stock(producto_id=pid, sucursal=sucursal, cantidad=0) for pid in nuevos], ignore_conflicts=True
+            )
+            saldos = {pid: (pk, cantidad) for pid, pk, cantidad in filas.values_list('producto_id', 'pk', 'cantidad')}
+
+        # 3. Un solo UPDATE relativo y condicional para todos los saldos
+        def por_fila(valores):
+            return Case(
+                *[When(pk=saldos[pid][0], then=Value(valor)) for pid, valor in valores.items() if pid in saldos],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+
+        aplicadas = Stock.objects.filter(
+            pk__in=[pk for pk, _ in saldos.values()],
+            cantidad__gte=por_fila({pid: max(-delta, 0) for pid, delta in deltas.items()}),
+        ).update(cantidad=F('cantidad') + por_fila(deltas))
+
+        if aplicadas < len(deltas):
+            # Alguna no alcanzaba: la excepción deshace las que sí se aplicaron
+            productos = Producto.objects.in_bulk(list(deltas))
+            resultados = []
+            for pid, delta in sorted(deltas.items()):
+                disponible = saldos[pid][1] if pid in saldos else 0
+                ok = disponible >= -delta
+                resultados.append({
+                    'producto': productos[pid],
+                    'cantidad': abs(delta),
+                    'ok': ok,
+                    'disponible': None if ok else disponible,
+                })
+            raise StockInsuficiente(resultados)
+
+        # 4. Movimientos (bulk_create no pasa por save(), así que no vuelve a tocar el saldo)
+        return MovimientoStock.objects.bulk_create([
+            MovimientoStock(
+                producto_id=pid, sucursal=sucursal, cantidad=delta, tipo=tipo,
+                usuario=usuario, observaciones=observaciones,
+            )
+            for pid, delta in sorted(deltas.items())
+        ])
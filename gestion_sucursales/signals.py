@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from gestion_productos.versiones import invalidar_al_confirmar
+from .models import Sucursal
+
+
+@receiver([post_save, post_delete], sender=Sucursal)
+def invalidar_navegacion_sucursales(sender, **kwargs):
+    """La lista de sucursales cacheada para todas las páginas (gestion_productos/navegacion.py)."""
+    invalidar_al_confirmar('sucursales')
@@ -1,3 +1,126 @@
-from django.test import TestCase
+import threading
+import unittest
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import connection, close_old_connections
+from django.test import TestCase, TransactionTestCase
+
+from gestion_productos.models import Categoria, Marca, Producto
+from .models import Sucursal, Stock, MovimientoStock
+from .services import StockInsuficiente, procesar_movimientos_bulk
+
+
+def crear_productos(cantidad):
+    categoria = Categoria.objects.create(nombre="Almacén")
+    marca = Marca.objects.create(nombre="Natura")
+    return [
+        Producto.objects.create(nombre=f"Producto {i}", categoria=categoria, marca=marca,
+                                descripcion_breve="x", imagen_principal='productos/fotos/x.jpg')
+        for i in range(cantidad)
+    ]
+
+
+class MovimientoStockTests(TestCase):
+    """El alta suelta de un movimiento (admin) descuenta con un UPDATE condicional."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sucursal = Sucursal.objects.create(nombre="Centro", direccion="Calle 1", ciudad="Córdoba")
+        cls.producto = crear_productos(1)[0]
+        Stock.objects.create(producto=cls.producto, sucursal=cls.sucursal, cantidad=2)
+
+    def test_movimiento_sin_stock_no_queda_negativo(self):
+        with self.assertRaises(ValidationError):
+            MovimientoStock.objects.create(producto=self.producto, sucursal=self.sucursal, cantidad=5, tipo='WEB')
+        self.assertEqual(Stock.objects.get(producto=self.producto, sucursal=self.sucursal).cantidad, 2)
+
+    def test_entrada_crea_el_registro_de_stock(self):
+        otra = Sucursal.objects.create(nombre="Norte", direccion="Calle 2", ciudad="Córdoba")
+        MovimientoStock.objects.create(producto=self.producto, sucursal=otra, cantidad=7, tipo='ENT')
+        self.assertEqual(Stock.objects.get(producto=self.producto, sucursal=otra).cantidad, 7)
+
+
+class ProcesarMovimientosBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sucursal = Sucursal.objects.create(nombre="Centro", direccion="Calle 1", ciudad="Córdoba")
+        cls.productos = crear_productos(60)
+        Stock.objects.bulk_create([Stock(producto=p, sucursal=cls.sucursal, cantidad=5) for p in cls.productos])
+
+    def test_consultas_constantes(self):
+        # select_for_update + UPDATE condicional único + bulk_create (+ savepoint del atomic)
+        with self.assertNumQueries(5):
+            movimientos = procesar_movimientos_bulk(self.sucursal, [(p, 2) for p in self.productos], 'WEB', None)
+        self.assertEqual(len(movimientos), 60)
+        self.assertEqual(set(Stock.objects.values_list('cantidad', flat=True)), {3})
+        self.assertEqual(set(MovimientoStock.objects.values_list('cantidad', flat=True)), {-2})
+
+    def test_informa_todas_las_faltantes(self):
+        a, b, c = self.productos[:3]
+        with self.assertRaises(StockInsuficiente) as error:
+            procesar_movimientos_bulk(self.sucursal, [(a, 6), (b.pk, 1), (c, 3), (c, 3)], 'SAL', None)
+        faltantes = {r['producto'].pk: r['disponible'] for r in error.exception.resultados if not r['ok']}
+        self.assertEqual(faltantes, {a.pk: 5, c.pk: 5})
+        self.assertEqual(Stock.objects.get(producto=b, sucursal=self.sucursal).cantidad, 5)
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_entrada_en_sucursal_nueva(self):
+        otra = Sucursal.objects.create(nombre="Norte", direccion="Calle 2", ciudad="Córdoba")
+        procesar_movimientos_bulk(otra, [(p, 4) for p in self.productos[:10]], 'ENT', None)
+        self.assertEqual(list(Stock.objects.filter(sucursal=otra).values_list('cantidad', flat=True).distinct()), [4])
+
+    def test_sin_registro_de_stock_cuenta_como_cero(self):
+        otra = Sucursal.objects.create(nombre="Norte", direccion="Calle 2", ciudad="Córdoba")
+        a, b = self.productos[:2]
+        Stock.objects.create(producto=a, sucursal=otra, cantidad=3)
+        with self.assertRaises(StockInsuficiente) as error:
+            procesar_movimientos_bulk(otra, [(a, 1), (b, 1)], 'WEB', None)
+        self.assertEqual([r['ok'] for r in error.exception.resultados], [True, False])
+        self.assertEqual(Stock.objects.get(producto=a, sucursal=otra).cantidad, 3)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Necesita bloqueos de fila reales (PostgreSQL)")
+class MovimientosBulkConcurrenciaTests(TransactionTestCase):
+    """Muchos hilos compitiendo por el mismo stock: nunca negativo, nunca una venta perdida."""
+
+    HILOS = 16
+    INTENTOS = 10
+
+    def test_ventas_concurrentes(self):
+        sucursal = Sucursal.objects.create(nombre="Centro", direccion="Calle 1", ciudad="Córdoba")
+        productos = crear_productos(3)
+        for p in productos:
+            Stock.objects.create(producto=p, sucursal=sucursal, cantidad=100)
+
+        vendidas = []
+        barrera = threading.Barrier(self.HILOS)
+
+        def vender(indice):
+            barrera.wait()
+            try:
+                for intento in range(self.INTENTOS):
+                    # Cada pedido pide los productos en distinto orden para provocar deadlocks si los hubiera
+                    lineas = [(p, 1 + (indice + intento) % 3) for p in productos]
+                    if indice % 2:
+                        lineas.reverse()
+                    try:
+                        procesar_movimientos_bulk(sucursal, lineas, 'WEB', None)
+                        vendidas.append(lineas)
+                    except StockInsuficiente:
+                        pass
+            finally:
+                close_old_connections()
+
+        hilos = [threading.Thread(target=vender, args=(i,)) for i in range(self.HILOS)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertTrue(vendidas)
+        for p in productos:
+            vendido = sum(c for lineas in vendidas for prod, c in lineas if prod.pk == p.pk)
+            saldo = Stock.objects.get(producto=p, sucursal=sucursal).cantidad
+            self.assertGreaterEqual(saldo, 0)
+            self.assertEqual(saldo, 100 - vendido)
+            self.assertEqual(-sum(MovimientoStock.objects.filter(producto=p).values_list('cantidad', flat=True)), vendido)
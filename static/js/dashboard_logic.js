@@ -3,6 +3,8 @@ let timerGeneral;
 let tipoActual = '';
 let selectedSucursalId = null;
 let selectedSucursalNombre = null;
+// Grilla de productos: búsqueda y orden actuales (la página viaja en el cursor)
+const estadoGrilla = { q: '', orden: '', cargada: false };
 
 document.addEventListener("DOMContentLoaded", function () {
     // Helper para normalizar texto (quitar tildes y a minúsculas)
@@ -36,6 +38,28 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     });
 
+    // 3b. Grilla de productos: se pide al abrir la pestaña; orden y páginas por delegación
+    const triggerTabProductos = document.getElementById('pills-productos-tab');
+    if (triggerTabProductos) {
+        triggerTabProductos.addEventListener('shown.bs.tab', function () {
+            if (!estadoGrilla.cargada) cargarGrillaProductos();
+        });
+    }
+    const grillaProductos = document.getElementById('grilla-productos');
+    if (grillaProductos) {
+        grillaProductos.addEventListener('click', function (e) {
+            const columna = e.target.closest('[data-orden]');
+            const pagina = e.target.closest('[data-pagina]');
+            if (columna) {
+                e.preventDefault();
+                estadoGrilla.orden = columna.dataset.orden;
+                cargarGrillaProductos();
+            } else if (pagina) {
+                cargarGrillaProductos(pagina.dataset.pagina);
+            }
+        });
+    }
+
     // 4. Activar pestaña por URL o errores
     const urlParams = new URLSearchParams(window.location.search);
     const tieneErrores = document.querySelector('#formNuevoProductoCompleto .text-danger');
@@ -112,22 +136,33 @@ function ejecutarBusquedaTransf(query) {
 }
 
 function ejecutarBusquedaGestionProductos(query) {
-    const contenedor = document.getElementById('cuerpo-tabla-gestion');
+    estadoGrilla.q = query.trim();
+    clearTimeout(timerGeneral);
+    timerGeneral = setTimeout(() => cargarGrillaProductos(), 300);
+}
+
+function cargarGrillaProductos(consulta) {
+    const contenedor = document.getElementById('grilla-productos');
     if (!contenedor) {
-        console.warn("No se encontró el contenedor 'cuerpo-tabla-gestion'");
+        console.warn("No se encontró el contenedor 'grilla-productos'");
         return;
     }
 
-    clearTimeout(timerGeneral);
-    timerGeneral = setTimeout(() => {
-        console.log("Buscando productos:", query);
-        fetch(`/gestion-productos/buscar-gestion-ajax/?q=${encodeURIComponent(query)}`)
-            .then(res => res.text())
-            .then(html => {
-                contenedor.innerHTML = html;
-            })
-            .catch(err => console.error("Error búsqueda gestión:", err));
-    }, 300);
+    // Sin consulta armada (links de página), volvemos a la primera con la búsqueda y el orden actuales
+    if (!consulta) {
+        const parametros = new URLSearchParams();
+        if (estadoGrilla.q) parametros.set('q', estadoGrilla.q);
+        if (estadoGrilla.orden) parametros.set('orden', estadoGrilla.orden);
+        consulta = `?${parametros.toString()}`;
+    }
+
+    estadoGrilla.cargada = true;
+    fetch(contenedor.dataset.url + consulta)
+        .then(res => res.text())
+        .then(html => {
+            contenedor.innerHTML = html;
+        })
+        .catch(err => console.error("Error grilla de productos:", err));
 }
 
 // --- MODALES Y ACCIONES RÁPIDAS ---
@@ -1,48 +1,67 @@
+from decimal import Decimal
+
+from gestion_productos.fichas import ficha_de, fichas_de
+
+
 class TicketMostrador:
+    """
+    Ticket de la venta de mostrador. La sesión guarda solo {id: cantidad}; nombre,
+    sku y precio salen de las fichas cacheadas (gestion_productos/fichas.py), así
+    que cada "+1" escribe unos pocos bytes y no lee el producto de la base.
+    """
+
     def __init__(self, request):
         self.session = request.session
-        ticket = self.session.get("ticket_mostrador")
-        if not ticket:
-            ticket = self.session["ticket_mostrador"] = {}
-        self.ticket = ticket
+        ticket = self.session.get("ticket_mostrador") or {}
+        if any(isinstance(v, dict) for v in ticket.values()):
+            # Sesiones con el formato anterior (una ficha completa por línea)
+            ticket = {k: v["cantidad"] for k, v in ticket.items()}
+        self.cantidades = ticket
+
+    @property
+    def ticket(self):
+        """Líneas completas {id: {producto_id, nombre, sku, precio, cantidad, acumulado}}."""
+        if not hasattr(self, "_ticket"):
+            fichas = fichas_de(self.cantidades)
+            self._ticket = {}
+            for p_id, cantidad in self.cantidades.items():
+                ficha = fichas.get(int(p_id))
+                if ficha is None:
+                    continue
+                precio = Decimal(ficha["precio"])
+                self._ticket[p_id] = {
+                    "producto_id": ficha["producto_id"],
+                    "nombre": ficha["nombre"],
+                    "sku": ficha["sku"],
+                    "precio": precio,
+                    "cantidad": cantidad,
+                    "acumulado": precio * cantidad,
+                }
+        return self._ticket
 
     def agregar(self, producto):
-        p_id = str(producto.id)
-        # Buscamos el precio actual
-        precio_obj = producto.precios.filter(es_actual=True).first()
-        precio = float(precio_obj.precio_venta) if precio_obj else 0.0
-
-        if p_id not in self.ticket:
-            self.ticket[p_id] = {
-                "producto_id": producto.id,
-                "nombre": str(producto.nombre),
-                "sku": str(producto.sku),
-                "precio": precio,
-                "cantidad": 1,
-                "acumulado": precio
-            }
-        else:
-            self.ticket[p_id]["cantidad"] += 1
-            self.ticket[p_id]["acumulado"] = self.ticket[p_id]["cantidad"] * precio
+        p_id = str(getattr(producto, "pk", producto))
+        if p_id not in self.cantidades and ficha_de(p_id) is None:
+            return
+        self.cantidades[p_id] = self.cantidades.get(p_id, 0) + 1
         self.guardar()
 
     def restar(self, producto_id):
         p_id = str(producto_id)
-        if p_id in self.ticket:
-            self.ticket[p_id]["cantidad"] -= 1
-            if self.ticket[p_id]["cantidad"] <= 0:
-                del self.ticket[p_id]
-            else:
-                self.ticket[p_id]["acumulado"] = self.ticket[p_id]["cantidad"] * self.ticket[p_id]["precio"]
+        if p_id in self.cantidades:
+            self.cantidades[p_id] -= 1
+            if self.cantidades[p_id] <= 0:
+                del self.cantidades[p_id]
             self.guardar()
 
     def guardar(self):
-        self.session["ticket_mostrador"] = self.ticket
+        self.__dict__.pop("_ticket", None)
+        self.session["ticket_mostrador"] = self.cantidades
         self.session.modified = True
 
     def limpiar(self):
-        self.session["ticket_mostrador"] = {}
-        self.session.modified = True
+        self.cantidades = {}
+        self.guardar()
 
     def get_total(self):
-        return sum(item["acumulado"] for item in self.ticket.values())
\ No newline at end of file
+        return sum((item["acumulado"] for item in self.ticket.values()), Decimal(0))
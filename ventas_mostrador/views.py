@@ -1,15 +1,16 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from django.db.models import Q, Prefetch
 from django.contrib.auth.decorators import login_required, user_passes_test
-from gestion_productos.models import Producto
+from gestion_productos.typeahead import obtener_indice
+from gestion_productos.fichas import ficha_de
 from gestion_pedidos.models import Pedido, ItemPedido
+from gestion_pedidos.services import crear_pedido, faltantes_de_stock, lineas_de_stock, productos_de
 from .ticket import TicketMostrador  # IMPORTANTE: Usamos nuestra propia lógica
 from django.contrib import messages
 from django.db import transaction
-from gestion_sucursales.services import validar_stock, procesar_movimiento_stock
+from gestion_sucursales.services import procesar_movimientos_bulk
 from django.core.exceptions import ValidationError
-from gestion_sucursales.models import Stock
 
 def es_vendedor(user):
     return user.is_authenticated and hasattr(user, 'rol') and user.rol in ['SA', 'AS', 'VE']
@@ -45,45 +46,22 @@ def buscar_productos_ajax(request):
     if len(query) < 2:
         return JsonResponse({'productos': [], 'total': 0})
 
-    # 1. Primero obtenemos el conjunto de resultados completo (Solo activos)
-    queryset = Producto.objects.filter(
-        Q(sku__icontains=query) |
-        Q(nombre__icontains=query),
-        esta_activo=True,
-        categoria__activa=True
-    ).select_related('categoria', 'marca').prefetch_related('precios').distinct()
+    # Se responde desde el índice en memoria (gestion_productos/typeahead.py), sin consultas por tecla.
+    # Devuelve los primeros 4 para las mini cards y el número total de coincidencias.
+    productos, total_encontrados = obtener_indice().buscar(query, limite=4)
 
-    # 2. Contamos cuántos hay en total (antes de limitar a 4)
-    total_encontrados = queryset.count()
-
-    # 3. Ahora sí, tomamos solo los primeros 4 para las mini cards
-    productos = queryset[:4]
-
-    data = []
-    for p in productos:
-        precio_venta = p.precio_actual() 
-        data.append({
-            'id': p.id,
-            'sku': p.sku,
-            'nombre': p.nombre,
-            'precio': str(precio_venta),
-            'slug': p.slug,
-            'marca': p.marca.nombre if p.marca else "",
-            'categoria': p.categoria.nombre if p.categoria else "General",
-            'imagen_url': p.imagen_principal.url if p.imagen_principal else '/static/img/no-product.png'
-        })
-
-    # Enviamos tanto la lista de 4 productos como el número total
     return JsonResponse({
-        'productos': data, 
+        'productos': productos, 
         'total': total_encontrados
     })
 
 @login_required
 def agregar_ajax(request, producto_id):
+    # La ficha cacheada alcanza para validar el producto (sin leerlo de la base)
+    if ficha_de(producto_id) is None:
+        raise Http404("Producto no encontrado")
     ticket = TicketMostrador(request)
-    producto = get_object_or_404(Producto, id=producto_id)
-    ticket.agregar(producto)
+    ticket.agregar(producto_id)
     return JsonResponse({'status': 'ok'})
 
 @login_required
@@ -110,22 +88,10 @@ def confirmar_preventa(request):
 
     try:
         with transaction.atomic():
-            # 2. VALIDACIÓN DE STOCK MEJORADA (Acumulativa)
-            errores_stock = []
-            for key, item in ticket_items.items():
-                prod = Producto.objects.get(id=item['producto_id'])
-                if not validar_stock(prod, item['cantidad'], request.user.sucursal):
-                    # Buscamos cuánto hay realmente para avisar
-                    try:
-                        stock_real = Stock.objects.get(producto=prod, sucursal=request.user.sucursal).cantidad
-                    except Stock.DoesNotExist:
-                        stock_real = 0
-                    
-                    errores_stock.append({
-                        'producto': prod,
-                        'solicitado': item['cantidad'],
-                        'disponible': stock_real
-                    })
+            # 2. VALIDACIÓN DE STOCK (Acumulativa): productos y saldos de todas las líneas en dos consultas
+            lineas = list(ticket_items.values())
+            productos = productos_de(lineas)
+            errores_stock = faltantes_de_stock(request.user.sucursal, lineas, productos)
 
             # Si encontramos errores, NO creamos el pedido. Volvemos al template mostrando los faltantes.
             if errores_stock:
@@ -136,9 +102,10 @@ def confirmar_preventa(request):
                     'errores_stock': errores_stock
                 })
 
-            # 3. CREAMOS EL PEDIDO (Cabecera)
-            # Usamos la lógica que te funcionó en el paso anterior
-            nuevo_pedido = Pedido.objects.create(
+            # 3. CREAMOS EL PEDIDO con todos sus renglones (un solo INSERT para los items)
+            nuevo_pedido, _ = crear_pedido(
+                lineas,
+                productos=productos,
                 cliente="Consumidor Final", # Puedes cambiarlo por un nombre real
                 telefono="000",
                 sucursal=request.user.sucursal, 
@@ -150,18 +117,6 @@ def confirmar_preventa(request):
                 reemplazo_opcion='No permitir reemplazos'
             )
 
-            # 3. CREAMOS LOS ITEMS (Los renglones del pedido)
-            # Recorremos el diccionario del ticket para guardar cada producto
-            for key, item in ticket_items.items():
-                ItemPedido.objects.create(
-                    pedido=nuevo_pedido,
-                    producto_nombre=item['nombre'],
-                    sku=item['sku'],
-                    cantidad=item['cantidad'],
-                    precio_unitario=item['precio'],
-                    subtotal=item['acumulado']
-                )
-
             # 4. LIMPIAMOS EL TICKET (Con paréntesis para que ejecute)
             ticket_obj.limpiar()
             messages.success(request, f"¡Pedido #{nuevo_pedido.nro_pedido} generado con éxito!")
@@ -201,31 +156,18 @@ def finalizar_pedido_caja(request, nro_pedido):
     if request.method == 'POST':
         try:
             with transaction.atomic():
-                # 1. Intentamos descontar stock de todos los items
-                for item in items:
-                    # Buscamos el producto real (el item tiene producto_nombre y sku, 
-                    # pero necesitamos el objeto Producto para el FK)
-                    # Ojo: ItemPedido no tiene FK a producto en tu modelo actual?
-                    # Veo en models.py 'producto_nombre'. Si no hay FK, buscamos por SKU o Nombre.
-                    # Asumiremos que el SKU es confiable.
-                    prod = Producto.objects.filter(sku=item.sku).first()
-                    if not prod:
-                        # Fallback por nombre si no hay SKU
-                        prod = Producto.objects.filter(nombre=item.producto_nombre).first()
-                    
-                    if prod:
-                        procesar_movimiento_stock(
-                            producto=prod,
-                            sucursal=p.sucursal,
-                            cantidad=item.cantidad,
-                            tipo='SAL',
-                            usuario=request.user,
-                            observaciones=f"Venta Mostrador #{p.nro_pedido}"
-                        )
-                    else:
-                        # Si no encontramos el producto, es un riesgo. 
-                        # Deberíamos loguearlo o frenar. Por ahora avisamos.
-                        raise ValidationError(f"No se encontró producto en DB para {item.producto_nombre}")
+                # 1. Los items guardan el producto: no hace falta buscarlo por SKU o nombre
+                # (salvo pedidos anteriores a ese vínculo, ver gestion_pedidos/services.py)
+                lineas = lineas_de_stock(items)
+
+                # Descontamos todas las líneas juntas (informa todas las faltantes)
+                procesar_movimientos_bulk(
+                    sucursal=p.sucursal,
+                    lineas=lineas,
+                    tipo='SAL',
+                    usuario=request.user,
+                    observaciones=f"Venta Mostrador #{p.nro_pedido}"
+                )
 
                 # 2. Si todo el stock se pudo descontar, cerramos la venta
                 p.forma_pago = request.POST.get('forma_pago')